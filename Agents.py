@@ -12,34 +12,221 @@ from ortools.sat.python import cp_model
 
 from loguru import logger
 from mable.cargo_bidding import Bid
-from copy import deepcopy
 from math import ceil
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from snapshots import snapshot_inputs, build_replay
 # import numpy as np
 # from collections import defaultdict
 
+# worker pool of the decomposition mode, started on the first decomposed solve and kept for the later ones
+_DECOMPOSITION_POOL = None
+
+
+def decomposition_pool(max_workers):
+    """
+    The process pool of the decomposition mode. It uses the spawn start method, so it can safely be started from
+    mable's inform thread, and it is reused, so the worker start-up is only paid once.
+    """
+    global _DECOMPOSITION_POOL
+    if _DECOMPOSITION_POOL is None or _DECOMPOSITION_POOL._max_workers != max_workers:
+        if _DECOMPOSITION_POOL is not None:
+            _DECOMPOSITION_POOL.shutdown(wait=False, cancel_futures=True)
+        _DECOMPOSITION_POOL = ProcessPoolExecutor(max_workers=max_workers,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+    return _DECOMPOSITION_POOL
+
+
+def _solve_subproblem(snapshot, time_limit, num_workers, deadline=None):
+    """
+    Worker entry of the decomposition mode. The subproblem arrives as a snapshot (see snapshots.snapshot_inputs), so
+    the worker rebuilds its trades, vessels and distances without the simulation; only the (plain) solution dict
+    and the solver spans come back.
+    The search also ends at the deadline (wall time) of the decomposed solve, so a subproblem started late does not
+    keep the pool busy into the next auction.
+    """
+    _, headquarters, sub_fleets, sub_trades, _ = build_replay(snapshot)
+    if deadline is not None:
+        time_left = deadline - time.time()
+        if time_left <= 0:
+            return None, []
+        time_limit = time_left if time_limit is None else min(time_limit, time_left)
+    solver = Solver(headquarters, time_limit=time_limit, num_workers=num_workers)
+    solution = solver.solve(sub_trades, sub_fleets)
+    return solution, solver.spans
+
+
+class IncumbentRecorder(cp_model.CpSolverSolutionCallback):
+    """
+    Records every improving incumbent of a solve into a thread-safe buffer, so the bidding layer can read the latest
+    one while the search is still running. Each record has the same fields as the solution of Solver.solve plus the
+    wall time at which it was found, which also gives the time-to-quality profile of the search.
+    """
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._incumbents = []
+        self._stop_requested = False
+        self._variables = None
+
+    def attach(self, assign, pickup_time, dropoff_time):
+        self._variables = (assign, pickup_time, dropoff_time)
+
+    def on_solution_callback(self):
+        if self._stop_requested:
+            self.StopSearch()
+            return
+        assign, pickup_time, dropoff_time = self._variables
+        incumbent = {
+            'status': 'INCUMBENT',
+            'assignments': {t: v for (t, v), var in assign.items() if self.Value(var) == 1},
+            'pickup_times': {t: self.Value(var) for t, var in pickup_time.items()},
+            'dropoff_times': {t: self.Value(var) for t, var in dropoff_time.items()},
+            'objective_value': self.ObjectiveValue(),
+            'wall_time': self.WallTime()
+        }
+        with self._lock:
+            self._incumbents.append(incumbent)
+
+    def request_stop(self):
+        self._stop_requested = True
+
+    def latest(self):
+        with self._lock:
+            if len(self._incumbents) == 0:
+                return None
+            return self._incumbents[-1]
+
+    def profile(self):
+        """
+        The time-to-quality profile as a list of (wall time, objective value).
+        """
+        with self._lock:
+            return [(incumbent['wall_time'], incumbent['objective_value']) for incumbent in self._incumbents]
+
+
 class Solver:
-    def __init__(self, headquarters):
+    def __init__(self, headquarters, time_limit=None, num_workers=None):
         self.headquarters = headquarters
+        self.time_limit = time_limit    # seconds, None means no limit
+        self.num_workers = num_workers  # CP-SAT search workers, None means the solver default
+        self.incumbents = IncumbentRecorder()
+        self._cp_solver = None
+        self._stop_event = threading.Event()
+        self._sub_solver = None
+        # (name, start, end, thread, attributes) of the model build and the search, times from time.perf_counter,
+        # for DecisionTelemetry.add_span
+        self.spans = []
+
+    def stop(self):
+        """
+        Ask a running solve (e.g. in another thread) to stop, the latest incumbent stays in self.incumbents.
+        """
+        self.incumbents.request_stop()
+        self._stop_event.set()
+        if self._cp_solver is not None:
+            self._cp_solver.StopSearch()
+        if self._sub_solver is not None:
+            self._sub_solver.stop()
+
+    def precompute(self, trades, fleets):
+        """
+        Single precomputation stage of solve. Every network distance, travel time, loading time and cost the model
+        needs is computed once into compact arrays indexed by trade t and vessel v; the model blocks only read them.
+        Unreachable routes are None; a trade whose origin does not reach its destination gets no journey and no fuel
+        cost for any vessel, so the model forbids those assignments.
+        """
+        ports = []
+        port_index = {}
+        for trade in trades:
+            for port in (trade.origin_port, trade.destination_port):
+                if port not in port_index:
+                    port_index[port] = len(ports)
+                    ports.append(port)
+        distances = [[None] * len(ports) for _ in ports]
+        for i, port_one in enumerate(ports):
+            for j, port_two in enumerate(ports):
+                distance = self.headquarters.get_network_distance(port_one, port_two)
+                if distance is not None and distance != float('inf'):
+                    distances[i][j] = distance
+
+        # travel times only depend on the vessel speed, so vessels of the same class share one matrix
+        travel_by_speed = {}
+        vessel_travel = []
+        for vessel in fleets:
+            if vessel.speed not in travel_by_speed:
+                travel_by_speed[vessel.speed] = [
+                    [None if distance is None else ceil(vessel.get_travel_time(distance)) for distance in row]
+                    for row in distances]
+            vessel_travel.append(travel_by_speed[vessel.speed])
+
+        origin = [port_index[trade.origin_port] for trade in trades]
+        destination = [port_index[trade.destination_port] for trade in trades]
+        load_time = []          # [t][v] ceil loading (= unloading) time
+        journey_duration = []   # [t][v] ceil(travel time + loading time) from origin to destination
+        fuel_cost = []          # [t][v] loading + unloading + laden travel consumption
+        start_travel = []       # [t][v] ceil travel time from the vessel location to the origin
+        start_ballast = []      # [t][v] ballast consumption from the vessel location to the origin
+        for t, trade in enumerate(trades):
+            # None for an infinite or missing origin-destination distance
+            travel_distance = distances[origin[t]][destination[t]]
+            load_time.append([])
+            journey_duration.append([])
+            fuel_cost.append([])
+            start_travel.append([])
+            start_ballast.append([])
+            for v, vessel in enumerate(fleets):
+                loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
+                load_time[t].append(ceil(loading_time))
+                if travel_distance is None or travel_distance == float('inf'):
+                    journey_duration[t].append(None)
+                    fuel_cost[t].append(None)
+                else:
+                    travel_time = vessel.get_travel_time(travel_distance)
+                    journey_duration[t].append(ceil(travel_time + loading_time))
+                    fuel_cost[t].append(vessel.get_loading_consumption(loading_time)
+                                        + vessel.get_unloading_consumption(loading_time)
+                                        + vessel.get_laden_consumption(travel_time, vessel.speed))
+                distance = self.headquarters.get_network_distance(vessel.location, trade.origin_port)
+                if distance is None or distance == float('inf'):
+                    start_travel[t].append(None)
+                    start_ballast[t].append(0)
+                else:
+                    initial_travel_time = ceil(vessel.get_travel_time(distance))
+                    start_travel[t].append(initial_travel_time)
+                    start_ballast[t].append(vessel.get_ballast_consumption(initial_travel_time, vessel.speed))
+        return {
+            'origin': origin,
+            'destination': destination,
+            'travel': vessel_travel,
+            'load_time': load_time,
+            'journey_duration': journey_duration,
+            'fuel_cost': fuel_cost,
+            'start_travel': start_travel,
+            'start_ballast': start_ballast,
+            'capacity': [{trade.cargo_type: vessel.capacity(trade.cargo_type) for trade in trades} for vessel in fleets],
+            'idle_rate': [ceil(vessel.get_idle_consumption(1)) for vessel in fleets],
+        }
 
     def solve(self, trades, fleets):
         """
         Solve the problem of scheduling the trades. Input is a list of trades and output decision variables.
         time_step is the time step of current time
         """
-        # process the trades and assign a unique id to each trade
+        build_start = time.perf_counter()
         start_time = trades[0].time
         earliest_pickup = min(trade.time_window[0] for trade in trades)
         latest_dropoff = max(trade.time_window[3] for trade in trades)
         max_time = latest_dropoff - earliest_pickup
-        trades_with_id = []
-        for i, trade in enumerate(trades):
-            trade_with_id = deepcopy(trade)
-            setattr(trade_with_id, "id", i)
-            # add travel time to the trade
-            travel_distance = self.headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-            # travel_time = fleets[0].get_travel_time(travel_distance)
-            setattr(trade_with_id, "travel_distance", travel_distance)
-            trades_with_id.append(trade_with_id)
+        data = self.precompute(trades, fleets)
+        origin = data['origin']
+        destination = data['destination']
+        load_time = data['load_time']
+        journey_duration = data['journey_duration']
+        start_travel = data['start_travel']
 
         model = cp_model.CpModel()
         # define decision variables
@@ -62,112 +249,22 @@ class Solver:
         for t in range(len(trades)):
             model.Add(sum(assign[t, v] for v in range(len(fleets))) <= 1)
 
-        # Constraint: Ensure first pickup time allows for travel from depot
-        for v, vessel in enumerate(fleets):
-            vessel_location = vessel.location  # Get the vessel's starting location
-
-            # Store the is_first booleans for the AddAtMostOne constraint later
-            is_first_trade_list_for_v = []
-
-            for t in range(len(trades)):
-                is_first_trade_for_v = model.NewBoolVar(f"is_first_{t}_for_{v}")
-                is_first_trade_list_for_v.append(is_first_trade_for_v)
-
-                # --- Calculate travel time (same as before) ---
-                trade_origin = trades_with_id[t].origin_port
-                travel_distance = self.headquarters.get_network_distance(vessel_location, trade_origin)
-                travel_time = 0 # Default
-                can_reach = True
-                if travel_distance is None or travel_distance == float('inf'):
-                    logger.warning(f"Vessel {v} cannot reach trade {t} origin {trade_origin} from {vessel_location}.")
-                    can_reach = False
-                    # If unreachable, this trade cannot be assigned to this vessel at all.
-                    model.Add(assign[t, v] == 0)
-                else:
-                    travel_time = ceil(vessel.get_travel_time(travel_distance))
-
-                    # --- Check for inherent infeasibility ---
-                    # If the earliest possible arrival is already after the latest pickup window, it's impossible.
-                    latest_pickup_time = trades_with_id[t].latest_pickup # Assuming this attribute exists
-                    if travel_time > latest_pickup_time:
-                         logger.warning(f"Vessel {v} cannot reach trade {t} ({trade_origin}) by latest pickup time {latest_pickup_time}. Travel time: {travel_time}.")
-                         # Force assign[t, v] to be false if travel time exceeds latest pickup
-                         model.Add(assign[t, v] == 0)
-                         can_reach = False # Treat as unreachable for the first trade logic
-
-                # --- Define is_first_trade_for_v ---
-
-                # Condition 1: Must be assigned to this vessel.
-                model.AddImplication(is_first_trade_for_v, assign[t, v])
-
-                # Condition 2: No other assigned trade t_prime for vessel v has pickup_time[t_prime] < pickup_time[t]
-                # Create a list of booleans, true if t_prime is earlier and assigned
-                earlier_and_assigned_conditions = []
-                for t_prime in range(len(trades)):
-                    if t == t_prime: continue
-
-                    # Aux Bool: is t_prime assigned to v?
-                    t_prime_assigned = assign[t_prime, v] # Directly use the assign variable
-
-                    # Aux Bool: is pickup_time[t_prime] < pickup_time[t]?
-                    t_prime_earlier = model.NewBoolVar(f"aux_earlier_{t_prime}_{t}_{v}")
-                    model.Add(pickup_time[t_prime] < pickup_time[t]).OnlyEnforceIf(t_prime_earlier)
-                    model.Add(pickup_time[t_prime] >= pickup_time[t]).OnlyEnforceIf(t_prime_earlier.Not())
-
-                    # Aux Bool: is t_prime assigned AND earlier?
-                    t_prime_is_earlier_and_assigned = model.NewBoolVar(f"aux_earlier_assigned_{t_prime}_{t}_{v}")
-                    model.AddBoolAnd([t_prime_assigned, t_prime_earlier]).OnlyEnforceIf(t_prime_is_earlier_and_assigned)
-                    model.AddBoolOr([t_prime_assigned.Not(), t_prime_earlier.Not()]).OnlyEnforceIf(t_prime_is_earlier_and_assigned.Not())
-
-                    earlier_and_assigned_conditions.append(t_prime_is_earlier_and_assigned)
-
-                # is_first_trade_for_v is True IFF assign[t, v] is True AND ALL earlier_and_assigned_conditions are False.
-                # Use AddBoolAnd to enforce the forward implication:
-                model.AddBoolAnd([assign[t, v]] + [b.Not() for b in earlier_and_assigned_conditions]).OnlyEnforceIf(is_first_trade_for_v)
-
-                # Explicitly enforce the backward implication (strengthen definition):
-                # If assign[t,v] is false OR ANY earlier trade IS assigned, then is_first_trade_for_v MUST be false.
-                model.AddBoolOr([assign[t, v].Not()] + earlier_and_assigned_conditions).OnlyEnforceIf(is_first_trade_for_v.Not())
-
-                # --- Add the core constraint ---
-                if can_reach: # Only add the constraint if reaching is possible
-                    # pickup_time[t] >= travel_time IF is_first_trade_for_v
-                    model.Add(pickup_time[t] >= start_time + travel_time).OnlyEnforceIf(is_first_trade_for_v)
-                # else: model.Add(is_first_trade_for_v == 0) # This is implicitly handled by assign[t,v]==0
-
-
-            # Constraint: At most one trade can be the first for vessel v
-            model.AddAtMostOne(is_first_trade_list_for_v)
-
-
         # Constraint: the pickup time must be before the dropoff time, hard constraint
         for t, trade in enumerate(trades):
             for v, vessel in enumerate(fleets):
-                loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
-                # unloading_time = loading_time
-                # travel_distance = self.headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-                travel_distance = trades_with_id[t].travel_distance
-                travel_time = vessel.get_travel_time(travel_distance)
-                journey_duration = ceil(travel_time + loading_time)
-                setattr(trades_with_id[t], "duration", journey_duration)
-                # Create an interval for the journey
-                # journey_interval = model.NewIntervalVar(
-                #     pickup_time[t],               # start
-                #     journey_duration,             # duration
-                #     pickup_time[t] + journey_duration,  # end
-                #     f'journey_{t}_{v}'            # name
-                # )
-
+                if journey_duration[t][v] is None:
+                    model.Add(assign[t, v] == 0)  # no route from origin to destination
+                    continue
                 # Add constraint that dropoff time must be after journey end
-                model.Add(pickup_time[t] + journey_duration <= dropoff_time[t]).OnlyEnforceIf(assign[t, v])
+                model.Add(pickup_time[t] + journey_duration[t][v] <= dropoff_time[t]).OnlyEnforceIf(assign[t, v])
                 model.Add(pickup_time[t] >= trade.time_window[0]).OnlyEnforceIf(assign[t, v]) # pickup time must be after the earliest pickup time
                 model.Add(pickup_time[t] <= trade.time_window[1]).OnlyEnforceIf(assign[t, v]) # pickup time must be before the latest pickup time
                 model.Add(dropoff_time[t] >= trade.time_window[2]).OnlyEnforceIf(assign[t, v]) # dropoff time must be after the earliest dropoff time
                 model.Add(dropoff_time[t] <= trade.time_window[3]).OnlyEnforceIf(assign[t, v]) # dropoff time must be before the latest dropoff time
 
-        
         # Constraint: Flexible pickup-dropoff sequencing with multiple cargoes
         for v, vessel in enumerate(fleets):
+            travel = data['travel'][v]
             for t1 in range(len(trades)):
                 for t2 in range(t1 + 1, len(trades)): # Ensure t1 != t2 and avoid duplicates
                     # Bool: Are t1 and t2 both assigned to v?
@@ -215,7 +312,7 @@ class Solver:
 
                     # For trades with the same cargo type, check total capacity
                     if cargo_type_t1 == cargo_type_t2:
-                        if vessel.capacity(cargo_type_t1) < trades[t1].amount + trades[t2].amount:
+                        if data['capacity'][v][cargo_type_t1] < trades[t1].amount + trades[t2].amount:
                             # Cannot carry both simultaneously - force sequential operation
                             # Either t1 must be dropped off before t2 is picked up,
                             # or t2 must be dropped off before t1 is picked up
@@ -235,59 +332,33 @@ class Solver:
                             model.AddImplication(both_assigned, sequential_operation)
 
                     # --- TIME CONSTRAINTS ---
-                    # Case 1: t1 picked up first
-                    load_time_t1 = ceil(vessel.get_loading_time(trades[t1].cargo_type, trades[t1].amount))
-                    dist_t1_pickup_to_t2_pickup = self.headquarters.get_network_distance(trades[t1].origin_port, trades[t2].origin_port)
-                    travel_t1_pickup_to_t2_pickup = ceil(vessel.get_travel_time(dist_t1_pickup_to_t2_pickup)) if dist_t1_pickup_to_t2_pickup is not None else float('inf')
-
-                    # Minimum time between pickups if t1 is picked up first
-                    min_pickup_separation_t1_first = load_time_t1 + travel_t1_pickup_to_t2_pickup
-
-                    # Case 2: t2 picked up first
-                    load_time_t2 = ceil(vessel.get_loading_time(trades[t2].cargo_type, trades[t2].amount))
-                    dist_t2_pickup_to_t1_pickup = self.headquarters.get_network_distance(trades[t2].origin_port, trades[t1].origin_port)
-                    travel_t2_pickup_to_t1_pickup = ceil(vessel.get_travel_time(dist_t2_pickup_to_t1_pickup)) if dist_t2_pickup_to_t1_pickup is not None else float('inf')
-
-                    # Minimum time between pickups if t2 is picked up first
-                    min_pickup_separation_t2_first = load_time_t2 + travel_t2_pickup_to_t1_pickup
-
-                    # --- DROPOFF CONSTRAINTS ---
-                    # Case 1: t1 dropped off first
-                    unload_time_t1 = ceil(vessel.get_loading_time(trades[t1].cargo_type, trades[t1].amount)) # Assuming unloading time = loading time
-                    dist_t1_dropoff_to_t2_dropoff = self.headquarters.get_network_distance(trades[t1].destination_port, trades[t2].destination_port)
-                    travel_t1_dropoff_to_t2_dropoff = ceil(vessel.get_travel_time(dist_t1_dropoff_to_t2_dropoff)) if dist_t1_dropoff_to_t2_dropoff is not None else float('inf')
-
-                    # Minimum time between dropoffs if t1 is dropped off first
-                    min_dropoff_separation_t1_first = unload_time_t1 + travel_t1_dropoff_to_t2_dropoff
-
-                    # Case 2: t2 dropped off first
-                    unload_time_t2 = ceil(vessel.get_loading_time(trades[t2].cargo_type, trades[t2].amount)) # Assuming unloading time = loading time
-                    dist_t2_dropoff_to_t1_dropoff = self.headquarters.get_network_distance(trades[t2].destination_port, trades[t1].destination_port)
-                    travel_t2_dropoff_to_t1_dropoff = ceil(vessel.get_travel_time(dist_t2_dropoff_to_t1_dropoff)) if dist_t2_dropoff_to_t1_dropoff is not None else float('inf')
-
-                    # Minimum time between dropoffs if t2 is dropped off first
-                    min_dropoff_separation_t2_first = unload_time_t2 + travel_t2_dropoff_to_t1_dropoff
+                    # Minimum time between pickups / dropoffs, None if the ports are not connected
+                    # (unloading time is assumed to be the loading time)
+                    travel_t1_pickup_to_t2_pickup = travel[origin[t1]][origin[t2]]
+                    travel_t2_pickup_to_t1_pickup = travel[origin[t2]][origin[t1]]
+                    travel_t1_dropoff_to_t2_dropoff = travel[destination[t1]][destination[t2]]
+                    travel_t2_dropoff_to_t1_dropoff = travel[destination[t2]][destination[t1]]
 
                     # --- ADD TIME CONSTRAINTS ---
                     # Pickup separation constraints
-                    if min_pickup_separation_t1_first != float('inf'):
-                        model.Add(pickup_time[t2] >= pickup_time[t1] + min_pickup_separation_t1_first).OnlyEnforceIf([both_assigned, t1_pickup_before_t2])
+                    if travel_t1_pickup_to_t2_pickup is not None:
+                        model.Add(pickup_time[t2] >= pickup_time[t1] + load_time[t1][v] + travel_t1_pickup_to_t2_pickup).OnlyEnforceIf([both_assigned, t1_pickup_before_t2])
                     else:
                         model.AddImplication(both_assigned, t1_pickup_before_t2.Not())  # Prevent impossible sequencing
 
-                    if min_pickup_separation_t2_first != float('inf'):
-                        model.Add(pickup_time[t1] >= pickup_time[t2] + min_pickup_separation_t2_first).OnlyEnforceIf([both_assigned, t2_pickup_before_t1])
+                    if travel_t2_pickup_to_t1_pickup is not None:
+                        model.Add(pickup_time[t1] >= pickup_time[t2] + load_time[t2][v] + travel_t2_pickup_to_t1_pickup).OnlyEnforceIf([both_assigned, t2_pickup_before_t1])
                     else:
                         model.AddImplication(both_assigned, t2_pickup_before_t1.Not())  # Prevent impossible sequencing
 
                     # Dropoff separation constraints
-                    if min_dropoff_separation_t1_first != float('inf'):
-                        model.Add(dropoff_time[t2] >= dropoff_time[t1] + min_dropoff_separation_t1_first).OnlyEnforceIf([both_assigned, t1_dropoff_before_t2])
+                    if travel_t1_dropoff_to_t2_dropoff is not None:
+                        model.Add(dropoff_time[t2] >= dropoff_time[t1] + load_time[t1][v] + travel_t1_dropoff_to_t2_dropoff).OnlyEnforceIf([both_assigned, t1_dropoff_before_t2])
                     else:
                         model.AddImplication(both_assigned, t1_dropoff_before_t2.Not())  # Prevent impossible sequencing
 
-                    if min_dropoff_separation_t2_first != float('inf'):
-                        model.Add(dropoff_time[t1] >= dropoff_time[t2] + min_dropoff_separation_t2_first).OnlyEnforceIf([both_assigned, t2_dropoff_before_t1])
+                    if travel_t2_dropoff_to_t1_dropoff is not None:
+                        model.Add(dropoff_time[t1] >= dropoff_time[t2] + load_time[t2][v] + travel_t2_dropoff_to_t1_dropoff).OnlyEnforceIf([both_assigned, t2_dropoff_before_t1])
                     else:
                         model.AddImplication(both_assigned, t2_dropoff_before_t1.Not())  # Prevent impossible sequencing
 
@@ -295,12 +366,10 @@ class Solver:
                     # This applies if t1 is picked up, then t2 is picked up, BEFORE t1 is dropped off.
 
                     # Bool: Is t2 picked up before t1 is dropped off?
-                    # Create this variable ONLY if both trades could potentially be assigned (avoids unnecessary vars)
                     t2_pickup_before_t1_dropoff = model.NewBoolVar(f"aux_t2_pickup_before_t1_dropoff_{v}_{t1}_{t2}")
                     model.Add(pickup_time[t2] < dropoff_time[t1]).OnlyEnforceIf(t2_pickup_before_t1_dropoff)
                     model.Add(pickup_time[t2] >= dropoff_time[t1]).OnlyEnforceIf(t2_pickup_before_t1_dropoff.Not())
 
-
                     # Combined condition: both assigned AND t1 picked up before t2 AND t2 picked up before t1 dropped off
                     pick_pick_drop_condition_t1 = model.NewBoolVar(f"pick_pick_drop_cond_t1_{v}_{t1}_{t2}")
                     model.AddBoolAnd([
@@ -315,34 +384,13 @@ class Solver:
                         t2_pickup_before_t1_dropoff.Not()
                     ]).OnlyEnforceIf(pick_pick_drop_condition_t1.Not())
 
-
-                    # Calculate the minimum time required for t1 dropoff AFTER t2 pickup starts
-                    # (loading t2 + travel from t2 origin to t1 destination)
-                    load_time_t2_for_cond = ceil(vessel.get_loading_time(trades[t2].cargo_type, trades[t2].amount))
-                    dist_t2_origin_to_t1_dest = self.headquarters.get_network_distance(trades[t2].origin_port, trades[t1].destination_port)
-                    travel_t2o_t1d = 0 # Default
-                    can_travel_t2o_t1d = True
-                    if dist_t2_origin_to_t1_dest is None or dist_t2_origin_to_t1_dest == float('inf'):
-                        can_travel_t2o_t1d = False
+                    # dropoff_time[t1] must be >= pickup_time[t2] + load_time_t2 + travel(t2_origin -> t1_dest)
+                    travel_t2o_t1d = travel[origin[t2]][destination[t1]]
+                    if travel_t2o_t1d is None:
                         # If this travel is impossible, the pick-pick-drop sequence (t1 first) cannot happen
                         model.Add(pick_pick_drop_condition_t1 == 0) # Prevent this specific sequence
                     else:
-                        travel_t2o_t1d = ceil(vessel.get_travel_time(dist_t2_origin_to_t1_dest))
-
-                    # Minimum time from t2 pickup start until t1 dropoff can FINISH
-                    # dropoff_time[t1] includes unload_time_t1.
-                    # So, pickup_time[t2] + load_time_t2 + travel_t2o_t1d gives the earliest ARRIVAL at t1_dest after loading t2.
-                    # The dropoff_time[t1] must be at least this arrival time + unload_time_t1
-                    # However, since dropoff_time[t1] is defined as the completion time, we can simplify:
-                    # dropoff_time[t1] >= pickup_time[t2] + load_time_t2 + travel_t2o_t1d
-                    min_time_from_t2pickup_to_t1dropoff_start = load_time_t2_for_cond + travel_t2o_t1d
-
-
-                    # Add the constraint: If the pick-pick-drop sequence occurs, enforce the time
-                    if can_travel_t2o_t1d:
-                        # dropoff_time[t1] must be >= pickup_time[t2] + load_time_t2 + travel(t2_origin -> t1_dest)
-                        model.Add(dropoff_time[t1] >= pickup_time[t2] + ceil(min_time_from_t2pickup_to_t1dropoff_start)).OnlyEnforceIf(pick_pick_drop_condition_t1)
-
+                        model.Add(dropoff_time[t1] >= pickup_time[t2] + load_time[t2][v] + travel_t2o_t1d).OnlyEnforceIf(pick_pick_drop_condition_t1)
 
                     # --- Symmetrical Constraint: If t2 is picked up first, then t1, before t2 is dropped ---
                     # Bool: Is t1 picked up before t2 is dropped off?
@@ -350,7 +398,6 @@ class Solver:
                     model.Add(pickup_time[t1] < dropoff_time[t2]).OnlyEnforceIf(t1_pickup_before_t2_dropoff)
                     model.Add(pickup_time[t1] >= dropoff_time[t2]).OnlyEnforceIf(t1_pickup_before_t2_dropoff.Not())
 
-
                     # Combined condition: both assigned AND t2 picked up before t1 AND t1 picked up before t2 dropped off
                     pick_pick_drop_condition_t2 = model.NewBoolVar(f"pick_pick_drop_cond_t2_{v}_{t1}_{t2}")
                     model.AddBoolAnd([
@@ -364,75 +411,56 @@ class Solver:
                         t1_pickup_before_t2_dropoff.Not()
                     ]).OnlyEnforceIf(pick_pick_drop_condition_t2.Not())
 
-                    # Calculate the minimum time required for t2 dropoff AFTER t1 pickup starts
-                    load_time_t1_for_cond = ceil(vessel.get_loading_time(trades[t1].cargo_type, trades[t1].amount))
-                    dist_t1_origin_to_t2_dest = self.headquarters.get_network_distance(trades[t1].origin_port, trades[t2].destination_port)
-                    travel_t1o_t2d = 0
-                    can_travel_t1o_t2d = True
-                    if dist_t1_origin_to_t2_dest is None or dist_t1_origin_to_t2_dest == float('inf'):
-                         can_travel_t1o_t2d = False
-                         model.Add(pick_pick_drop_condition_t2 == 0) # Prevent impossible sequence
+                    # dropoff_time[t2] must be >= pickup_time[t1] + load_time_t1 + travel(t1_origin -> t2_dest)
+                    travel_t1o_t2d = travel[origin[t1]][destination[t2]]
+                    if travel_t1o_t2d is None:
+                        model.Add(pick_pick_drop_condition_t2 == 0) # Prevent impossible sequence
                     else:
-                         travel_t1o_t2d = ceil(vessel.get_travel_time(dist_t1_origin_to_t2_dest))
-
-                    min_time_from_t1pickup_to_t2dropoff_start = load_time_t1_for_cond + travel_t1o_t2d
-
-                    # Add the symmetrical constraint
-                    if can_travel_t1o_t2d:
-                         # dropoff_time[t2] must be >= pickup_time[t1] + load_time_t1 + travel(t1_origin -> t2_dest)
-                         model.Add(dropoff_time[t2] >= pickup_time[t1] + int(min_time_from_t1pickup_to_t2dropoff_start)).OnlyEnforceIf(pick_pick_drop_condition_t2)
+                        model.Add(dropoff_time[t2] >= pickup_time[t1] + load_time[t1][v] + travel_t1o_t2d).OnlyEnforceIf(pick_pick_drop_condition_t2)
 
         # --- New Constraint: for two consecutive trades, the dropoff time of the first trade must be before the pickup time of the second trade ---
         idle_consumption_expr = []
         SCALE_FACTOR = 100.0 # Adjust this factor as needed
         for v, vessel in enumerate(fleets):
+            travel = data['travel'][v]
             # Pre-calculate vessel-specific values outside the inner loops
-            idle_consumption_rate = ceil(vessel._propelling_engine._idle_consumption)
-            scaled_idle_rate = ceil(idle_consumption_rate * SCALE_FACTOR)
+            scaled_idle_rate = ceil(data['idle_rate'][v] * SCALE_FACTOR)
             max_possible_inter_idle_cost = ceil(max_time * scaled_idle_rate) # Upper bound for inter-trade idle cost
 
             for t1 in range(len(trades)):
                 for t2 in range(len(trades)):
                     if t1 == t2:
                         continue  # Skip same trade
-                        
+
                     # Boolean: Are both trades assigned to this vessel?
                     both_assigned_seq = model.NewBoolVar(f"both_assigned_seq_{v}_{t1}_{t2}")
                     model.AddBoolAnd([assign[t1, v], assign[t2, v]]).OnlyEnforceIf(both_assigned_seq)
                     model.AddBoolOr([assign[t1, v].Not(), assign[t2, v].Not()]).OnlyEnforceIf(both_assigned_seq.Not())
-                    
+
                     # Boolean: Is t1 dropoff (arrival) before t2 pickup?
                     t1_dropoff_before_t2_pickup_seq = model.NewBoolVar(f"t1_dropoff_before_t2_pickup_seq_{v}_{t1}_{t2}")
                     model.Add(dropoff_time[t1] < pickup_time[t2]).OnlyEnforceIf(t1_dropoff_before_t2_pickup_seq)
                     model.Add(dropoff_time[t1] >= pickup_time[t2]).OnlyEnforceIf(t1_dropoff_before_t2_pickup_seq.Not())
                     model.Add(t1_dropoff_before_t2_pickup_seq == 0).OnlyEnforceIf(both_assigned_seq.Not())
-                    
-                    # Calculate required times
-                    unload_time_t1 = ceil(vessel.get_loading_time(trades[t1].cargo_type, trades[t1].amount))
-                    dist_t1_dest_to_t2_origin = self.headquarters.get_network_distance(trades[t1].destination_port, trades[t2].origin_port)
-                    
+
                     # Check if travel is possible
-                    travel_time_t1d_t2o = 0
-                    can_travel_t1d_t2o = True
-                    if dist_t1_dest_to_t2_origin is None or dist_t1_dest_to_t2_origin == float('inf'):
-                        can_travel_t1d_t2o = False
+                    travel_time_t1d_t2o = travel[destination[t1]][origin[t2]]
+                    if travel_time_t1d_t2o is None:
                         # If travel is impossible, this sequence cannot happen
                         model.AddImplication(both_assigned_seq, t1_dropoff_before_t2_pickup_seq.Not())
-                    else:
-                        travel_time_t1d_t2o = ceil(vessel.get_travel_time(dist_t1_dest_to_t2_origin))
-                    
+
                     # Combined condition for sequential operation
                     sequential_flow = model.NewBoolVar(f"sequential_flow_{v}_{t1}_{t2}")
                     model.AddBoolAnd([both_assigned_seq, t1_dropoff_before_t2_pickup_seq]).OnlyEnforceIf(sequential_flow)
                     model.AddBoolOr([both_assigned_seq.Not(), t1_dropoff_before_t2_pickup_seq.Not()]).OnlyEnforceIf(sequential_flow.Not())
-                    
+
                     # --- Inter-Trade Idle Time and Cost Calculation ---
                     inter_trade_idle_time = model.NewIntVar(0, max_time, f"inter_idle_{v}_{t1}_{t2}")
                     inter_trade_idle_cost_var = model.NewIntVar(0, max_possible_inter_idle_cost, f"inter_idle_cost_{v}_{t1}_{t2}")
 
-                    if can_travel_t1d_t2o:
+                    if travel_time_t1d_t2o is not None:
                         # Earliest time vessel can start pickup for t2 after finishing t1 dropoff, unloading, and traveling
-                        min_pickup_time_t2 = dropoff_time[t1] + unload_time_t1 + travel_time_t1d_t2o
+                        min_pickup_time_t2 = dropoff_time[t1] + load_time[t1][v] + travel_time_t1d_t2o
 
                         # Add the key constraint: pickup_time[t2] must be after the minimum required time
                         model.Add(pickup_time[t2] >= min_pickup_time_t2).OnlyEnforceIf(sequential_flow)
@@ -452,17 +480,16 @@ class Solver:
                     idle_consumption_expr.append(inter_trade_idle_cost_var)
                     # --- End Inter-Trade Idle Calculation ---
 
-
         # Constraint: capacity constraint
-        # for v, vessel in enumerate(fleets):
-        #     model.Add(sum(assign[t, v] * trade.amount for t, trade in enumerate(trades)) <= vessel.capacity)
         for v, vessel in enumerate(fleets):
             intervals = []
             demands = []
             for t, trade in enumerate(trades):
+                if journey_duration[t][v] is None:
+                    continue
                 interval = model.NewOptionalIntervalVar(
                     pickup_time[t],
-                    trades_with_id[t].duration,  # duration: loading time + travel time
+                    journey_duration[t][v],  # duration: loading time + travel time
                     dropoff_time[t],
                     assign[t, v],
                     f'interval_{t}_{v}'
@@ -473,22 +500,22 @@ class Solver:
             model.AddCumulative(intervals, demands, ceil(capacity_list[0].capacity))
 
         # Modelling the idle time and ballast time
-        # idle_consumption_expr = []
         ballast_consumption_expr = []
 
         # --- Initial Positioning and Idle/Ballast Consumption ---
-        # current_time = 0 # Assuming planning starts at time 0. Adjust if needed.
         SCALE_FACTOR = 10 # Assuming you use 10 based on the previous code for ballast
 
         for v, vessel in enumerate(fleets):
-            vessel_location = vessel.location  # Get the vessel's starting location
             is_first_trade_list_for_v = [] # For the AddAtMostOne constraint
+            scaled_idle_rate = ceil(data['idle_rate'][v] * SCALE_FACTOR)
+            # Estimate max possible initial idle cost
+            max_possible_idle_cost = ceil(max_time * scaled_idle_rate)
 
             for t in range(len(trades)):
                 is_first_trade_for_v = model.NewBoolVar(f"is_first_{t}_for_{v}")
                 is_first_trade_list_for_v.append(is_first_trade_for_v)
 
-                # --- Define is_first_trade_for_v (same logic as before) ---
+                # --- Define is_first_trade_for_v ---
                 # 1. Must be assigned to v
                 model.AddImplication(is_first_trade_for_v, assign[t, v])
                 # 2. No other assigned trade t_prime has pickup_time[t_prime] < pickup_time[t]
@@ -503,29 +530,30 @@ class Solver:
                     model.AddBoolAnd([t_prime_assigned, t_prime_earlier]).OnlyEnforceIf(t_prime_is_earlier_and_assigned)
                     model.AddBoolOr([t_prime_assigned.Not(), t_prime_earlier.Not()]).OnlyEnforceIf(t_prime_is_earlier_and_assigned.Not())
                     earlier_and_assigned_conditions.append(t_prime_is_earlier_and_assigned)
+                # is_first_trade_for_v is True IFF assign[t, v] is True AND ALL earlier_and_assigned_conditions are False.
                 model.AddBoolAnd([assign[t, v]] + [b.Not() for b in earlier_and_assigned_conditions]).OnlyEnforceIf(is_first_trade_for_v)
                 model.AddBoolOr([assign[t, v].Not()] + earlier_and_assigned_conditions).OnlyEnforceIf(is_first_trade_for_v.Not())
 
-                # --- Calculate Initial Travel Time ---
-                trade_origin = trades_with_id[t].origin_port
-                travel_distance = self.headquarters.get_network_distance(vessel_location, trade_origin)
-                initial_travel_time = 0 # Default
+                # --- Initial Travel Time ---
+                initial_travel_time = start_travel[t][v]
                 can_reach = True
-                if travel_distance is None or travel_distance == float('inf'):
+                if initial_travel_time is None:
+                    logger.warning(f"Vessel {v} cannot reach trade {t} origin {trades[t].origin_port} from {vessel.location}.")
                     can_reach = False
+                    initial_travel_time = 0
                     model.Add(assign[t, v] == 0) # Cannot assign if unreachable
-                else:
-                    initial_travel_time = ceil(vessel.get_travel_time(travel_distance))
-                    latest_pickup_time = trades_with_id[t].latest_pickup
-                    if initial_travel_time > latest_pickup_time:
-                        can_reach = False
-                        model.Add(assign[t, v] == 0) # Cannot assign if arrival is too late
+                elif initial_travel_time > trades[t].time_window[1]:
+                    logger.warning(f"Vessel {v} cannot reach trade {t} ({trades[t].origin_port}) by latest pickup time {trades[t].time_window[1]}. Travel time: {initial_travel_time}.")
+                    can_reach = False
+                    model.Add(assign[t, v] == 0) # Cannot assign if arrival is too late
 
-                # --- Initial Ballast Cost ---
-                initial_ballast_consumption = 0
+                # --- Core First Trade Pickup Time Constraint ---
                 if can_reach:
-                     initial_ballast_consumption = vessel.get_ballast_consumption(initial_travel_time, vessel.speed)
+                    # pickup_time[t] >= travel_time IF is_first_trade_for_v
+                    model.Add(pickup_time[t] >= start_time + initial_travel_time).OnlyEnforceIf(is_first_trade_for_v)
 
+                # --- Initial Ballast Cost ---
+                initial_ballast_consumption = data['start_ballast'][t][v] if can_reach else 0
                 scaled_initial_ballast_cons = ceil(initial_ballast_consumption * SCALE_FACTOR)
                 temp_initial_ballast_var = model.NewIntVar(0, scaled_initial_ballast_cons, f"initial_ballast_{t}_{v}")
                 # Set cost only if it's the first trade and reachable
@@ -533,7 +561,6 @@ class Solver:
                 model.Add(temp_initial_ballast_var == 0).OnlyEnforceIf(is_first_trade_for_v.Not())
                 ballast_consumption_expr.append(temp_initial_ballast_var)
 
-
                 # --- Initial Idle Time and Cost ---
                 # Earliest arrival time at pickup location
                 earliest_arrival_time = start_time + initial_travel_time
@@ -548,12 +575,6 @@ class Solver:
                 # If not the first trade, initial idle time is 0
                 model.Add(initial_idle_time == 0).OnlyEnforceIf(is_first_trade_for_v.Not())
 
-                # Calculate initial idle cost
-                idle_consumption_rate = ceil(vessel._propelling_engine._idle_consumption) # Per time unit
-                scaled_idle_rate = ceil(idle_consumption_rate * SCALE_FACTOR)
-                # Estimate max possible initial idle cost
-                max_possible_idle_cost = ceil(max_time * scaled_idle_rate)
-
                 temp_initial_idle_cost_var = model.NewIntVar(0, max_possible_idle_cost, f"initial_idle_cost_{t}_{v}")
                 # Cost = rate * time
                 model.Add(temp_initial_idle_cost_var == initial_idle_time * scaled_idle_rate) # Rate already scaled
@@ -561,52 +582,17 @@ class Solver:
                 # Add this cost component to the total idle cost expression list
                 idle_consumption_expr.append(temp_initial_idle_cost_var)
 
-                # --- Core First Trade Pickup Time Constraint ---
-                if can_reach:
-                    # pickup_time[t] >= earliest_arrival_time is needed
-                    # This is implicitly handled by initial_idle_time >= pickup_time[t] - earliest_arrival_time AND initial_idle_time >= 0
-                    # But we can add it explicitly for clarity if desired:
-                    # model.Add(pickup_time[t] >= earliest_arrival_time).OnlyEnforceIf(is_first_trade_for_v)
-                    pass # Covered by idle time calculation
-
-
             # Constraint: At most one trade can be the first for vessel v
             model.AddAtMostOne(is_first_trade_list_for_v)
 
-        # Calculate the idle and ballast cost during the trips, eg, between two consecutive trades
-
-        # Constraint: capacity constraint
-        # for v, vessel in enumerate(fleets):
-        #     model.Add(sum(assign[t, v] * trade.amount for t, trade in enumerate(trades)) <= vessel.capacity)
-        for v, vessel in enumerate(fleets):
-            intervals = []
-            demands = []
-            for t, trade in enumerate(trades):
-                interval = model.NewOptionalIntervalVar(
-                    pickup_time[t],
-                    trades_with_id[t].duration,  # duration: loading time + travel time
-                    dropoff_time[t],
-                    assign[t, v],
-                    f'interval_{t}_{v}'
-                )
-                intervals.append(interval)
-                demands.append(ceil(trade.amount))
-            capacity_list = vessel.capacities_and_loading_rates
-            model.AddCumulative(intervals, demands, ceil(capacity_list[0].capacity))
-
         # Objective: minimize the total cost
         fuel_expr = []
         penalty_expr = []
         for t, trade in enumerate(trades):
             for v, vessel in enumerate(fleets):
-                travel_distance = self.headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-                loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
-                loading_cost = vessel.get_loading_consumption(loading_time)
-                unloading_costs = vessel.get_unloading_consumption(loading_time)
-                travel_time = vessel.get_travel_time(travel_distance)
-                travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
-                total_cost = loading_cost + unloading_costs + travel_cost
-                fuel_expr.append(assign[t, v] * total_cost)
+                if data['fuel_cost'][t][v] is None:
+                    continue  # assign[t, v] is fixed to 0
+                fuel_expr.append(assign[t, v] * data['fuel_cost'][t][v])
             penalty_expr.append((1 - sum(assign[t, v] for v in range(len(fleets)))) * trade.amount * 10) # trade.amount is the penalty for unserved trades
 
         # idle cost
@@ -614,9 +600,25 @@ class Solver:
         total_ballast_cost = sum(ballast_consumption_expr)
         # model.Minimize(sum(fuel_expr) + total_idle_cost + total_ballast_cost + sum(penalty_expr))
         model.Minimize(sum(fuel_expr) + sum(penalty_expr) + total_idle_cost + total_ballast_cost)
+        # a forked worker has its own main thread, so it is told apart by its process ID
+        thread = threading.get_ident() if multiprocessing.parent_process() is None else os.getpid()
+        self.spans.append(('cp_sat_build', build_start, time.perf_counter(), thread,
+                           {'trades': len(trades), 'vessels': len(fleets)}))
         # solve the problem
         solver = cp_model.CpSolver()
-        status = solver.Solve(model)
+        if self.time_limit is not None:
+            solver.parameters.max_time_in_seconds = self.time_limit
+        if self.num_workers is not None:
+            solver.parameters.num_workers = self.num_workers
+        # stream the improving incumbents to self.incumbents
+        self.incumbents.attach(assign, pickup_time, dropoff_time)
+        self._cp_solver = solver
+        solve_start = time.perf_counter()
+        status = solver.Solve(model, self.incumbents)
+        self.spans.append(('cp_sat_solve', solve_start, time.perf_counter(), thread,
+                           {'trades': len(trades), 'vessels': len(fleets), 'status': solver.StatusName(status),
+                            'incumbents': len(self.incumbents.profile())}))
+        self._cp_solver = None
         if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
             print(f"Solution at time {start_time}:")
             for t, trade in enumerate(trades):
@@ -641,7 +643,7 @@ class Solver:
             assignment_values = {}
 
             # Extract assignment decisions (which vessel is assigned to which trade)
-            for t in range(len(trades_with_id)):
+            for t in range(len(trades)):
                 for v in range(len(fleets)):
                     # Check if this trade is assigned to this vessel
                     if solver.Value(assign[t, v]) == 1:
@@ -652,8 +654,8 @@ class Solver:
             solution = {
                 'status': 'OPTIMAL' if status == cp_model.OPTIMAL else str(status),
                 'assignments': assignment_values,
-                'pickup_times': {t: solver.Value(pickup_time[t]) for t in range(len(trades_with_id))},
-                'dropoff_times': {t: solver.Value(dropoff_time[t]) for t in range(len(trades_with_id))},
+                'pickup_times': {t: solver.Value(pickup_time[t]) for t in range(len(trades))},
+                'dropoff_times': {t: solver.Value(dropoff_time[t]) for t in range(len(trades))},
                 'objective_value': solver.ObjectiveValue()
                 # Add other values you want to return
             }
@@ -677,4 +679,225 @@ class Solver:
             return solution
         else:
             print("No solution found.")
-            return None
\ No newline at end of file
+            return None
+
+    def cluster_trades(self, trades, max_cluster_size=10, proximity=2000):
+        """
+        Cluster the trades by overlapping pick-up time windows and geographic proximity.
+        Two trades are linked if their pick-up windows overlap and their origins are at most `proximity` apart.
+        Clusters larger than max_cluster_size are split in pick-up order.
+        Output is a list of clusters, each a list of trade indices.
+        """
+        parent = list(range(len(trades)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        order = sorted(range(len(trades)), key=lambda t: trades[t].time_window[0])
+        for a, t1 in enumerate(order):
+            for t2 in order[a + 1:]:
+                # sorted by earliest pickup, so no later trade can overlap either
+                if trades[t2].time_window[0] > trades[t1].time_window[1]:
+                    break
+                distance = self.headquarters.get_network_distance(trades[t1].origin_port, trades[t2].origin_port)
+                if distance is not None and distance <= proximity:
+                    parent[find(t2)] = find(t1)
+
+        clusters = {}
+        for t in order:
+            clusters.setdefault(find(t), []).append(t)
+
+        split_clusters = []
+        for cluster in clusters.values():
+            for i in range(0, len(cluster), max_cluster_size):
+                split_clusters.append(cluster[i:i + max_cluster_size])
+        return split_clusters
+
+    def group_subproblems(self, clusters, fleets, n_groups):
+        """
+        Merge the clusters into n_groups trade groups of balanced size and split the fleet into as many vessel groups.
+        Vessels are dealt round-robin, so each group gets a similar vessel mix.
+        Output is a list of (trade indices, vessel indices) tuples.
+        """
+        n_groups = max(1, min(n_groups, len(clusters), len(fleets)))
+        trade_groups = [[] for _ in range(n_groups)]
+        for cluster in sorted(clusters, key=len, reverse=True):
+            min(trade_groups, key=len).extend(cluster)
+        trade_groups.sort(key=len, reverse=True)
+
+        vessel_groups = [[] for _ in range(n_groups)]
+        for v in range(len(fleets)):
+            vessel_groups[v % n_groups].append(v)
+        return [(sorted(trade_group), vessel_group) for trade_group, vessel_group in zip(trade_groups, vessel_groups)]
+
+    def solve_decomposed(self, trades, fleets, n_groups=None, max_workers=None, max_cluster_size=10, proximity=2000):
+        """
+        Decomposition mode of solve for larger auctions.
+        The trades are clustered (see cluster_trades), the fleet is split into vessel groups, and each
+        (trade group, vessel group) subproblem is solved concurrently in a process pool.
+        The time limit bounds the whole decomposed solve: when there are more subproblems than workers, they run in
+        waves that share it, and subproblems not finished by then (or by a stop) are left to the repair.
+        The partial solutions are stitched together and the unserved trades are repaired into the gaps of the
+        vessel timelines (see repair_solution).
+        Output is a solution dict in the same format as solve, indexed by the positions in trades and fleets.
+        """
+        time_start = time.time()
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if n_groups is None:
+            # enough groups to keep every subproblem near max_cluster_size, independent of the core count
+            n_groups = max(max_workers, ceil(len(trades) / max_cluster_size))
+        clusters = self.cluster_trades(trades, max_cluster_size, proximity)
+        groups = self.group_subproblems(clusters, fleets, n_groups)
+        subproblems = [([trades[t] for t in trade_group], [fleets[v] for v in vessel_group])
+                       for trade_group, vessel_group in groups]
+        workers = min(max_workers, len(groups))
+        waves = ceil(len(groups) / workers)
+        sub_time_limit = None if self.time_limit is None else self.time_limit / waves
+        logger.info(f"Decomposed {len(trades)} trades and {len(fleets)} vessels into {len(groups)} subproblems "
+                    f"({waves} waves of {sub_time_limit} seconds).")
+
+        deadline = None if self.time_limit is None else time_start + self.time_limit
+
+        def remaining():
+            if deadline is None:
+                return None
+            return deadline - time.time()
+
+        # one CP-SAT worker per core share, so the concurrent subproblems do not oversubscribe the machine
+        num_workers = max(1, (os.cpu_count() or 1) // workers)
+        sub_results = [None] * len(groups)
+        if workers > 1:
+            executor = decomposition_pool(max_workers)
+            futures = {executor.submit(_solve_subproblem, snapshot_inputs(self.headquarters, sub_fleets, sub_trades,
+                                                                          committed=False),
+                                       sub_time_limit, num_workers, deadline): index
+                       for index, (sub_trades, sub_fleets) in enumerate(subproblems)}
+            pending = set(futures)
+            while len(pending) > 0 and not self._stop_event.is_set():
+                timeout = remaining()
+                if timeout is not None and timeout <= 0:
+                    break
+                done, pending = wait(pending, timeout=min(1, timeout or 1), return_when=FIRST_COMPLETED)
+                for future in done:
+                    sub_results[futures[future]] = future.result()
+            for future in pending:
+                # a running subproblem ends at the deadline on its own; the ones still queued are dropped
+                future.cancel()
+            if len(pending) > 0:
+                logger.warning(f"{len(pending)} subproblems did not finish within {self.time_limit} seconds.")
+        else:
+            for index, (sub_trades, sub_fleets) in enumerate(subproblems):
+                timeout = remaining()
+                if self._stop_event.is_set() or (timeout is not None and timeout <= 0):
+                    logger.warning(f"{len(groups) - index} subproblems did not start within {self.time_limit} seconds.")
+                    break
+                self._sub_solver = Solver(self.headquarters, time_limit=min(sub_time_limit, timeout)
+                                          if timeout is not None else None, num_workers=num_workers)
+                sub_results[index] = (self._sub_solver.solve(sub_trades, sub_fleets), self._sub_solver.spans)
+            self._sub_solver = None
+        sub_solutions = [None if sub_result is None else sub_result[0] for sub_result in sub_results]
+        for index, sub_result in enumerate(sub_results):
+            if sub_result is None:
+                continue
+            for name, start, end, thread, attributes in sub_result[1]:
+                self.spans.append((name, start, end, thread, dict(attributes, subproblem=index)))
+
+        # stitch the partial solutions back to the original indices
+        solution = {
+            'status': 'DECOMPOSED',
+            'assignments': {},
+            'pickup_times': {},
+            'dropoff_times': {},
+            'objective_value': 0
+        }
+        for (trade_group, vessel_group), sub_solution in zip(groups, sub_solutions):
+            if sub_solution is None:
+                logger.warning(f"No solution found for subproblem with trades {trade_group}.")
+                continue
+            for t_sub, t in enumerate(trade_group):
+                solution['pickup_times'][t] = sub_solution['pickup_times'][t_sub]
+                solution['dropoff_times'][t] = sub_solution['dropoff_times'][t_sub]
+            for t_sub, v_sub in sub_solution['assignments'].items():
+                solution['assignments'][trade_group[t_sub]] = vessel_group[v_sub]
+            solution['objective_value'] += sub_solution['objective_value']
+
+        self.repair_solution(solution, trades, fleets)
+        return solution
+
+    def repair_solution(self, solution, trades, fleets):
+        """
+        Cheap repair step of the decomposition mode: every unserved trade is placed into the first gap of a vessel
+        timeline where it fits with its travel, loading and unloading times. The solution is updated in place.
+        A timeline is made of blocks of trades whose pick-up to unloading intervals overlap; only the gaps between
+        blocks are used, where the vessel carries no cargo, so its full capacity is available and it departs from
+        the port of the block's last drop-off.
+        """
+        start_time = trades[0].time
+        timelines = {v: [] for v in range(len(fleets))}
+        for t, v in solution['assignments'].items():
+            timelines[v].append(t)
+
+        def travel(vessel, port_one, port_two):
+            distance = self.headquarters.get_network_distance(port_one, port_two)
+            if distance is None or distance == float('inf'):
+                return None
+            return ceil(vessel.get_travel_time(distance))
+
+        def blocks(vessel, timeline):
+            """(first trade, last trade, ready time) of each block, ready once the last drop-off is unloaded"""
+            result = []
+            for t in sorted(timeline, key=lambda t: solution['pickup_times'][t]):
+                ready = solution['dropoff_times'][t] + ceil(vessel.get_loading_time(trades[t].cargo_type,
+                                                                                    trades[t].amount))
+                if len(result) > 0 and solution['pickup_times'][t] < result[-1][2]:
+                    first, last, block_ready = result[-1]
+                    result[-1] = (first, t, ready) if ready > block_ready else (first, last, block_ready)
+                else:
+                    result.append((t, t, ready))
+            return result
+
+        unserved = [t for t in range(len(trades)) if t not in solution['assignments']]
+        for t in sorted(unserved, key=lambda t: trades[t].time_window[0]):
+            trade = trades[t]
+            for v, vessel in enumerate(fleets):
+                if vessel.capacity(trade.cargo_type) < trade.amount:
+                    continue
+                load_time = ceil(vessel.get_loading_time(trade.cargo_type, trade.amount))
+                journey = travel(vessel, trade.origin_port, trade.destination_port)
+                if journey is None:
+                    continue
+                timeline = blocks(vessel, timelines[v])
+                for position in range(len(timeline) + 1):
+                    # earliest arrival at the origin after the previous block (or the depot)
+                    if position == 0:
+                        approach = travel(vessel, vessel.location, trade.origin_port)
+                        ready = start_time
+                    else:
+                        _, previous, ready = timeline[position - 1]
+                        approach = travel(vessel, trades[previous].destination_port, trade.origin_port)
+                    if approach is None:
+                        continue
+                    pickup = max(trade.time_window[0], ready + approach)
+                    dropoff = max(trade.time_window[2], pickup + load_time + journey)
+                    if pickup > trade.time_window[1] or dropoff > trade.time_window[3]:
+                        continue
+                    # the next block must still be reachable in time
+                    if position < len(timeline):
+                        following = timeline[position][0]
+                        departure = travel(vessel, trade.destination_port, trades[following].origin_port)
+                        if (departure is None or
+                                dropoff + load_time + departure > solution['pickup_times'][following]):
+                            continue
+                    timelines[v].append(t)
+                    solution['assignments'][t] = v
+                    solution['pickup_times'][t] = pickup
+                    solution['dropoff_times'][t] = dropoff
+                    break
+                if t in solution['assignments']:
+                    break
+        logger.info(f"Repair placed {sum(1 for t in unserved if t in solution['assignments'])}/{len(unserved)} unserved trades.")
+        return solution
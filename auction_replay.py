@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 18:20
+# @Author  : mmai
+# @FileName: auction_replay
+# @Software: PyCharm
+
+import gzip
+import importlib
+import json
+import os
+import time
+from mable.shipping_market import Contract
+from snapshots import snapshot_inputs, build_replay
+from utils import simulate_schedule_cost
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------------------------------------------------
+
+def snapshot_auction(company, trades, phase, payments=None):
+    """
+    Everything a company decision depends on, in a self-contained form: the auction time, the trades with their
+    payments, the vessels with their specifications, positions and committed schedules, and the network distances
+    between all locations involved, so a replay needs neither the mable resources nor the simulation.
+    """
+    snapshot = {'company': company.name, 'phase': phase}
+    snapshot.update(snapshot_inputs(company.headquarters, company.fleet, trades, payments))
+    return snapshot
+
+
+def save_snapshot(snapshot, path):
+    with gzip.open(path, 'wt') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+
+
+def load_snapshot(path):
+    with gzip.open(path, 'rt') as f:
+        return json.load(f)
+
+
+class AuctionRecorder:
+    """
+    Saves the inputs of every inform and receive call of a company to directory, one file per decision.
+    The methods are wrapped on the instance like the LatencyRecorder of results_store.
+    """
+    def __init__(self, company, directory):
+        self.directory = directory
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+        inform = company.inform
+        receive = company.receive
+
+        def recorded_inform(trades, *args, **kwargs):
+            self.record(company, trades, 'inform')
+            return inform(trades, *args, **kwargs)
+
+        def recorded_receive(contracts, *args, **kwargs):
+            payments = {contract.trade: contract.payment for contract in contracts}
+            self.record(company, [contract.trade for contract in contracts], 'receive', payments)
+            return receive(contracts, *args, **kwargs)
+
+        company.inform = recorded_inform
+        company.receive = recorded_receive
+
+    def record(self, company, trades, phase, payments=None):
+        try:
+            snapshot = snapshot_auction(company, trades, phase, payments)
+            path = os.path.join(self.directory, f"decision_{self.count:04d}_{phase}.json.gz")
+            save_snapshot(snapshot, path)
+            self.count += 1
+        except Exception as e:
+            # recording must never change the outcome of the simulation
+            print(f"Error recording {phase} of {company.name}: {e}")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------------------------------------------------
+
+def load_company_class(path):
+    """'kbest_bid.KBestBidComanyn' -> class"""
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def replay_decision(snapshot, company_class, params=None, phase=None, pre_inform=False):
+    """
+    Feed a recorded decision into a fresh company and time it.
+    Output: dict with the latency in seconds and the cost of the decision: the number and total amount of the bids
+    for inform, the number of received trades scheduled and the cost of the applied schedules for receive.
+    With pre_inform, the auction is announced to the company (untimed by latency, see pre_inform_latency) before an
+    inform decision, on the same fleet.
+    """
+    engine, headquarters, fleet, trades, payments = build_replay(snapshot)
+    company = company_class(fleet, snapshot['company'], **(params or {}))
+    company.set_engine(engine)
+    company._headquarters = headquarters
+    phase = phase or snapshot['phase']
+    result = {'phase': phase, 'time': snapshot['time'], 'trades': len(trades)}
+    if phase == 'inform':
+        if pre_inform:
+            time_start = time.perf_counter()
+            company.pre_inform(trades, snapshot['time'])
+            result['pre_inform_latency'] = time.perf_counter() - time_start
+        time_start = time.perf_counter()
+        bids = company.inform(trades)
+        result['latency'] = time.perf_counter() - time_start
+        result['bids'] = len(bids)
+        result['bid_total'] = sum(bid.amount for bid in bids)
+    else:
+        contracts = [Contract(payment=payments.get(trade, 0), trade=trade) for trade in trades]
+        time_start = time.perf_counter()
+        company.receive(contracts)
+        result['latency'] = time.perf_counter() - time_start
+        scheduled = set()
+        schedule_cost = 0
+        for vessel, schedule in engine.applied_schedules.items():
+            scheduled.update(schedule.get_scheduled_trades())
+            cost, _, _, _ = simulate_schedule_cost(vessel, schedule, snapshot['time'], headquarters)
+            schedule_cost += cost
+        result['scheduled'] = len([trade for trade in trades if trade in scheduled])
+        result['schedule_cost'] = schedule_cost
+    telemetry = getattr(company, 'telemetry', None)
+    if telemetry is not None and len(telemetry.records) > 0:
+        result['phases'] = telemetry.records[-1]['phases']
+        result['counters'] = telemetry.records[-1]['counters']
+    return result
+
+
+def parse_params(pairs):
+    params = {}
+    for pair in pairs:
+        key, value = pair.split('=', 1)
+        try:
+            params[key] = json.loads(value)
+        except json.JSONDecodeError:
+            params[key] = value
+    return params
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Replay recorded auction decisions into a company')
+    parser.add_argument('records', type=str, help='Directory written by --record-auctions, or one snapshot file')
+    parser.add_argument('--company', type=str, default='kbest_bid.KBestBidComanyn',
+                        help='Company class, e.g. greedy.GreedyComanyn, kbest.KBestComanyn, groupn.OurCompanyn')
+    parser.add_argument('--param', type=str, nargs='*', default=[],
+                        help='Company parameters as key=value, e.g. k_best=50')
+    parser.add_argument('--phase', type=str, choices=['inform', 'receive', 'all'], default='all',
+                        help='Replay only the inform or only the receive decisions')
+    parser.add_argument('--limit', type=int, default=None, help='Replay at most this many decisions')
+    parser.add_argument('--pre-inform', action='store_true',
+                        help='Announce every inform decision to the company with pre_inform first')
+    parser.add_argument('--output', type=str, default=None, help='JSON file for the per-decision results')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.records):
+        paths = sorted(os.path.join(args.records, name) for name in os.listdir(args.records)
+                       if name.endswith('.json.gz'))
+    else:
+        paths = [args.records]
+    if args.phase != 'all':
+        paths = [path for path in paths if path.endswith(f"_{args.phase}.json.gz")]
+    paths = paths[:args.limit]
+
+    company_class = load_company_class(args.company)
+    params = parse_params(args.param)
+    results = []
+    for path in paths:
+        try:
+            result = replay_decision(load_snapshot(path), company_class, params, pre_inform=args.pre_inform)
+        except Exception as e:
+            # the planners' own failures are part of what a replay reports
+            print(f"{os.path.basename(path)}: error {e.__class__.__name__}: {e}")
+            results.append({'file': os.path.basename(path), 'error': f"{e.__class__.__name__}: {e}"})
+            continue
+        result['file'] = os.path.basename(path)
+        results.append(result)
+        if result['phase'] == 'inform':
+            pre_inform_note = ''
+            if 'pre_inform_latency' in result:
+                pre_inform_note = f" (pre_inform {result['pre_inform_latency']:.3f} s)"
+            print(f"{result['file']}: {result['latency']:.3f} s{pre_inform_note}, {result['bids']}/{result['trades']} "
+                  f"bids, bid total {result['bid_total']:.2f}")
+        else:
+            print(f"{result['file']}: {result['latency']:.3f} s, {result['scheduled']}/{result['trades']} scheduled, "
+                  f"schedule cost {result['schedule_cost']:.2f}")
+
+    for phase in ('inform', 'receive'):
+        latencies = sorted(result['latency'] for result in results if result.get('phase') == phase)
+        if latencies:
+            print(f"{phase}: {len(latencies)} decisions, median {latencies[len(latencies) // 2]:.3f} s, "
+                  f"max {latencies[-1]:.3f} s, total {sum(latencies):.3f} s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 19:05
+# @Author  : mmai
+# @FileName: benchmarks
+# @Software: PyCharm
+
+import gc
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import utils
+from mable.transportation_scheduling import Schedule
+from auction_replay import load_snapshot
+from snapshots import build_replay
+from instances import generate_instance
+from greedy import GreedyComanyn
+from kbest_bid import KBestBidComanyn
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------------------------------------------------
+
+class Fixture:
+    """
+    The inputs of the benchmarked functions, built once from a snapshot: the replayed fleet, headquarters and
+    auction trades, one planned schedule per vessel and `kbest` k-best schedules over seeded shuffles.
+    """
+    def __init__(self, snapshot, seed=0, kbest=5):
+        self.snapshot = snapshot
+        self.engine, self.headquarters, self.fleet, self.trades, self.payments = build_replay(snapshot)
+        self.start_time = self.trades[0].time
+        self.greedy_company = GreedyComanyn(self.fleet, 'Benchmark')
+        self.greedy_company._headquarters = self.headquarters
+        self.kbest_company = KBestBidComanyn(self.fleet, 'Benchmark', k_best=kbest)
+        self.kbest_company._headquarters = self.headquarters
+        rnd = random.Random(seed)
+        self.k_best_schedules = []
+        for k in range(kbest):
+            trades = list(self.trades)
+            rnd.shuffle(trades)
+            schedule = self.kbest_company.kbest_schedule(trades, self.fleet, self.headquarters)
+            if len(schedule) > 0:
+                self.k_best_schedules.append(schedule)
+        # the first k-best plan, completed with the committed schedules of the vessels it leaves empty
+        self.schedules = {vessel: self.k_best_schedules[0].get(vessel, vessel.schedule) if self.k_best_schedules
+                          else vessel.schedule for vessel in self.fleet}
+
+    def describe(self):
+        return {
+            'trades': len(self.trades),
+            'vessels': len(self.fleet),
+            'ports': len(self.snapshot['locations']),
+            'scheduled_events': sum(len(schedule.get_simple_schedule()) for schedule in self.schedules.values()),
+            'k_best_schedules': len(self.k_best_schedules),
+        }
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------------------------------------------------
+
+class CallCounter:
+    """Counts the calls of a function of a module or class while in the with block"""
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.calls = 0
+
+    def __enter__(self):
+        function = getattr(self.module, self.name)
+        self.function = function
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return function(*args, **kwargs)
+
+        setattr(self.module, self.name, counted)
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.module, self.name, self.function)
+
+
+def bench_simulate_schedule_cost(fixture):
+    def run():
+        for vessel, schedule in fixture.schedules.items():
+            utils.simulate_schedule_cost(vessel, schedule, fixture.start_time, fixture.headquarters)
+    return run, len(fixture.schedules), 'samples'
+
+
+def bench_simulate_schedule_cost_allocated_shared_arrival(fixture):
+    def run():
+        for vessel, schedule in fixture.schedules.items():
+            utils.simulate_schedule_cost_allocated_shared_arrival(
+                vessel, schedule, fixture.start_time, fixture.headquarters)
+    return run, len(fixture.schedules), 'samples'
+
+
+def bench_cal_efficiency(fixture):
+    def run():
+        for k_schedule in fixture.k_best_schedules:
+            utils.cal_efficiency(k_schedule, fixture.headquarters, fixture.start_time)
+    return run, len(fixture.k_best_schedules), 'samples'
+
+
+def bench_greedy_schedule(fixture):
+    """One greedy step as in propose_schedules: every trade at every insertion position of every vessel"""
+    def run():
+        fixture.greedy_company.greedy_schedule(
+            fixture.trades, fixture.fleet, {}, [], fixture.headquarters)
+    # a candidate is one attempted insertion, whether or not it passes verify_schedule
+    with CallCounter(Schedule, 'add_transportation') as counter:
+        run()
+    return run, counter.calls, 'candidates'
+
+
+def bench_kbest_schedule(fixture):
+    """One k-best construction: sequential cheapest insertion of all trades in a fixed order"""
+    def run():
+        fixture.kbest_company.kbest_schedule(fixture.trades, fixture.fleet, fixture.headquarters)
+    with CallCounter(Schedule, 'add_transportation') as counter:
+        run()
+    return run, counter.calls, 'candidates'
+
+
+def bench_calculate_trade_frequency_and_avg_cost(fixture):
+    def run():
+        fixture.kbest_company.calculate_trade_frequency_and_avg_cost(
+            fixture.k_best_schedules, len(fixture.k_best_schedules), 0.5, fixture.start_time)
+    return run, len(fixture.k_best_schedules), 'samples'
+
+
+BENCHMARKS = {
+    'simulate_schedule_cost': bench_simulate_schedule_cost,
+    'simulate_schedule_cost_allocated_shared_arrival': bench_simulate_schedule_cost_allocated_shared_arrival,
+    'cal_efficiency': bench_cal_efficiency,
+    'greedy_schedule': bench_greedy_schedule,
+    'kbest_schedule': bench_kbest_schedule,
+    'calculate_trade_frequency_and_avg_cost': bench_calculate_trade_frequency_and_avg_cost,
+}
+
+
+def measure_allocations(run):
+    """
+    Output: (peak traced bytes, blocks allocated and still alive after the call, gen 0 garbage collections)
+    The gen 0 collections are triggered every 700 net container allocations, so they count allocation churn
+    that the retained blocks do not show.
+    """
+    gc.collect()
+    collections_before = gc.get_stats()[0]['collections']
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return peak, retained_blocks, gc.get_stats()[0]['collections'] - collections_before
+
+
+def run_benchmark(make, fixture, repeat=5, min_time=0.2):
+    """
+    Time a benchmark `repeat` times; every repeat calls it `number` times, chosen so a repeat takes about
+    min_time seconds. Allocations are measured in a separate call, tracemalloc slows the code down.
+    """
+    run, work, unit = make(fixture)
+    time_start = time.perf_counter()
+    run()
+    once = time.perf_counter() - time_start
+    number = max(1, math.ceil(min_time / once)) if once > 0 else 1
+    seconds = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        for _ in range(number):
+            run()
+        seconds.append((time.perf_counter() - time_start) / number)
+    median = statistics.median(seconds)
+    peak_bytes, retained_blocks, gc_collections = measure_allocations(run)
+    return {
+        'unit': unit,
+        'work': work,
+        'number': number,
+        'seconds': seconds,
+        'median_seconds': median,
+        'mad_seconds': statistics.median(abs(s - median) for s in seconds),
+        'throughput': work / median if median > 0 else None,
+        'peak_bytes': peak_bytes,
+        'retained_blocks': retained_blocks,
+        'gc_collections': gc_collections,
+    }
+
+
+def run_benchmarks(fixture, names=None, repeat=5, min_time=0.2):
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = run_benchmark(BENCHMARKS[name], fixture, repeat, min_time)
+        result = results[name]
+        print(f"{name}: {result['median_seconds'] * 1000:.3f} ms +- {result['mad_seconds'] * 1000:.3f}, "
+              f"{result['throughput']:.1f} {result['unit']}/s, peak {result['peak_bytes'] / 1024:.1f} KiB, "
+              f"{result['gc_collections']} gc")
+    return results
+
+
+# benchmarks whose regressions fail --compare: the simulators and the insertion loops
+GATED = ['simulate_schedule_cost', 'simulate_schedule_cost_allocated_shared_arrival',
+         'greedy_schedule', 'kbest_schedule']
+
+MAD_TO_SIGMA = 1.4826  # MAD of normally distributed samples times this estimates the standard deviation
+
+
+def compare_results(baseline, current, tolerance=0.1, noise_factor=3):
+    """
+    Compare the per-call median times of the benchmarks in both reports. The allowed slowdown of a benchmark is
+    the tolerance plus noise_factor times the combined relative spread (MAD) of the two medians, so a noisy
+    benchmark needs a larger slowdown to count as a regression.
+    Per-call time is compared rather than throughput, so pruning fewer candidates is not reported as slower.
+    Output: list of dicts, one per benchmark in both reports
+    """
+    rows = []
+    for name, new in current['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            continue
+        ratio = new['median_seconds'] / old['median_seconds']
+        noise = MAD_TO_SIGMA * math.hypot(old['mad_seconds'] / old['median_seconds'],
+                                          new['mad_seconds'] / new['median_seconds'])
+        threshold = tolerance + noise_factor * noise
+        rows.append({
+            'name': name,
+            'ratio': ratio,
+            'threshold': threshold,
+            'throughput_ratio': (new['throughput'] / old['throughput']
+                                 if new['throughput'] and old['throughput'] else None),
+            'regressed': ratio > 1 + threshold,
+            'improved': ratio < 1 / (1 + threshold),
+            'gated': name in GATED,
+        })
+    return rows
+
+
+def print_comparison(rows):
+    for row in rows:
+        status = 'REGRESSED' if row['regressed'] else 'improved' if row['improved'] else 'ok'
+        throughput = f"{row['throughput_ratio']:.2f}x" if row['throughput_ratio'] is not None else '-'
+        print(f"{row['name']:<48} time {row['ratio']:.3f}x (allowed {1 + row['threshold']:.3f}x), "
+              f"throughput {throughput}, {status}{'' if row['gated'] else ' (not gated)'}")
+
+
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the scheduling hot paths, offline')
+    parser.add_argument('--output', type=str, default=None,
+                        help='JSON file to save the results to, benchmark_baseline.json unless comparing')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Baseline JSON to compare against; exits with 1 if a gated benchmark regressed. '
+                             'The fixture settings of the baseline are used')
+    parser.add_argument('--current', type=str, default=None,
+                        help='With --compare, compare this saved result instead of running the benchmarks')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative slowdown on top of the measured noise')
+    parser.add_argument('--noise-factor', type=float, default=3,
+                        help='Number of standard deviations of the measured noise that is allowed')
+    parser.add_argument('--snapshot', type=str, default=None,
+                        help='Benchmark on a decision recorded with --record-auctions instead of a synthetic one')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic auction and the trade orders')
+    parser.add_argument('--trades', type=int, default=10, help='Trades in the synthetic auction')
+    parser.add_argument('--vessels', type=int, default=3, help='Vessels in the synthetic fleet')
+    parser.add_argument('--ports', type=int, default=10, help='Ports in the synthetic network')
+    parser.add_argument('--committed', type=int, default=1, help='Committed trades per vessel')
+    parser.add_argument('--kbest', type=int, default=5, help='K-best schedules in the fixture')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repeats per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per repeat')
+    parser.add_argument('--only', type=str, nargs='*', default=None, choices=list(BENCHMARKS),
+                        help='Run only these benchmarks')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        # like for like: rebuild the fixture of the baseline
+        for key, value in baseline.get('settings', {}).items():
+            setattr(args, key, value)
+
+    if args.current:
+        with open(args.current) as f:
+            report = json.load(f)
+    else:
+        if args.snapshot:
+            snapshot = load_snapshot(args.snapshot)
+        else:
+            snapshot = generate_instance(args.seed, args.trades, args.vessels, args.ports, committed=args.committed)
+        fixture = Fixture(snapshot, args.seed, args.kbest)
+        print(f"Fixture: {fixture.describe()}")
+        results = run_benchmarks(fixture, args.only, args.repeat, args.min_time)
+        report = {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'settings': {key: getattr(args, key)
+                         for key in ('snapshot', 'seed', 'trades', 'vessels', 'ports', 'committed', 'kbest')},
+            'fixture': fixture.describe(),
+            'benchmarks': results,
+        }
+        output = args.output or (None if baseline else 'benchmark_baseline.json')
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Results saved to {output}")
+
+    if baseline is None:
+        return 0
+    if baseline.get('fixture') != report.get('fixture'):
+        print(f"Warning: fixtures differ, baseline {baseline.get('fixture')}, current {report.get('fixture')}")
+    if baseline.get('python') != report.get('python') or baseline.get('machine') != report.get('machine'):
+        print("Warning: baseline was measured with another python version or machine")
+    rows = compare_results(baseline, report, args.tolerance, args.noise_factor)
+    print_comparison(rows)
+    regressed = [row['name'] for row in rows if row['regressed'] and row['gated']]
+    if regressed:
+        print(f"Performance regression in {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
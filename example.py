@@ -10,9 +10,12 @@ from mable.examples import environment, fleets, companies
 import greedy
 # import kbest
 import kbest_bid
+# import lns
+from telemetry import save_company_telemetry, save_chrome_trace
+from profiling import instrument_profilers, merge_profiles
 
 
-def build_specification():
+def build_specification(profile=False):
     number_of_month = 24
     trades_per_auction = 20
     num = 2 # number of vessels per fleet
@@ -52,6 +55,13 @@ def build_specification():
         trade_frequency_threshold=0.5,          # threshold for trade frequency
         k_best=110))                            # number of best schedules to consider
 
+    # large neighbourhood search on top of the k-best plan
+    # my_fleet = fleets.mixed_fleet(num_suezmax=num, num_aframax=num, num_vlcc=num)
+    # specifications_builder.add_company(lns.LNSComanyn.Data(
+    #     lns.LNSComanyn, my_fleet, lns.LNSComanyn.__name__,
+    #     profit_factor=1.4, k_best=110,
+    #     lns_iterations=20, lns_vessels=2, lns_time_limit=2, lns_time_budget=10))
+
     # arch enemy
     arch_enemy_fleet = fleets.mixed_fleet(num_suezmax=num, num_aframax=num, num_vlcc=num)
     specifications_builder.add_company(
@@ -70,8 +80,21 @@ def build_specification():
         specifications_builder,
         show_detailed_auction_outcome=False,
         global_agent_timeout=60)
+    profilers = instrument_profilers(sim) if profile else []
     sim.run()
+    # per-auction phase timings and counters of our companies
+    save_company_telemetry(sim.shipping_companies, "telemetry")
+    # timeline of the same decisions, open in chrome://tracing or https://ui.perfetto.dev
+    save_chrome_trace(sim.shipping_companies, "telemetry/trace.json")
+    if profile:
+        for profiler in profilers:
+            profiler.save("profiles/example")
+        merge_profiles("profiles/example")
 
 
 if __name__ == '__main__':
-    build_specification()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the decision calls of the companies, reports in profiles/example/report')
+    build_specification(parser.parse_args().profile)
\ No newline at end of file
@@ -9,24 +9,98 @@ from mable.examples.companies import ScheduleProposal
 import attrs
 from marshmallow import fields
 import time
-from utils import simulate_schedule_cost_allocated_shared_arrival, simulate_schedule_cost
+from utils import simulate_schedule_cost_allocated_shared_arrival, simulate_schedule_cost, reachability_index, \
+    insertion_candidates, TradeRecords, PLANNING_HORIZON, AnnouncedAuction, take_announced_auction
+from telemetry import DecisionTelemetry
 
 class GreedyComanyn(TradingCompany):
-    def __init__(self, fleet, name, profit_factor=1.65):
+    def __init__(self, fleet, name, profit_factor=1.65, insertion_detour_hours=None, insertion_nearest_stops=None,
+                 planning_horizon=PLANNING_HORIZON, speculative_proposal=False):
         super().__init__(fleet, name)
         self._profit_factor = profit_factor
+        # spatial filter of the insertion positions, see utils.insertion_candidates; None keeps all positions
+        self.insertion_detour_hours = insertion_detour_hours
+        self.insertion_nearest_stops = insertion_nearest_stops
+        # hours after the auction until which the idle time of the vessels is charged
+        self.planning_horizon = planning_horizon
+        # plan the whole proposal in pre_inform for inform to reuse; it is only reused when no vessel changed
+        # between the announcement and the auction, which is rare in a live simulation
+        self.speculative_proposal = speculative_proposal
         self.total_cost_until_now = 0
         self.total_idle_time = 0
+        self.telemetry = DecisionTelemetry(name)
+        # auctions announced in pre_inform by start time, see utils.AnnouncedAuction
+        self._announced_auctions = {}
 
     @attrs.define
     class Data(TradingCompany.Data):
         profit_factor: float = 1.65
+        insertion_detour_hours: float = None
+        insertion_nearest_stops: int = None
+        planning_horizon: float = PLANNING_HORIZON
+        speculative_proposal: bool = False
 
         class Schema(TradingCompany.Data.Schema):
             profit_factor = fields.Float(default=1.65)
+            insertion_detour_hours = fields.Float(default=None, allow_none=True)
+            insertion_nearest_stops = fields.Integer(default=None, allow_none=True)
+            planning_horizon = fields.Float(default=PLANNING_HORIZON)
+            speculative_proposal = fields.Boolean(default=False)
 
+    def pre_inform(self, trades, time):
+        with self.telemetry.decision('pre_inform', len(trades)):
+            with self.telemetry.phase('speculation'):
+                self.prepare_auction(trades)
 
-    def greedy_schedule(self, trades, fleets, schedules, scheduled_trades, headquarters, payments=None):
+    def inform(self, trades, *args, **kwargs):
+        with self.telemetry.decision('inform', len(trades)):
+            return super().inform(trades, *args, **kwargs)
+
+    def candidate_vessels(self, trades, start_time, records=None):
+        """Reachability index of the auction, shared by all greedy_schedule calls"""
+        candidate_vessels = reachability_index(trades, self._fleet, self._headquarters, start_time, records)
+        self.telemetry.count('pruned_vessels', sum(len(self._fleet) - len(vessels)
+                                                   for vessels in candidate_vessels.values()))
+        return candidate_vessels
+
+    def prepare_auction(self, trades):
+        """
+        Speculative planning of an announced auction: the trade records, kept for inform in any case, and with
+        speculative_proposal the reachability index and the whole proposal for the announced trades on the
+        current fleet.
+        """
+        if len(trades) == 0:
+            return
+        start_time = trades[0].time
+        announced = AnnouncedAuction(trades, start_time, self._fleet, self._headquarters)
+        self._announced_auctions[start_time] = announced
+        if not self.speculative_proposal:
+            return
+        announced.candidate_vessels = self.candidate_vessels(announced.trades, start_time, announced.records)
+        announced.proposal = self.propose_schedules(announced.trades, records=announced.records,
+                                                    candidate_vessels=announced.candidate_vessels)
+
+    def announced_inputs(self, trades, start_time):
+        """
+        The inputs of the bids, taken from pre_inform as far as they still hold.
+        Output: (proposal, records, reachability index), None for what has to be planned again
+        """
+        announced = take_announced_auction(self._announced_auctions, trades, start_time)
+        if announced is None:
+            return None, None, None
+        if not announced.fleet_unchanged(self._fleet):
+            if announced.proposal is not None:
+                self.telemetry.count('discarded_speculative_proposals')
+            return None, announced.records, None
+        if announced.proposal is not None and announced.same_trades(trades):
+            self.telemetry.count('speculative_proposals')
+            return announced.proposal, announced.records, announced.candidate_vessels
+        if announced.proposal is not None:
+            self.telemetry.count('discarded_speculative_proposals')
+        return None, announced.records, announced.candidate_vessels
+
+    def greedy_schedule(self, trades, fleets, schedules, scheduled_trades, headquarters, payments=None,
+                        candidate_vessels=None, records=None):
 
         min_cost_for_trades = float('inf')
         best_trade = None
@@ -47,10 +121,15 @@ class GreedyComanyn(TradingCompany):
             current_best_insertion_pickup = None
             current_best_insertion_dropoff = None
             
-            for v, vessel in enumerate(fleets):
+            # only the vessels of the reachability index can serve the trade
+            for v, vessel in enumerate(fleets if candidate_vessels is None else candidate_vessels[trade]):
                 current_vessel_schedule = schedules.get(vessel, vessel.schedule)
                 new_schedule_vessel = current_vessel_schedule.copy()
+                self.telemetry.count('schedule_copies')
                 insertion_points = new_schedule_vessel.get_insertion_points()
+                candidates = set(insertion_candidates(new_schedule_vessel, trade, vessel, headquarters,
+                                                      self.insertion_detour_hours, self.insertion_nearest_stops,
+                                                      records))
 
                 min_cost_for_vessel = float('inf')
                 vessel_best_insertion_pick_up = None
@@ -60,6 +139,10 @@ class GreedyComanyn(TradingCompany):
                 
                 for i in range(1, len(insertion_points)+1):
                     for j in range(i, len(insertion_points)+1):
+                        if (i, j) not in candidates:
+                            continue
+                        self.telemetry.count('candidates')
+                        self.telemetry.count('schedule_copies')
                         try:
                             new_schedule_vessel_insertion = new_schedule_vessel.copy()
                             # try to add trade to vessel schedule with all possible insertion points
@@ -71,12 +154,15 @@ class GreedyComanyn(TradingCompany):
                         if new_schedule_vessel_insertion.verify_schedule():
                             if len(new_schedule_vessel_insertion.get_simple_schedule()) % 2 != 0:
                                 continue
+                            self.telemetry.count('simulations')
                             current_cost, idle_time, pickup, dropoff = simulate_schedule_cost(
                                 vessel, 
                                 new_schedule_vessel_insertion,
                                 start_time,
                                 headquarters,
-                                payments
+                                payments,
+                                records,
+                                self.planning_horizon
                             )
                             if current_cost < min_cost_for_vessel:
                                 min_cost_for_vessel = current_cost
@@ -127,7 +213,7 @@ class GreedyComanyn(TradingCompany):
             # No feasible assignment found
             return float('inf'), None, None, None, None, None
     
-    def propose_schedules(self, trades, payment_per_trade=None):
+    def propose_schedules(self, trades, payment_per_trade=None, records=None, candidate_vessels=None):
         # for v, vessel in enumerate(self._fleet):
         #     if len(vessel.schedule.get_simple_schedule()) == 1:
         #         pass
@@ -143,59 +229,76 @@ class GreedyComanyn(TradingCompany):
         pick_up_time = {}
         drop_off_time = {}
         start_time = trades[0].time
+        if payment_per_trade is None and records is None:
+            # the bids may have been planned in pre_inform already
+            proposal, records, candidate_vessels = self.announced_inputs(trades, start_time)
+            if proposal is not None:
+                return proposal
         time_start = time.time()
-        while len(scheduled_trades) < len(trades):
-            # if len(rejected_trades) > 1:
-            #     pass
-            for trade in trades:
-                current_trade = trade
-                if trade not in scheduled_trades:
-                    cost_trade, trade, best_vessel, best_vessel_schedule, best_pickup_time, best_dropoff_time = self.greedy_schedule(
-                        trades, 
-                        self._fleet, 
-                        schedules, 
-                        scheduled_trades, 
-                        self._headquarters,
-                        payment_per_trade
-                    )
-                    if cost_trade > rejection_threshold:
-                        last_rejected_trade = current_trade
-                        rejected_trades.append(current_trade)
-                        continue
-                    scheduled_trades.append(trade)
-                    schedules[best_vessel] = best_vessel_schedule
-                    pick_up_time[trade] = best_pickup_time[trade]
-                    drop_off_time[trade] = best_dropoff_time[trade]
-                    # costs[trade] = cost_trade * self._profit_factor  # naive calculate the cost based on travel time
-            time_end = time.time()
-            if time_end - time_start > 3 or last_rejected_trade == current_trade:
-            # if last_rejected_trade == current_trade:
-                break
+        with self.telemetry.phase('sampling'):
+            if records is None:
+                records = TradeRecords(trades, self._fleet)
+            if candidate_vessels is None:
+                candidate_vessels = self.candidate_vessels(trades, start_time, records)
+            while len(scheduled_trades) < len(trades):
+                # if len(rejected_trades) > 1:
+                #     pass
+                for trade in trades:
+                    current_trade = trade
+                    if trade not in scheduled_trades:
+                        cost_trade, trade, best_vessel, best_vessel_schedule, best_pickup_time, best_dropoff_time = self.greedy_schedule(
+                            trades, 
+                            self._fleet, 
+                            schedules, 
+                            scheduled_trades, 
+                            self._headquarters,
+                            payment_per_trade,
+                            candidate_vessels,
+                            records
+                        )
+                        if cost_trade > rejection_threshold:
+                            last_rejected_trade = current_trade
+                            rejected_trades.append(current_trade)
+                            continue
+                        scheduled_trades.append(trade)
+                        schedules[best_vessel] = best_vessel_schedule
+                        pick_up_time[trade] = best_pickup_time[trade]
+                        drop_off_time[trade] = best_dropoff_time[trade]
+                        # costs[trade] = cost_trade * self._profit_factor  # naive calculate the cost based on travel time
+                time_end = time.time()
+                if time_end - time_start > 3 or last_rejected_trade == current_trade:
+                # if last_rejected_trade == current_trade:
+                    break
         # print(f"Time taken: {time_end - time_start} seconds")
 
         #simulate cost with connection cost and accurately calculate the shared cost
-        for vessel, schedule in schedules.items():
-            if schedule.verify_schedule():
-                try:
-                    trip_cost, trade_specific_costs, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(vessel, schedule, start_time, self._headquarters)
-                except Exception as e:
-                    print(f"Error simulating schedule cost: {e}")
-                    continue
-                for trade in schedule.get_scheduled_trades():
-                    # calculate absolute cost
-                    travel_distance = self._headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-                    travel_time = vessel.get_travel_time(travel_distance)
-                    travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
-                    loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
-                    loading_cost = vessel.get_loading_consumption(loading_time)
-                    unloading_cost = vessel.get_unloading_consumption(loading_time)
-                    absolute_cost = loading_cost + unloading_cost + travel_cost
-                    # costs[trade] = trade_specific_costs[trade] * self._profit_factor
-                    if trade_specific_costs[trade] < absolute_cost:
-                        costs[trade] = trade_specific_costs[trade] * self._profit_factor
-                    else:
-                        costs[trade] = trade_specific_costs[trade] * 1.3
-            return ScheduleProposal(schedules, scheduled_trades, costs)
+        with self.telemetry.phase('pricing'):
+            for vessel, schedule in schedules.items():
+                if schedule.verify_schedule():
+                    self.telemetry.count('simulations')
+                    try:
+                        trip_cost, trade_specific_costs, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
+                            vessel, schedule, start_time, self._headquarters, records=records,
+                            horizon=self.planning_horizon)
+                    except Exception as e:
+                        print(f"Error simulating schedule cost: {e}")
+                        continue
+                    for trade in schedule.get_scheduled_trades():
+                        # calculate absolute cost
+                        record = records[trade]
+                        travel_distance = records.distance(self._headquarters, record.origin, record.destination)
+                        travel_time = vessel.get_travel_time(travel_distance)
+                        travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
+                        loading_time = vessel.get_loading_time(record.cargo_type, record.amount)
+                        loading_cost = vessel.get_loading_consumption(loading_time)
+                        unloading_cost = vessel.get_unloading_consumption(loading_time)
+                        absolute_cost = loading_cost + unloading_cost + travel_cost
+                        # costs[trade] = trade_specific_costs[trade] * self._profit_factor
+                        if trade_specific_costs[trade] < absolute_cost:
+                            costs[trade] = trade_specific_costs[trade] * self._profit_factor
+                        else:
+                            costs[trade] = trade_specific_costs[trade] * 1.3
+                return ScheduleProposal(schedules, scheduled_trades, costs)
         
         # for vessel in self._fleet:
         #     if vessel in schedules:
@@ -251,8 +354,11 @@ class GreedyComanyn(TradingCompany):
         payment_per_trade = {}
         for one_contract in contracts:
             payment_per_trade[one_contract.trade] = one_contract.payment
-        scheduling_proposal = self.propose_schedules(trades, payment_per_trade)
-        _ = self.apply_schedules(scheduling_proposal.schedules)
+        with self.telemetry.decision('receive', len(trades)):
+            with self.telemetry.phase('schedule_trades'):
+                scheduling_proposal = self.propose_schedules(trades, payment_per_trade)
+            with self.telemetry.phase('apply_schedules'):
+                _ = self.apply_schedules(scheduling_proposal.schedules)
 
 
             
@@ -4,19 +4,17 @@
 # @FileName: groupn
 # @Software: PyCharm
 
-from mable.cargo_bidding import TradingCompany, SimpleCompany
+from mable.cargo_bidding import TradingCompany
 from mable.examples.companies import ScheduleProposal
 from marshmallow import fields
 import attrs
-from ortools.sat.python import cp_model
 
 from loguru import logger
-from mable.cargo_bidding import Bid
-from copy import deepcopy
-from math import ceil
-import numpy as np
+import threading
 from collections import defaultdict
 from Agents import Solver
+from utils import insert_trades_by_event_times
+from telemetry import DecisionTelemetry
 
 
 
@@ -35,16 +33,44 @@ from Agents import Solver
     #     scheduled_trades = []
 
 class OurCompanyn(TradingCompany):
-    def __init__(self, fleet, name, profit_factor=1.65):
+    def __init__(self, fleet, name, profit_factor=1.65, decomposition_threshold=30, decomposition_time_limit=40,
+                 bid_deadline=50):
         super().__init__(fleet, name)
         self._profit_factor = profit_factor
+        self.decomposition_threshold = decomposition_threshold      # number of trades from which the solver decomposes
+        self.decomposition_time_limit = decomposition_time_limit    # time limit of the whole decomposed solve in seconds
+        self.bid_deadline = bid_deadline                            # seconds after which the latest incumbent is used
+        self.telemetry = DecisionTelemetry(name)
 
     @attrs.define
     class Data(TradingCompany.Data):
         profit_factor: float = 1.65
+        decomposition_threshold: int = 30
+        decomposition_time_limit: float = 40
+        bid_deadline: float = 50
 
         class Schema(TradingCompany.Data.Schema):
             profit_factor = fields.Float(default=1.65)
+            decomposition_threshold = fields.Integer(default=30)
+            decomposition_time_limit = fields.Float(default=40)
+            bid_deadline = fields.Float(default=50)
+
+    def pre_inform(self, trades, time):
+        with self.telemetry.decision('pre_inform', len(trades)):
+            return super().pre_inform(trades, time)
+
+    def inform(self, trades, *args, **kwargs):
+        with self.telemetry.decision('inform', len(trades)):
+            return super().inform(trades, *args, **kwargs)
+
+    def receive(self, contracts, auction_ledger=None, *args, **kwargs):
+        trades = [one_contract.trade for one_contract in contracts]
+        with self.telemetry.decision('receive', len(trades)):
+            with self.telemetry.phase('schedule_trades'):
+                scheduling_proposal = self.propose_schedules(trades)
+            with self.telemetry.phase('apply_schedules'):
+                self.apply_schedules(scheduling_proposal.schedules)
+
     # def pre_inform(self, trades, time):
     #     logger.warning("pre_inform")
     #     pass
@@ -69,105 +95,89 @@ class OurCompanyn(TradingCompany):
     #     if len(rejected_trades) > 0:
     #         logger.error(f"{len(rejected_trades)} rejected trades.")
 
-    def generate_intervals(self, time_windows):
-        """
-        time_windows is a list of tuples, each tuple contains the start and end of a time window
-        """
-        points = set()
-        for tw in time_windows:
-            points.add(tw[0])
-            points.add(tw[1])
-        points.add(0)
-        
-        intervals = []
-        # If points is a set, convert it to a sorted list
-        points = sorted(list(points))  # Convert set to sorted list
-        for i in range(len(points) - 1):
-            intervals.append((points[i], points[i+1]))
-        intervals.append((points[-1], float('inf')))  
-        return intervals
-    
-    def find_interval_index(self, time, intervals):
-        for i, interval in enumerate(intervals, start=1):
-            if time >= interval[0] and time < interval[1]:
-                return i
-        return -1
-
     def construct_schedule(self, solution, trades, fleets, schedules, scheduled_trades, costs):
         """
         Construct the schedule from the decision variables.
+        The solved pick-up and drop-off times of each vessel are merged into one event sequence and inserted in a
+        single pass (see insert_trades_by_event_times); trades the schedule rejects are left unscheduled.
         """
-        # maintain a record of the original order of trades
-        temp_trades = [id for id in range(len(trades))]
-        # create a t,v matrix to record the assignment of trades to vessels
-        assignment_matrix = np.zeros((len(trades), len(fleets)))
+        if solution is None:
+            return
+        trades_per_vessel = defaultdict(list)
         for t, v in solution['assignments'].items():
-            assignment_matrix[t, v] = 1
-
+            trades_per_vessel[v].append(trades[t])
+        pickup_times = {trades[t]: time for t, time in solution['pickup_times'].items()}
+        dropoff_times = {trades[t]: time for t, time in solution['dropoff_times'].items()}
 
-        tw_each_vessel = defaultdict(list)
-
-
-                # current_trade = temp_trades[i]
-            
-        for v in range(len(fleets)):
-            # current_trade = trades[i]
-            # is_assigned = False
+        for v, vessel_trades in trades_per_vessel.items():
             current_vessel = fleets[v]
-            total_trades_per_vessel = sum(assignment_matrix[:, v])
-            while total_trades_per_vessel != 0:
-                for i in range(len(trades)):
-                    if assignment_matrix[i, v] == 1:
-                        is_assigned = True
-                    else:
-                        continue
-                    current_vessel_schedule = schedules.get(current_vessel, current_vessel.schedule)
-                    new_schedule = current_vessel_schedule.copy()
-                    insertion_points = new_schedule.get_insertion_points()
-                    if len(insertion_points) == 1:
-                        new_schedule.add_transportation(trades[i])
-                        # if new_schedule.verify_schedule():
-                        #     schedules[current_vessel] = new_schedule # update the schedule
-                        #     scheduled_trades.append(trades[i]) # add the trade to the scheduled trades
-                        #     tw_each_vessel[current_vessel].append((solution['pickup_times'][i], solution['dropoff_times'][i]))
-                    else:
-                        generated_intervals = self.generate_intervals(tw_each_vessel[current_vessel])
-                        # raise error if length of generated_intervals is not equal to length of insertion_points, use assert
-                        assert len(generated_intervals) == len(insertion_points), "Length of generated intervals is not equal to length of insertion points"
-                        pickup_interval_index = self.find_interval_index(solution['pickup_times'][i], generated_intervals)
-                        dropoff_interval_index = self.find_interval_index(solution['dropoff_times'][i], generated_intervals)
-                        new_schedule.add_transportation(trades[i], pickup_interval_index, dropoff_interval_index)
-
-                    if new_schedule.verify_schedule():
-                        schedules[current_vessel] = new_schedule # update the schedule
-                        scheduled_trades.append(trades[i]) # add the trade to the scheduled trades
-                        tw_each_vessel[current_vessel].append((solution['pickup_times'][i], solution['dropoff_times'][i])) # update the time window for the vessel
-                        # calculate the cost of the schedule
-                        loading_time = current_vessel.get_loading_time(trades[i].cargo_type, trades[i].amount)
-                        loading_cost = current_vessel.get_loading_consumption(loading_time)
-                        unloading_costs = current_vessel.get_unloading_consumption(loading_time)
-                        travel_time = solution['dropoff_times'][i] - solution['pickup_times'][i]
-                        travel_cost = current_vessel.get_laden_consumption(travel_time, current_vessel.speed) # not accurate
-                        total_cost = loading_cost + unloading_costs + travel_cost
-                        costs[trades[i]] = total_cost * self._profit_factor
-                        # remove the trade from the temp_trades
-                        total_trades_per_vessel -= 1
-                        assignment_matrix[i, v] = 0
-                        simple_schedule = schedules[current_vessel].get_simple_schedule()
-                        print(f"Vessel {current_vessel} schedule is {simple_schedule}")
-            # if schedules.get(current_vessel, current_vessel.schedule).verify_schedule():
-                # print(f"Vessel {current_vessel} schedule is valid.")
-                # pass
-        # return ScheduleProposal(schedules, scheduled_trades, costs)
-                    
-                    
+            current_vessel_schedule = schedules.get(current_vessel, current_vessel.schedule)
+            self.telemetry.count('schedule_copies')
+            new_schedule, inserted_trades, rejected_trades = insert_trades_by_event_times(
+                current_vessel_schedule, vessel_trades, pickup_times, dropoff_times)
+            if len(rejected_trades) > 0:
+                logger.warning(f"Vessel {current_vessel.name} rejected {len(rejected_trades)} solved trades.")
+            if len(inserted_trades) == 0:
+                continue
+            schedules[current_vessel] = new_schedule
+            for trade in inserted_trades:
+                scheduled_trades.append(trade)
+                # calculate the cost of the trade
+                loading_time = current_vessel.get_loading_time(trade.cargo_type, trade.amount)
+                loading_cost = current_vessel.get_loading_consumption(loading_time)
+                unloading_costs = current_vessel.get_unloading_consumption(loading_time)
+                travel_time = dropoff_times[trade] - pickup_times[trade]
+                travel_cost = current_vessel.get_laden_consumption(travel_time, current_vessel.speed) # not accurate
+                total_cost = loading_cost + unloading_costs + travel_cost
+                costs[trade] = total_cost * self._profit_factor
+
+    def solve_until_deadline(self, trades, decomposed=False):
+        """
+        Solve in a background thread and wait at most bid_deadline seconds. If the solver has not finished by then,
+        it is stopped and the latest incumbent it streamed is used instead, so a slow solve still yields bids.
+        With decomposed, the decomposition mode is used, bounded by decomposition_time_limit as a whole; otherwise the
+        search itself is limited to bid_deadline, so a stopped solve does not keep running after the decision.
+        """
+        if decomposed:
+            solver = Solver(self.headquarters, time_limit=self.decomposition_time_limit)
+            solve = solver.solve_decomposed
+        else:
+            solver = Solver(self.headquarters, time_limit=self.bid_deadline)
+            solve = solver.solve
+        result = []
+        solver_thread = threading.Thread(target=lambda: result.append(solve(trades, self._fleet)), daemon=True)
+        solver_thread.start()
+        solver_thread.join(self.bid_deadline)
+        if solver_thread.is_alive():
+            solver.stop()
+            # give the search a moment to unwind, it returns its best solution so far when it does
+            solver_thread.join(1)
+            logger.warning(f"Solver did not finish within {self.bid_deadline} seconds, using the latest incumbent.")
+        if len(result) > 0 and result[0] is not None:
+            solution = result[0]
+        else:
+            solution = solver.incumbents.latest()
+        profile = solver.incumbents.profile()
+        if len(profile) > 0:
+            logger.info(f"Time-to-quality (wall time, objective): {profile}")
+        self.add_solver_spans(solver)
+        return solution
+
+    def add_solver_spans(self, solver):
+        """Add the model build and search spans of the solver (and its workers) to the open decision"""
+        for name, start, end, thread, attributes in list(solver.spans):
+            self.telemetry.add_span(name, start, end, thread=thread, **attributes)
+
     def propose_schedules(self, trades):
         schedules = {}
         costs = {}
         scheduled_trades = []
-        solver = Solver(self.headquarters)
-        solution = solver.solve(trades, self._fleet)
-        self.construct_schedule(solution, trades, self._fleet, schedules, scheduled_trades, costs)
+        self.telemetry.count('solver_calls')
+        with self.telemetry.phase('sampling'):
+            # large auction: solve the time-window/vessel-group subproblems in parallel
+            solution = self.solve_until_deadline(trades, decomposed=len(trades) >= self.decomposition_threshold)
+        with self.telemetry.phase('pricing'):
+            self.construct_schedule(solution, trades, self._fleet, schedules, scheduled_trades, costs)
         return ScheduleProposal(schedules, scheduled_trades, costs)
 
 
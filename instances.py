@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 22:10
+# @Author  : mmai
+# @FileName: instances
+# @Software: PyCharm
+
+import itertools
+import math
+import os
+import random
+from auction_replay import save_snapshot
+
+
+def consumption_rate(base, speed_power):
+    return {'base': base, 'speed_power': speed_power, 'factor': 1 / 24}
+
+
+# the vessels of mable's fleets.mixed_fleet
+VESSEL_CLASSES = {
+    'suezmax': {
+        'capacity': 145000,
+        'engine': {
+            'fuel': {'name': 'MFO', 'price': 1, 'energy_coefficient': 40, 'co2_coefficient': 3.16},
+            'idle_consumption': 7.733 / 24,
+            'laden_consumption_rate': consumption_rate(0.0473, 2.6356),
+            'ballast_consumption_rate': consumption_rate(0.0195, 2.9185),
+            'loading_consumption': 12.23 / 24,
+            'unloading_consumption': 79.5 / 24,
+        },
+    },
+    'aframax': {
+        'capacity': 100000,
+        'engine': {
+            'fuel': {'name': 'MFO', 'price': 1, 'energy_coefficient': 40, 'co2_coefficient': 3.16},
+            'idle_consumption': 7.733 / 24,
+            'laden_consumption_rate': consumption_rate(0.0473, 2.6356),
+            'ballast_consumption_rate': consumption_rate(0.0195, 2.9185),
+            'loading_consumption': 12.23 / 24,
+            'unloading_consumption': 79.5 / 24,
+        },
+    },
+    'vlcc': {
+        'capacity': 285000,
+        'engine': {
+            'fuel': {'name': 'MFO', 'price': 1, 'energy_coefficient': 40, 'co2_coefficient': 3.16},
+            'idle_consumption': 7.13 / 24,
+            'laden_consumption_rate': consumption_rate(0.5503, 2.19201),
+            'ballast_consumption_rate': consumption_rate(0.1493, 2.3268),
+            'loading_consumption': 15.53 / 24,
+            'unloading_consumption': 134.37 / 24,
+        },
+    },
+}
+SPEED = 14
+# mable's trade distributions extend every time window by 5 days in each direction
+MAX_ALLOWANCE = 5 * 24
+MIN_ALLOWANCE = 6
+
+
+def generate_instance(seed=0, trades=100, vessels=20, ports=30, tightness=0.0, committed=1, cargo_types=('Oil',),
+                      area=3000, pickup_period=720, auction_time=720):
+    """
+    A reproducible auction in the auction_replay snapshot format, without the mable environment files.
+    Input:
+        ports: ports placed uniformly on an area x area plane, euclidean distances
+        vessels: Suezmax, Aframax and VLCC in turn (like fleets.mixed_fleet) at random ports, each carrying one of
+            cargo_types, with `committed` trades already in its schedule
+        trades: auction trades picked up within pickup_period hours after the auction
+        tightness: 0 gives mable's +-5 day time windows, 1 gives +-MIN_ALLOWANCE hours
+    Output: snapshot dict, replayable with auction_replay.build_replay
+    """
+    rnd = random.Random(seed)
+    locations = [{'key': f"P{i}", 'name': f"P{i}", 'x': rnd.uniform(0, area), 'y': rnd.uniform(0, area)}
+                 for i in range(ports)]
+    distances = [[math.hypot(a['x'] - b['x'], a['y'] - b['y']) for b in locations] for a in locations]
+    allowance = round(MIN_ALLOWANCE + (MAX_ALLOWANCE - MIN_ALLOWANCE) * (1 - tightness))
+    class_names = list(VESSEL_CLASSES)
+    slowest_loading_rate = min(int(vessel_class['capacity'] / 3.5) for vessel_class in VESSEL_CLASSES.values())
+
+    def make_trade(time, earliest, latest, capacity, origin=None):
+        if origin is None:
+            origin = rnd.randrange(ports)
+        destination = rnd.choice([port for port in range(ports) if port != origin])
+        amount = rnd.randint(int(0.2 * capacity), int(0.9 * capacity))
+        # at the loading rate of the smallest vessel, so every vessel that can carry the trade can meet the windows
+        loading_time = math.ceil(amount / slowest_loading_rate)
+        pick_up = rnd.randint(earliest, latest)
+        delivery = int(pick_up + loading_time + distances[origin][destination] / SPEED + loading_time)
+        return {
+            'origin_port': f"P{origin}",
+            'destination_port': f"P{destination}",
+            'amount': amount,
+            'cargo_type': rnd.choice(cargo_types),
+            'time': time,
+            'time_window': [max(earliest, pick_up - allowance), pick_up + allowance,
+                            max(earliest, delivery - allowance), delivery + allowance],
+        }
+
+    trade_records = {}
+    vessel_records = []
+    for v in range(vessels):
+        vessel_class = VESSEL_CLASSES[class_names[v % len(class_names)]]
+        cargo_type = cargo_types[v % len(cargo_types)]
+        location = rnd.randrange(ports)
+        # the committed trades are a feasible chain starting at the vessel's port
+        committed_ids = []
+        port = location
+        earliest = auction_time
+        for c in range(committed):
+            trade_id = f"c{v}_{c}"
+            trade = make_trade(auction_time - 720, earliest, earliest + 48, vessel_class['capacity'], port)
+            trade['cargo_type'] = cargo_type
+            trade_records[trade_id] = trade
+            committed_ids.append(trade_id)
+            port = int(trade['destination_port'][1:])
+            earliest = trade['time_window'][3]
+        vessel_records.append({
+            'name': f"{class_names[v % len(class_names)]}-{v}",
+            'location': f"P{location}",
+            'speed': SPEED,
+            'capacities': [{'cargo_type': cargo_type, 'loading_rate': int(vessel_class['capacity'] / 3.5),
+                            'capacity': vessel_class['capacity']}],
+            'engine': vessel_class['engine'],
+            'schedule_head': auction_time,
+            'committed': [[event, trade_id] for trade_id in committed_ids for event in ('PICK_UP', 'DROP_OFF')],
+        })
+    auction_trades = []
+    for t in range(trades):
+        trade_id = str(t)
+        capacity = VESSEL_CLASSES[rnd.choice(class_names)]['capacity']
+        trade_records[trade_id] = make_trade(auction_time, auction_time, auction_time + pickup_period, capacity)
+        auction_trades.append(trade_id)
+
+    return {
+        'company': 'Synthetic',
+        'phase': 'inform',
+        'time': auction_time,
+        'trades': trade_records,
+        'auction_trades': auction_trades,
+        'payments': {trade_id: 1e6 for trade_id in auction_trades},
+        'vessels': vessel_records,
+        'locations': locations,
+        'distances': distances,
+        'instance': {'seed': seed, 'trades': trades, 'vessels': vessels, 'ports': ports, 'tightness': tightness,
+                     'committed': committed, 'cargo_types': list(cargo_types)},
+    }
+
+
+def instance_name(seed, trades, vessels, ports, tightness):
+    # ends in _inform.json.gz like the recorded decisions, so auction_replay.py --phase inform selects it
+    return f"instance_t{trades}_v{vessels}_p{ports}_w{tightness:g}_s{seed}_inform.json.gz"
+
+
+def generate_suite(directory, seeds=(0,), trades=(50, 100, 200, 500), vessels=(10, 30, 60), ports=(30,),
+                   tightness=(0.0, 0.5), committed=1, cargo_types=('Oil',)):
+    """
+    One instance per combination of the settings, saved to directory.
+    Output: list of paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for one_seed, one_trades, one_vessels, one_ports, one_tightness in itertools.product(
+            seeds, trades, vessels, ports, tightness):
+        snapshot = generate_instance(one_seed, one_trades, one_vessels, one_ports, one_tightness, committed,
+                                     cargo_types)
+        path = os.path.join(directory, instance_name(one_seed, one_trades, one_vessels, one_ports, one_tightness))
+        save_snapshot(snapshot, path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate synthetic auctions for auction_replay.py and benchmarks.py')
+    parser.add_argument('--output', type=str, default='instances', help='Directory to save the instances to')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--trades', type=int, nargs='+', default=[50, 100, 200, 500])
+    parser.add_argument('--vessels', type=int, nargs='+', default=[10, 30, 60])
+    parser.add_argument('--ports', type=int, nargs='+', default=[30])
+    parser.add_argument('--tightness', type=float, nargs='+', default=[0.0, 0.5],
+                        help='0 for mable\'s +-5 day time windows, 1 for +-6 hours')
+    parser.add_argument('--committed', type=int, default=1, help='Committed trades per vessel')
+    parser.add_argument('--cargo-types', type=str, nargs='+', default=['Oil'],
+                        help='Cargo types, the vessels carry one type each in turn')
+    cli_args = parser.parse_args()
+    saved = generate_suite(cli_args.output, cli_args.seeds, cli_args.trades, cli_args.vessels, cli_args.ports,
+                           cli_args.tightness, cli_args.committed, cli_args.cargo_types)
+    print(f"Saved {len(saved)} instances to {cli_args.output}")
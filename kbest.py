@@ -11,9 +11,12 @@ from marshmallow import fields
 import time
 import random
 from collections import defaultdict
+from telemetry import DecisionTelemetry
+from utils import reachability_index, insertion_candidates, TradeRecords, port_visits, PLANNING_HORIZON
 # from greedy import simulate_schedule_cost
 
-def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, start_time, headquarters=None, payments=None):
+def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, start_time, headquarters=None, payments=None,
+                                                    records=None, horizon=PLANNING_HORIZON):
     """
     Simulates a vessel's schedule, allocating travel costs to a port among
     trades on board AND trades involved in immediate events at that port.
@@ -26,6 +29,9 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
     is_feasible: bool
     pick_up_times: dict {trade_object: time}
     drop_off_times: dict {trade_object: time}
+
+    records: TradeRecords of the auction, shared by its simulations
+    horizon: hours after start_time until which the idle time of the vessel is charged
     """
     if len(vessel_schedule) == 1:
         pass
@@ -38,66 +44,34 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
     is_feasible = True
 
     if not vessel_schedule:
-        horizon_duration = 720
-        total_idle_time = horizon_duration
+        total_idle_time = horizon
         total_idle_cost = vessel.get_idle_consumption(total_idle_time)
         total_cost = total_idle_cost # Only idle cost if schedule is empty
         return total_cost, trade_specific_costs, total_idle_time, pick_up_times, drop_off_times
 
+    if records is None:
+        records = TradeRecords()
+    vessel_schedule = [(event_type, records[trade]) for event_type, trade in vessel_schedule]
     current_time = float(start_time)
-    current_port = vessel.location
+    current_port = records.port_index(vessel.location)
     trades_on_board = set()
 
     # Optional sorting (same as before) - important for grouping logic
-    try:
-        vessel_schedule.sort(key=lambda item: (item[1].time_window[0] if item[0] == 'PICK_UP' else item[1].time_window[2],
-                                              item[1].time_window[1] if item[0] == 'PICK_UP' else item[1].time_window[3]))
-    except AttributeError:
-        print("Warning: Could not sort vessel schedule based on time windows.")
-        pass
+    vessel_schedule.sort(key=lambda item: (item[1].earliest_pickup if item[0] == 'PICK_UP' else item[1].earliest_dropoff,
+                                          item[1].latest_pickup if item[0] == 'PICK_UP' else item[1].latest_dropoff))
 
-    processed_indices = set()
-    current_schedule_index = 0
-
-    while current_schedule_index < len(vessel_schedule):
-        if current_schedule_index in processed_indices:
-            current_schedule_index += 1
-            continue
-
-        # --- Identify the next block of events at the same target port ---
-        first_event_index = current_schedule_index
-        first_event_type = vessel_schedule[first_event_index][0]
-        first_trade = vessel_schedule[first_event_index][1]
-
-        if first_event_type == 'PICK_UP':
-            target_port = first_trade.origin_port
-        elif first_event_type == 'DROP_OFF':
-            target_port = first_trade.destination_port
-        else:
-            current_schedule_index += 1 # Skip invalid event types
-            continue
-
-        # Find all consecutive events at this target_port
-        events_at_target_port_indices = []
-        trades_involved_at_target = set()
-        temp_idx = first_event_index
-        while temp_idx < len(vessel_schedule):
-            evt_type, trd = vessel_schedule[temp_idx]
-            port_for_this_event = trd.origin_port if evt_type == 'PICK_UP' else trd.destination_port
-            if port_for_this_event == target_port:
-                events_at_target_port_indices.append(temp_idx)
-                trades_involved_at_target.add(trd)
-                temp_idx += 1
-            else:
-                break # Stop when the port changes
+    for target_port, first_event_index, end_event_index in port_visits(vessel_schedule):
+        # --- The block of consecutive events at the same target port ---
+        events_at_target_port = vessel_schedule[first_event_index:end_event_index]
+        trades_involved_at_target = {record.trade for _, record in events_at_target_port}
 
         # --- 1. Travel to the target port ---
         segment_travel_cost = 0
         travel_time = 0 # Initialize travel_time
         if current_port != target_port:
-            travel_distance = headquarters.get_network_distance(current_port, target_port)
+            travel_distance = records.distance(headquarters, current_port, target_port)
             if travel_distance is None or travel_distance == float('inf'):
-                 print(f"Error: Unreachable route from {current_port} to {target_port}")
+                 print(f"Error: Unreachable route from {records.ports[current_port]} to {records.ports[target_port]}")
                  is_feasible = False
                  break
 
@@ -123,30 +97,26 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
                     trade_specific_costs[t_resp] += cost_share
             elif segment_travel_cost > 0:
                  # Travel cost occurred but no trades identified as responsible? Log warning.
-                 print(f"Warning: Travel cost {segment_travel_cost} to {target_port} not allocated to any trade.")
+                 print(f"Warning: Travel cost {segment_travel_cost} to {records.ports[target_port]} not allocated to any trade.")
 
 
             # Update current time after travel
             current_time += travel_time
 
         # --- 2. Process Events at the Target Port ---
-        for event_idx in events_at_target_port_indices:
-            if event_idx in processed_indices: # Should not happen with current logic, but safe check
-                 continue
-
-            event_type = vessel_schedule[event_idx][0]
-            trade = vessel_schedule[event_idx][1]
+        for event_type, record in events_at_target_port:
+            trade = record.trade
 
             if event_type == 'PICK_UP':
-                earliest_event_time = trade.time_window[0]
-                latest_event_time = trade.time_window[1]
+                earliest_event_time = record.earliest_pickup
+                latest_event_time = record.latest_pickup
             else: # DROP_OFF
-                earliest_event_time = trade.time_window[2]
-                latest_event_time = trade.time_window[3]
+                earliest_event_time = record.earliest_dropoff
+                latest_event_time = record.latest_dropoff
 
             # Check Time Window and Calculate Idle Time for this specific event
             if current_time > latest_event_time:
-                print(f"Infeasible: Arrived/Ready at {target_port} for {event_type} of trade at {current_time}, latest allowed is {latest_event_time}")
+                print(f"Infeasible: Arrived/Ready at {records.ports[target_port]} for {event_type} of trade at {current_time}, latest allowed is {latest_event_time}")
                 is_feasible = False
                 break # Break inner loop
 
@@ -169,7 +139,7 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
             operation_cost = 0
             if event_type == 'PICK_UP':
                 if trade in trades_on_board:
-                     print(f"Warning: Attempting to pick up trade {trade.id} which is already on board at {target_port}.")
+                     print(f"Warning: Attempting to pick up trade {trade.id} which is already on board at {records.ports[target_port]}.")
                 else:
                      operation_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
                      operation_cost = vessel.get_loading_consumption(operation_time)
@@ -179,7 +149,7 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
 
             elif event_type == 'DROP_OFF':
                  if trade not in trades_on_board:
-                      print(f"Warning: Attempting to drop off trade {trade.id} which is not on board at {target_port}.")
+                      print(f"Warning: Attempting to drop off trade {trade.id} which is not on board at {records.ports[target_port]}.")
                  else:
                       operation_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
                       operation_cost = vessel.get_unloading_consumption(operation_time)
@@ -188,7 +158,6 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
                       trades_on_board.remove(trade)
 
             total_operation_cost += operation_cost # Add to total operation cost
-            processed_indices.add(event_idx) # Mark this specific event as done
 
         if not is_feasible: # If infeasibility occurred while processing events at port
              break # Break outer loop
@@ -201,12 +170,9 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
 
         # Update the current port for the next iteration
         current_port = target_port
-        # Move the main index past the block we just processed
-        current_schedule_index = temp_idx # temp_idx is the index of the first event at the *next* port
 
     # --- 3. Calculate Final Idle Time & Total Cost ---
-    horizon_duration = 720
-    end_time = float(start_time) + horizon_duration
+    end_time = float(start_time) + horizon
     if is_feasible and current_time < end_time: # Only add final idle if feasible
         total_idle_time += end_time - current_time
 
@@ -223,22 +189,49 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule, sta
 
 
 class KBestComanyn(TradingCompany):
-    def __init__(self, fleet, name, profit_factor=1.65):
+    def __init__(self, fleet, name, profit_factor=1.65, insertion_detour_hours=None, insertion_nearest_stops=None,
+                 planning_horizon=PLANNING_HORIZON):
         super().__init__(fleet, name)
         self._profit_factor = profit_factor
+        # spatial filter of the insertion positions, see utils.insertion_candidates; None keeps all positions
+        self.insertion_detour_hours = insertion_detour_hours
+        self.insertion_nearest_stops = insertion_nearest_stops
+        # hours after the auction until which the idle time of the vessels is charged
+        self.planning_horizon = planning_horizon
         self.total_cost_until_now = 0
         self.total_idle_time = 0
         self.k_best = 150
+        self.telemetry = DecisionTelemetry(name)
 
     @attrs.define
     class Data(TradingCompany.Data):
         profit_factor: float = 1.65
+        insertion_detour_hours: float = None
+        insertion_nearest_stops: int = None
+        planning_horizon: float = PLANNING_HORIZON
 
         class Schema(TradingCompany.Data.Schema):
             profit_factor = fields.Float(default=1.65)
+            insertion_detour_hours = fields.Float(default=None, allow_none=True)
+            insertion_nearest_stops = fields.Integer(default=None, allow_none=True)
+            planning_horizon = fields.Float(default=PLANNING_HORIZON)
 
+    def pre_inform(self, trades, time):
+        with self.telemetry.decision('pre_inform', len(trades)):
+            return super().pre_inform(trades, time)
 
-    def kbest_schedule(self, trades, fleets, schedules, headquarters):
+    def inform(self, trades, *args, **kwargs):
+        with self.telemetry.decision('inform', len(trades)):
+            return super().inform(trades, *args, **kwargs)
+
+    def candidate_vessels(self, trades, start_time):
+        """Reachability index of the auction, shared by all k-best samples"""
+        candidate_vessels = reachability_index(trades, self._fleet, self._headquarters, start_time)
+        self.telemetry.count('pruned_vessels', sum(len(self._fleet) - len(vessels)
+                                                   for vessels in candidate_vessels.values()))
+        return candidate_vessels
+
+    def kbest_schedule(self, trades, fleets, schedules, headquarters, candidate_vessels=None, records=None):
 
         # min_cost_for_trades = float('inf')
         # best_trade = None
@@ -259,10 +252,15 @@ class KBestComanyn(TradingCompany):
             current_best_insertion_pickup = None
             current_best_insertion_dropoff = None
 
-            for v, vessel in enumerate(fleets):
+            # only the vessels of the reachability index can serve the trade
+            for v, vessel in enumerate(fleets if candidate_vessels is None else candidate_vessels[trade]):
                 current_vessel_schedule = schedules.get(vessel, vessel.schedule)
                 new_schedule_vessel = current_vessel_schedule.copy()
+                self.telemetry.count('schedule_copies')
                 insertion_points = new_schedule_vessel.get_insertion_points()
+                candidates = set(insertion_candidates(new_schedule_vessel, trade, vessel, headquarters,
+                                                      self.insertion_detour_hours, self.insertion_nearest_stops,
+                                                      records))
 
                 min_cost_for_vessel = float('inf')
                 vessel_best_insertion_pick_up = None
@@ -274,17 +272,23 @@ class KBestComanyn(TradingCompany):
                     # if len(insertion_points) > 1:
                     #     pass
                     for j in range(i, len(insertion_points)+1):
+                        if (i, j) not in candidates:
+                            continue
+                        self.telemetry.count('candidates')
+                        self.telemetry.count('schedule_copies')
                         new_schedule_vessel_insertion = new_schedule_vessel.copy()
                         # try to add trade to vessel schedule with all possible insertion points
                         new_schedule_vessel_insertion.add_transportation(trade, i, j)
 
                         # if new_schedule_vessel_insertion.verify_schedule_cargo():
                         if new_schedule_vessel_insertion.verify_schedule():
+                            self.telemetry.count('simulations')
                             current_cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
                                 vessel,
                                 new_schedule_vessel_insertion.get_simple_schedule(),
                                 start_time,
-                                headquarters
+                                headquarters,
+                                horizon=self.planning_horizon
                             )
                             if current_cost < min_cost_for_vessel:
                                 min_cost_for_vessel = current_cost
@@ -328,62 +332,72 @@ class KBestComanyn(TradingCompany):
         k_best_schedules = []
         kbest = self.k_best
         # shuffle the trades and generate kbest schedules
-        for k in range(kbest):
-            random.shuffle(trades)
-            schedules = {}
-            schedule = self.kbest_schedule(trades, self._fleet, schedules, self._headquarters)
-            if len(schedule) > 0:
-                k_best_schedules.append(schedule)
-            if len(schedule) == 0:
-                pass
-            time_end = time.time()
-            # if time_end - time_start > 3:
-            #     break
+        with self.telemetry.phase('sampling'):
+            candidate_vessels = self.candidate_vessels(trades, start_time)
+            records = TradeRecords(trades, self._fleet)
+            for k in range(kbest):
+                random.shuffle(trades)
+                schedules = {}
+                with self.telemetry.span('sample', index=k, trades=len(trades)):
+                    schedule = self.kbest_schedule(trades, self._fleet, schedules, self._headquarters,
+                                                   candidate_vessels, records)
+                if len(schedule) > 0:
+                    k_best_schedules.append(schedule)
+                if len(schedule) == 0:
+                    pass
+                time_end = time.time()
+                # if time_end - time_start > 3:
+                #     break
         # print(f"Time taken: {time_end - time_start} seconds")
 
-        # First, find the minimum cost schedule, bid based on the minimum cost schedule
-        min_cost = float('inf')
-        min_cost_schedule_index = -1
-        for k, k_schedule in enumerate(k_best_schedules):
-            schedule_total_cost = 0
-            # for vessel, schedule in k_schedule.items():
-            #     cost, idle_time, pickup, dropoff = simulate_schedule_cost(vessel, schedule.get_simple_schedule(), start_time, self._headquarters)
-            #     schedule_total_cost += cost
-            for vessel in self._fleet:
-                if vessel in k_schedule:
-                    schedule = k_schedule[vessel]
-                    cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
-                        vessel,
-                        schedule.get_simple_schedule(),
-                        start_time,
-                        self._headquarters)
-                else:
-                    cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
-                        vessel,
-                        [],
-                        start_time,
-                        self._headquarters)
-                schedule_total_cost += cost
-            # Track the minimum cost schedule
-            if schedule_total_cost < min_cost:
-                min_cost = schedule_total_cost
-                min_cost_schedule_index = k
+        with self.telemetry.phase('aggregation'):
+            # First, find the minimum cost schedule, bid based on the minimum cost schedule
+            min_cost = float('inf')
+            min_cost_schedule_index = -1
+            for k, k_schedule in enumerate(k_best_schedules):
+                schedule_total_cost = 0
+                # for vessel, schedule in k_schedule.items():
+                #     cost, idle_time, pickup, dropoff = simulate_schedule_cost(vessel, schedule.get_simple_schedule(), start_time, self._headquarters)
+                #     schedule_total_cost += cost
+                for vessel in self._fleet:
+                    self.telemetry.count('simulations')
+                    if vessel in k_schedule:
+                        schedule = k_schedule[vessel]
+                        cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
+                            vessel,
+                            schedule.get_simple_schedule(),
+                            start_time,
+                            self._headquarters,
+                            horizon=self.planning_horizon)
+                    else:
+                        cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
+                            vessel,
+                            [],
+                            start_time,
+                            self._headquarters,
+                            horizon=self.planning_horizon)
+                    schedule_total_cost += cost
+                # Track the minimum cost schedule
+                if schedule_total_cost < min_cost:
+                    min_cost = schedule_total_cost
+                    min_cost_schedule_index = k
 
         # Now calculate costs only for trades in the minimum cost schedule
-        if min_cost_schedule_index >= 0:  # Ensure we found a valid schedule
-            min_cost_schedule = k_best_schedules[min_cost_schedule_index]
+        with self.telemetry.phase('pricing'):
+            if min_cost_schedule_index >= 0:  # Ensure we found a valid schedule
+                min_cost_schedule = k_best_schedules[min_cost_schedule_index]
             
-            for vessel, schedule in min_cost_schedule.items():
-                for trade in schedule.get_scheduled_trades():
-                    loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
-                    unloading_cost = vessel.get_unloading_consumption(loading_time)
-                    loading_cost = vessel.get_loading_consumption(loading_time)
-                    travel_distance = self._headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-                    travel_time = vessel.get_travel_time(travel_distance)
-                    travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
-                    trade_cost = loading_cost + unloading_cost + travel_cost
-                    costs[trade] = trade_cost * self._profit_factor
-                    scheduled_trades.append(trade)
+                for vessel, schedule in min_cost_schedule.items():
+                    for trade in schedule.get_scheduled_trades():
+                        loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
+                        unloading_cost = vessel.get_unloading_consumption(loading_time)
+                        loading_cost = vessel.get_loading_consumption(loading_time)
+                        travel_distance = self._headquarters.get_network_distance(trade.origin_port, trade.destination_port)
+                        travel_time = vessel.get_travel_time(travel_distance)
+                        travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
+                        trade_cost = loading_cost + unloading_cost + travel_cost
+                        costs[trade] = trade_cost * self._profit_factor
+                        scheduled_trades.append(trade)
 
         print(f"Minimum schedule cost: {min_cost}")
         print(f"Number of trades in minimum cost schedule: {len(costs)}")
@@ -400,36 +414,47 @@ class KBestComanyn(TradingCompany):
         k_best_schedules = []
         kbest = self.k_best
         start_time = trades[0].time
-        for k in range(kbest):
-            random.shuffle(trades)
-            schedules = {}
-            schedule = self.kbest_schedule(trades, self._fleet, schedules, self._headquarters)
-            if len(schedule) > 0:
-                k_best_schedules.append(schedule)
+        with self.telemetry.phase('sampling'):
+            candidate_vessels = self.candidate_vessels(trades, start_time)
+            records = TradeRecords(trades, self._fleet)
+            for k in range(kbest):
+                random.shuffle(trades)
+                schedules = {}
+                with self.telemetry.span('sample', index=k, trades=len(trades)):
+                    schedule = self.kbest_schedule(trades, self._fleet, schedules, self._headquarters,
+                                                   candidate_vessels, records)
+                if len(schedule) > 0:
+                    k_best_schedules.append(schedule)
             
-        # choose the minimum cost schedule
-        min_cost = float('inf')
-        min_cost_schedule_index = -1
-        for k, k_schedule in enumerate(k_best_schedules):
-            schedule_total_cost = 0
-            for vessel, schedule in k_schedule.items():
-                cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(vessel, schedule.get_simple_schedule(), start_time, self._headquarters)
-                schedule_total_cost += cost
+        with self.telemetry.phase('aggregation'):
+            # choose the minimum cost schedule
+            min_cost = float('inf')
+            min_cost_schedule_index = -1
+            for k, k_schedule in enumerate(k_best_schedules):
+                schedule_total_cost = 0
+                for vessel, schedule in k_schedule.items():
+                    self.telemetry.count('simulations')
+                    cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(vessel, schedule.get_simple_schedule(), start_time, self._headquarters,
+                                                                                  horizon=self.planning_horizon)
+                    schedule_total_cost += cost
             
-            if schedule_total_cost < min_cost:
-                min_cost = schedule_total_cost
-                min_cost_schedule_index = k
+                if schedule_total_cost < min_cost:
+                    min_cost = schedule_total_cost
+                    min_cost_schedule_index = k
 
-        if min_cost_schedule_index >= 0:
-            schedules = k_best_schedules[min_cost_schedule_index]
+            if min_cost_schedule_index >= 0:
+                schedules = k_best_schedules[min_cost_schedule_index]
                 
         return ScheduleProposal(schedules, scheduled_trades, costs)
 
     def receive(self, contracts, auction_ledger=None, *args, **kwargs):
         trades = [one_contract.trade for one_contract in contracts]
         # scheduling_proposal = self.propose_schedules(trades)
-        scheduling_proposal = self.schedule_trades(trades)
-        _ = self.apply_schedules(scheduling_proposal.schedules)
+        with self.telemetry.decision('receive', len(trades)):
+            with self.telemetry.phase('schedule_trades'):
+                scheduling_proposal = self.schedule_trades(trades)
+            with self.telemetry.phase('apply_schedules'):
+                _ = self.apply_schedules(scheduling_proposal.schedules)
 
 
 
@@ -10,9 +10,13 @@ import attrs
 from marshmallow import fields
 import time
 import random
-from utils import simulate_schedule_cost_allocated_shared_arrival, simulate_schedule_cost, cal_efficiency
+from utils import simulate_schedule_cost_allocated_shared_arrival, simulate_schedule_cost, cal_efficiency, \
+    reachability_index, insertion_candidates, TradeRecords, schedule_events, port_visits, insert_trade_events, \
+    split_rolling_horizon, PLANNING_HORIZON, SPECULATION_DEADLINE, RECEIVE_DEADLINE, AnnouncedAuction, \
+    take_announced_auction
 random.seed(1)
 from greedy import GreedyComanyn # Added alias if needed
+from telemetry import DecisionTelemetry
 
 def get_costs_for_schedule(schedule, fleets, headquarters, start_time):
     schedule_total_cost = 0
@@ -37,7 +41,8 @@ class KBestBidComanyn(TradingCompany):
     def __init__(self, fleet, name, profit_factor=1.65, profit_factor_2=1.2, 
                  avg_w=0.7, cal_efficiency=False, schedule_with_greedy=False,
                  efficiency_selection_percentage=0.8, trade_frequency_threshold=0.5, 
-                 k_best=110):
+                 k_best=110, insertion_detour_hours=None, insertion_nearest_stops=None,
+                 planning_horizon=PLANNING_HORIZON, rolling_horizon=None, speculative_samples=0):
         super().__init__(fleet, name)
         # --- hyper-parameters ---
         self._profit_factor = profit_factor
@@ -48,10 +53,26 @@ class KBestBidComanyn(TradingCompany):
         self.efficiency_selection_percentage = efficiency_selection_percentage
         self.trade_frequency_threshold = trade_frequency_threshold
         self.k_best = k_best
+        # spatial filter of the insertion positions, see utils.insertion_candidates; None keeps all positions
+        self.insertion_detour_hours = insertion_detour_hours
+        self.insertion_nearest_stops = insertion_nearest_stops
+        # hours after the auction until which the idle time of the vessels is charged
+        self.planning_horizon = planning_horizon
+        # only trades picked up within rolling_horizon hours are sampled, the later ones are priced by their
+        # absolute cost and appended to the plan; None samples all trades
+        self.rolling_horizon = rolling_horizon
+        # k-best samples planned in pre_inform for inform to reuse; 0 plans none. The samples are only reused when
+        # no vessel changed between the announcement and the auction, which is rare in a live simulation
+        self.speculative_samples = speculative_samples
         # --- end of hyper-parameters ---
         # random.seed(1)
         self.total_cost_until_now = 0
         self.total_idle_time = 0
+        self.telemetry = DecisionTelemetry(name)
+        # auctions announced in pre_inform by start time, see utils.AnnouncedAuction
+        self._announced_auctions = {}
+        # wall time at which the current receive decision started, see receive_time_left
+        self._receive_start = None
 
     @attrs.define
     class Data(TradingCompany.Data):
@@ -63,6 +84,11 @@ class KBestBidComanyn(TradingCompany):
         efficiency_selection_percentage: float = 0.8
         trade_frequency_threshold: float = 0.5
         k_best: int = 110
+        insertion_detour_hours: float = None
+        insertion_nearest_stops: int = None
+        planning_horizon: float = PLANNING_HORIZON
+        rolling_horizon: float = None
+        speculative_samples: int = 0
 
         class Schema(TradingCompany.Data.Schema):
             profit_factor = fields.Float(default=1.65)
@@ -73,12 +99,103 @@ class KBestBidComanyn(TradingCompany):
             efficiency_selection_percentage = fields.Float(default=0.8)
             trade_frequency_threshold = fields.Float(default=0.5)
             k_best = fields.Integer(default=110)
+            insertion_detour_hours = fields.Float(default=None, allow_none=True)
+            insertion_nearest_stops = fields.Integer(default=None, allow_none=True)
+            planning_horizon = fields.Float(default=PLANNING_HORIZON)
+            rolling_horizon = fields.Float(default=None, allow_none=True)
+            speculative_samples = fields.Integer(default=0)
 
         # class Schema(TradingCompany.Data.Schema):
         #     profit_factor = fields.Float(default=1.65)
 
-
-    def kbest_schedule(self, trades, fleets, headquarters, payment_per_trade=None):
+    def pre_inform(self, trades, time):
+        with self.telemetry.decision('pre_inform', len(trades)):
+            with self.telemetry.phase('speculation'):
+                self.prepare_auction(trades)
+
+    def inform(self, trades, *args, **kwargs):
+        with self.telemetry.decision('inform', len(trades)):
+            return super().inform(trades, *args, **kwargs)
+
+    def candidate_vessels(self, trades, start_time, records=None):
+        """Reachability index of the auction, shared by all k-best samples"""
+        candidate_vessels = reachability_index(trades, self._fleet, self._headquarters, start_time, records)
+        self.telemetry.count('pruned_vessels', sum(len(self._fleet) - len(vessels)
+                                                   for vessels in candidate_vessels.values()))
+        return candidate_vessels
+
+    def prepare_auction(self, trades):
+        """
+        Speculative planning of an announced auction: the trade records, kept for inform in any case, and with
+        speculative_samples the reachability index and a batch of k-best samples of the announced trades on the
+        current fleet. The batch is bounded by SPECULATION_DEADLINE seconds as a whole.
+        """
+        if len(trades) == 0:
+            return
+        start_time = trades[0].time
+        time_start = time.time()
+        announced = AnnouncedAuction(trades, start_time, self._fleet, self._headquarters)
+        self._announced_auctions[start_time] = announced
+        if self.speculative_samples == 0:
+            return
+        announced.candidate_vessels = self.candidate_vessels(announced.trades, start_time, announced.records)
+        sampled_trades, _ = self.split_trades(list(announced.trades), start_time)
+        for k in range(self.speculative_samples if sampled_trades else 0):
+            remaining = SPECULATION_DEADLINE - (time.time() - time_start)
+            if remaining <= 0:
+                break
+            random.shuffle(sampled_trades)
+            with self.telemetry.span('speculative_sample', index=k, trades=len(sampled_trades)):
+                schedule = self.kbest_schedule(sampled_trades, self._fleet, self._headquarters,
+                                               candidate_vessels=announced.candidate_vessels,
+                                               records=announced.records, time_limit=remaining)
+            # a sample cut off by the deadline is incomplete and is not kept
+            if time.time() - time_start > SPECULATION_DEADLINE:
+                break
+            announced.samples.append(schedule)
+
+    def announced_inputs(self, trades, start_time):
+        """
+        The inputs of the auction sampling, taken from pre_inform as far as they still hold.
+        Output: (records, reachability index, speculative k-best samples)
+        """
+        announced = take_announced_auction(self._announced_auctions, trades, start_time)
+        if announced is None:
+            records = TradeRecords(trades, self._fleet)
+            return records, self.candidate_vessels(trades, start_time, records), []
+        if announced.candidate_vessels is None or not announced.fleet_unchanged(self._fleet):
+            # planned samples that did not survive until the auction, their ratio to the reused ones is the waste
+            self.telemetry.count('discarded_speculative_samples', len(announced.samples))
+            return announced.records, self.candidate_vessels(trades, start_time, announced.records), []
+        samples = announced.samples if announced.same_trades(trades) else []
+        self.telemetry.count('speculative_samples', len(samples))
+        self.telemetry.count('discarded_speculative_samples', len(announced.samples) - len(samples))
+        return announced.records, announced.candidate_vessels, samples
+
+    def split_trades(self, trades, start_time):
+        """
+        Rolling-horizon split of the auction trades into the sampled ones and those approximated by their absolute
+        cost. Without a rolling horizon every trade is sampled.
+        """
+        if self.rolling_horizon is None:
+            return trades, []
+        sampled_trades, approximated_trades = split_rolling_horizon(trades, start_time, self.rolling_horizon)
+        self.telemetry.count('approximated_trades', len(approximated_trades))
+        return sampled_trades, approximated_trades
+
+    def absolute_cost(self, trade, records):
+        """Cost of the trade OD alone with the first vessel of the fleet: laden travel, loading and unloading"""
+        record = records[trade]
+        travel_distance = records.distance(self._headquarters, record.origin, record.destination)
+        travel_time = self._fleet[0].get_travel_time(travel_distance)
+        travel_cost = self._fleet[0].get_laden_consumption(travel_time, self._fleet[0].speed)
+        loading_time = self._fleet[0].get_loading_time(record.cargo_type, record.amount)
+        loading_cost = self._fleet[0].get_loading_consumption(loading_time)
+        unloading_cost = self._fleet[0].get_unloading_consumption(loading_time)
+        return loading_cost + unloading_cost + travel_cost
+
+    def kbest_schedule(self, trades, fleets, headquarters, payment_per_trade=None, candidate_vessels=None,
+                       records=None, schedules=None, time_limit=49):
         # Add timer to track execution time
         start_execution_time = time.time()
         
@@ -86,12 +203,16 @@ class KBestBidComanyn(TradingCompany):
         best_insertion_pickup_index = None
         best_insertion_dropoff_index = None
         start_time = trades[0].time
-        # This dictionary holds the schedules *being built* during this specific function call only.
-        schedules = {}
-        
+        if records is None:
+            records = TradeRecords()
+        # This dictionary holds the schedules *being built* during this specific function call only,
+        # starting from the given plan if there is one.
+        schedules = {} if schedules is None else dict(schedules)
+        timed_out = False
+
         for t, trade in enumerate(trades):
             # Check if time limit is about to be exceeded
-            if time.time() - start_execution_time > 49:  # Use 49 to leave room for cleanup
+            if timed_out or time.time() - start_execution_time > time_limit:  # 49 by default to leave room for cleanup
                 print(f"Time limit reached after processing {t}/{len(trades)} trades")
                 break
             
@@ -100,14 +221,22 @@ class KBestBidComanyn(TradingCompany):
             current_best_insertion_pickup = None
             current_best_insertion_dropoff = None
 
-            for v, vessel in enumerate(fleets):
+            # only the vessels of the reachability index can serve the trade
+            for v, vessel in enumerate(fleets if candidate_vessels is None else candidate_vessels[trade]):
                 # Check time again for nested loop
                 # if time.time() - start_execution_time > 50:
                 #     break
                 
                 current_vessel_schedule = schedules.get(vessel, vessel.schedule)
                 new_schedule_vessel = current_vessel_schedule.copy()
+                self.telemetry.count('schedule_copies')
                 insertion_points = new_schedule_vessel.get_insertion_points()
+                candidates = set(insertion_candidates(new_schedule_vessel, trade, vessel, headquarters,
+                                                      self.insertion_detour_hours, self.insertion_nearest_stops,
+                                                      records))
+                # the port visits of every insertion are updated from those of the current schedule
+                events = schedule_events(new_schedule_vessel, records)
+                visits = port_visits(events)
 
                 min_cost_for_vessel = float('inf')
                 vessel_best_insertion_pick_up = None
@@ -116,8 +245,13 @@ class KBestBidComanyn(TradingCompany):
                 for i in range(1, len(insertion_points)+1):
                     for j in range(i, len(insertion_points)+1):
                         # Check time in the innermost loop
-                        if time.time() - start_execution_time > 50:
+                        if time.time() - start_execution_time > time_limit:
+                            timed_out = True
                             break
+                        if (i, j) not in candidates:
+                            continue
+                        self.telemetry.count('candidates')
+                        self.telemetry.count('schedule_copies')
                         try:
                             new_schedule_vessel_insertion = new_schedule_vessel.copy()
                             new_schedule_vessel_insertion.add_transportation(trade, i, j)
@@ -128,13 +262,20 @@ class KBestBidComanyn(TradingCompany):
                         if new_schedule_vessel_insertion.verify_schedule():
                             if len(new_schedule_vessel_insertion.get_simple_schedule()) % 2 != 0:
                                 continue
+                            self.telemetry.count('simulations')
+                            inserted_events, inserted_visits = insert_trade_events(events, visits, records[trade],
+                                                                                   i, j)
                             try:
                                 current_cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
                                     vessel,
                                     new_schedule_vessel_insertion,
                                     start_time,
                                     headquarters,
-                                    payment_per_trade
+                                    payment_per_trade,
+                                    records,
+                                    inserted_events,
+                                    inserted_visits,
+                                    self.planning_horizon
                                 )
                             except Exception as e:
                                 print(f"company {self.__class__.__name__} Error simulate schedule cost: {e}")
@@ -143,15 +284,17 @@ class KBestBidComanyn(TradingCompany):
                                 min_cost_for_vessel = current_cost
                                 vessel_best_insertion_pick_up = i
                                 vessel_best_insertion_drop_off = j
-
-                # if time.time() - start_execution_time > 50:
-                #     break
+                    if timed_out:
+                        break
 
                 if min_cost_for_vessel < min_cost_for_all_vessels:
                     min_cost_for_all_vessels = min_cost_for_vessel
                     current_best_vessel = vessel
                     current_best_insertion_pickup = vessel_best_insertion_pick_up
                     current_best_insertion_dropoff = vessel_best_insertion_drop_off
+                # the best insertion found so far is still used, the remaining vessels are not searched
+                if timed_out:
+                    break
 
             if current_best_vessel is not None:
                 best_vessel = current_best_vessel
@@ -163,7 +306,7 @@ class KBestBidComanyn(TradingCompany):
 
         # Final check of execution time
         execution_time = time.time() - start_execution_time
-        if execution_time > 50:
+        if execution_time > time_limit:
             print(f"Warning: kbest_schedule exceeded time limit: {execution_time:.2f} seconds")
         
         return schedules
@@ -178,81 +321,89 @@ class KBestBidComanyn(TradingCompany):
         pick_up_time = {}
         drop_off_time = {}
         start_time = trades[0].time
-        time_start = time.time()
         k_best_schedules = []
         k_best_schedule_costs = []
         kbest = self.k_best
         # shuffle the trades and generate kbest schedules
         time_start = time.time()
-        for k in range(kbest):
-            random.shuffle(trades)
-            # schedules = {}
-            schedule = self.kbest_schedule(trades, self._fleet, self._headquarters)
-            # record the cost of the schedule
-            if len(schedule) > 0:
-                k_best_schedules.append(schedule)
-                # optional: calculate the cost of the schedule
-                # schedule_cost = get_costs_for_schedule(schedule, self._fleet, self._headquarters, start_time)
-                # k_best_schedule_costs.append(schedule_cost)
-
-            time_end = time.time()
-            if time_end - time_start > 55: # 50 seconds timeout
-                break
-        time_end = time.time()
-        print(f"Time taken: {time_end - time_start} seconds")
+        with self.telemetry.phase('sampling'):
+            records, candidate_vessels, speculative_samples = self.announced_inputs(trades, start_time)
+            sampled_trades, approximated_trades = self.split_trades(trades, start_time)
+            # the samples planned in pre_inform count towards k_best, inform only tops them up
+            k_best_schedules = [schedule for schedule in speculative_samples if len(schedule) > 0]
+            for k in range(len(speculative_samples), kbest if sampled_trades else 0):
+                random.shuffle(sampled_trades)
+                # schedules = {}
+                with self.telemetry.span('sample', index=k, trades=len(sampled_trades)) as attributes:
+                    schedule = self.kbest_schedule(sampled_trades, self._fleet, self._headquarters,
+                                                   candidate_vessels=candidate_vessels, records=records)
+                    attributes['vessels_used'] = len(schedule)
+                # record the cost of the schedule
+                if len(schedule) > 0:
+                    k_best_schedules.append(schedule)
+                    # optional: calculate the cost of the schedule
+                    # schedule_cost = get_costs_for_schedule(schedule, self._fleet, self._headquarters, start_time)
+                    # k_best_schedule_costs.append(schedule_cost)
+
+                time_end = time.time()
+                if time_end - time_start > 55: # 50 seconds timeout
+                    break
 
         # ----- optional: calculate the efficiency of the k best schedules and sort them in descending order -----
         # calculate the efficiency of the k best schedules and sort them in descending order
-        if self.cal_efficiency:
-            k_efficiency = []
-            for k_schedule in k_best_schedules:
-                efficiency = cal_efficiency(k_schedule, self._headquarters, start_time)
-                k_efficiency.append(efficiency)
-            k_best_schedules = [x for _, x in sorted(zip(k_efficiency, k_best_schedules), key=lambda pair: pair[0], reverse=True)]
-            # get the minimum cost schedule
-            # if len(k_best_schedule_costs) != 0:
-            #     min_cost_schedule_index = k_best_schedule_costs.index(min(k_best_schedule_costs))
-            #     schedules = k_best_schedules[min_cost_schedule_index]
-            # -- bid based on average cost of k best schedules
-            # select the first 80% of the schedules according to the efficiency
-            k_best_schedules = k_best_schedules[:int(len(k_best_schedules)*self.efficiency_selection_percentage)]
+        with self.telemetry.phase('aggregation'):
+            if self.cal_efficiency:
+                k_efficiency = []
+                for k_schedule in k_best_schedules:
+                    efficiency = cal_efficiency(k_schedule, self._headquarters, start_time, records,
+                                                self.planning_horizon)
+                    k_efficiency.append(efficiency)
+                k_best_schedules = [x for _, x in sorted(zip(k_efficiency, k_best_schedules), key=lambda pair: pair[0], reverse=True)]
+                # get the minimum cost schedule
+                # if len(k_best_schedule_costs) != 0:
+                #     min_cost_schedule_index = k_best_schedule_costs.index(min(k_best_schedule_costs))
+                #     schedules = k_best_schedules[min_cost_schedule_index]
+                # -- bid based on average cost of k best schedules
+                # select the first 80% of the schedules according to the efficiency
+                k_best_schedules = k_best_schedules[:int(len(k_best_schedules)*self.efficiency_selection_percentage)]
         # ----- end of optional -----
 
         # bid based on the average cost of the k best schedules
         if len(k_best_schedules) != 0:
-            trade_frequencies, trade_avg_costs, rejected_trades = self.calculate_trade_frequency_and_avg_cost(
-                k_best_schedules,
-                len(k_best_schedules),
-                self.trade_frequency_threshold,
-                start_time)
-
-            for trade, avg_cost in trade_avg_costs.items():
-                # estimate the absolute cost of the trade OD
-                travel_distance = self._headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-                travel_time = self._fleet[0].get_travel_time(travel_distance)
-                travel_cost = self._fleet[0].get_laden_consumption(travel_time, self._fleet[0].speed)
-                loading_time = self._fleet[0].get_loading_time(trade.cargo_type, trade.amount)
-                loading_cost = self._fleet[0].get_loading_consumption(loading_time)
-                unloading_cost = self._fleet[0].get_unloading_consumption(loading_time)
-                absolute_cost = loading_cost + unloading_cost + travel_cost
-                bid_price = self.avg_w * avg_cost + (1 - self.avg_w) * absolute_cost
-                if bid_price < absolute_cost:
-                    costs[trade] = bid_price * self._profit_factor
+            with self.telemetry.phase('aggregation'):
+                trade_frequencies, trade_avg_costs, rejected_trades = self.calculate_trade_frequency_and_avg_cost(
+                    k_best_schedules,
+                    len(k_best_schedules),
+                    self.trade_frequency_threshold,
+                    start_time,
+                    records)
+
+            with self.telemetry.phase('pricing'):
+                for trade, avg_cost in trade_avg_costs.items():
+                    # estimate the absolute cost of the trade OD
+                    absolute_cost = self.absolute_cost(trade, records)
+                    bid_price = self.avg_w * avg_cost + (1 - self.avg_w) * absolute_cost
+                    if bid_price < absolute_cost:
+                        costs[trade] = bid_price * self._profit_factor
+                    else:
+                        costs[trade] = bid_price * self._profit_factor_2
+                    scheduled_trades.append(trade)
+
+                # for the trades that are not scheduled, bid with high profit factor
+                for trade in rejected_trades:
+                    # calculate the absolute cost of the trade OD
+                    costs[trade] = self.absolute_cost(trade, records) * 10
+                    scheduled_trades.append(trade)
+
+        # the trades beyond the rolling horizon are bid as if every sample planned them at their absolute cost,
+        # unless no vessel can reach them
+        with self.telemetry.phase('pricing'):
+            for trade in approximated_trades:
+                absolute_cost = self.absolute_cost(trade, records)
+                if candidate_vessels[trade]:
+                    costs[trade] = absolute_cost * self._profit_factor_2
                 else:
-                    costs[trade] = bid_price * self._profit_factor_2
-                scheduled_trades.append(trade)
-
-            # for the trades that are not scheduled, bid with high profit factor
-            for trade in rejected_trades:
-                # calculate the absolute cost of the trade OD
-                travel_distance = self._headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-                travel_time = self._fleet[0].get_travel_time(travel_distance)
-                travel_cost = self._fleet[0].get_laden_consumption(travel_time, self._fleet[0].speed)
-                loading_time = self._fleet[0].get_loading_time(trade.cargo_type, trade.amount)
-                loading_cost = self._fleet[0].get_loading_consumption(loading_time)
-                unloading_cost = self._fleet[0].get_unloading_consumption(loading_time)
-                absolute_cost = loading_cost + unloading_cost + travel_cost
-                costs[trade] = absolute_cost * 10
+                    costs[trade] = absolute_cost * 10
                 scheduled_trades.append(trade)
 
         # return ScheduleProposal(schedules, scheduled_trades, costs)
@@ -264,23 +415,41 @@ class KBestBidComanyn(TradingCompany):
         for one_contract in contracts:
             payment_per_trade[one_contract.trade] = one_contract.payment
 
+        self._receive_start = time.time()
+        with self.telemetry.decision('receive', len(trades)):
+            with self.telemetry.phase('schedule_trades'):
+                scheduling_proposal = self.plan_received_trades(trades, payment_per_trade)
+
+            # Apply the schedules using the KBestBidComanyn's own apply_schedules method
+            with self.telemetry.phase('apply_schedules'):
+                _ = self.apply_schedules(scheduling_proposal.schedules)
+
+    def receive_time_left(self):
+        """Seconds left of the current receive decision until RECEIVE_DEADLINE"""
+        if self._receive_start is None:
+            return RECEIVE_DEADLINE
+        return RECEIVE_DEADLINE - (time.time() - self._receive_start)
+
+    def plan_received_trades(self, trades, payment_per_trade):
         if not self.schedule_with_greedy:
             scheduling_proposal = self.schedule_trades(trades, payment_per_trade)
         else:
             # --- Use GreedyComanyn's propose_schedules logic ---
             # 1. Create a temporary instance of GreedyComanyn using this company's fleet/hq/etc.
             #    (Assumes __init__ signatures are compatible or GreedyComanyn doesn't need specific state)
-            temp_greedy_company = GreedyComanyn(self._fleet, self.name, self._profit_factor)
+            temp_greedy_company = GreedyComanyn(self._fleet, self.name, self._profit_factor,
+                                                self.insertion_detour_hours, self.insertion_nearest_stops,
+                                                self.planning_horizon)
             # 2. Set up the headquarters for the temporary instance if needed (standard pattern)
             temp_greedy_company._headquarters = self._headquarters
+            temp_greedy_company.telemetry = self.telemetry
             # 3. Call the propose_schedules method on the temporary instance
             scheduling_proposal = temp_greedy_company.propose_schedules(trades, payment_per_trade)
             # --- End of Greedy logic usage ---
+        return scheduling_proposal
 
-        # Apply the schedules using the KBestBidComanyn's own apply_schedules method
-        _ = self.apply_schedules(scheduling_proposal.schedules)
-
-    def calculate_trade_frequency_and_avg_cost(self, k_best_schedules, kbest, frequency_threshold, start_time):
+    def calculate_trade_frequency_and_avg_cost(self, k_best_schedules, kbest, frequency_threshold, start_time,
+                                               records=None):
         # Dictionary to track which schedules each trade appears in
         trade_appearances = {}
         # Dictionary to track the total cost for each trade across all appearances
@@ -300,12 +469,15 @@ class KBestBidComanyn(TradingCompany):
                 # Add to the set of trades in this schedule
                 trades_in_schedule.update(scheduled_trades)
                 # Calculate costs for these trades
+                self.telemetry.count('simulations')
                 try:
                     trip_cost, trade_specific_costs, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
                         vessel,
                         schedule,
                         start_time,
-                        self._headquarters)
+                        self._headquarters,
+                        records=records,
+                        horizon=self.planning_horizon)
                 except Exception as e:
                     print(f"Error calculate_trade_frequency_and_avg_cost: {e}")
                     continue
@@ -353,42 +525,64 @@ class KBestBidComanyn(TradingCompany):
         k_best_schedules = []
         kbest = self.k_best
         start_time = trades[0].time
-        for k in range(kbest):
-            random.shuffle(trades)
-            # schedules = {}
-            schedule = self.kbest_schedule(trades, self._fleet, self._headquarters, payment_per_trade)
-            if len(schedule) > 0:
-                k_best_schedules.append(schedule)
-            end_time = time.time()
-            if end_time - start_time > 55:
-                break
-
-        # choose the minimum cost schedule
-        min_cost = float('inf')
-        min_cost_schedule_index = -1
-        for k, k_schedule in enumerate(k_best_schedules):
-            schedule_total_cost = 0
-            for vessel, schedule in k_schedule.items():
-                # cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
-                #     vessel,
-                #     schedule,
-                #     start_time,
-                #     self._headquarters,
-                #     payment_per_trade)    # there is a bug in this function, but for bidding it is ok
-                cost, _, _, _ = simulate_schedule_cost(
-                    vessel,
-                    schedule,
-                    start_time,
-                    self._headquarters,
-                    payment_per_trade)
-                schedule_total_cost += cost
-
-            if schedule_total_cost < min_cost:
-                min_cost = schedule_total_cost
-                min_cost_schedule_index = k
-
-        if min_cost_schedule_index >= 0:    
-            schedules = k_best_schedules[min_cost_schedule_index]
+        with self.telemetry.phase('sampling'):
+            candidate_vessels = self.candidate_vessels(trades, start_time)
+            records = TradeRecords(trades, self._fleet)
+            sampled_trades, approximated_trades = self.split_trades(trades, start_time)
+            for k in range(kbest if sampled_trades else 0):
+                time_left = self.receive_time_left()
+                if time_left <= 0:
+                    break
+                random.shuffle(sampled_trades)
+                # schedules = {}
+                with self.telemetry.span('sample', index=k, trades=len(sampled_trades)):
+                    schedule = self.kbest_schedule(sampled_trades, self._fleet, self._headquarters,
+                                                   payment_per_trade, candidate_vessels, records,
+                                                   time_limit=time_left)
+                # a sample cut off by the deadline is incomplete, it is only kept if there is no other
+                if self.receive_time_left() <= 0 and len(k_best_schedules) > 0:
+                    break
+                if len(schedule) > 0:
+                    k_best_schedules.append(schedule)
+
+        with self.telemetry.phase('aggregation'):
+            # choose the minimum cost schedule
+            min_cost = float('inf')
+            min_cost_schedule_index = -1
+            for k, k_schedule in enumerate(k_best_schedules):
+                schedule_total_cost = 0
+                for vessel, schedule in k_schedule.items():
+                    self.telemetry.count('simulations')
+                    # cost, _, _, _, _ = simulate_schedule_cost_allocated_shared_arrival(
+                    #     vessel,
+                    #     schedule,
+                    #     start_time,
+                    #     self._headquarters,
+                    #     payment_per_trade)    # there is a bug in this function, but for bidding it is ok
+                    cost, _, _, _ = simulate_schedule_cost(
+                        vessel,
+                        schedule,
+                        start_time,
+                        self._headquarters,
+                        payment_per_trade,
+                        records,
+                        self.planning_horizon)
+                    schedule_total_cost += cost
+
+                if schedule_total_cost < min_cost:
+                    min_cost = schedule_total_cost
+                    min_cost_schedule_index = k
+
+            if min_cost_schedule_index >= 0:    
+                schedules = k_best_schedules[min_cost_schedule_index]
+
+        # the trades beyond the rolling horizon are inserted once into the chosen plan, earliest pick up first
+        if approximated_trades:
+            approximated_trades.sort(key=lambda trade: records[trade].earliest_pickup)
+            with self.telemetry.phase('sampling'):
+                schedules = self.kbest_schedule(approximated_trades, self._fleet, self._headquarters,
+                                                payment_per_trade, candidate_vessels, records, schedules,
+                                                time_limit=max(0, self.receive_time_left()))
 
         return ScheduleProposal(schedules, scheduled_trades, costs)
 
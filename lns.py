@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 10:12
+# @Author  : mmai
+# @FileName: lns
+# @Software: PyCharm
+
+from mable.examples.companies import ScheduleProposal
+import attrs
+from marshmallow import fields
+import time
+import random
+from loguru import logger
+from utils import simulate_schedule_cost, insert_trades_by_event_times, insertion_candidates, TradeRecords, \
+    PLANNING_HORIZON
+from kbest_bid import KBestBidComanyn
+from Agents import Solver
+
+
+class LNSComanyn(KBestBidComanyn):
+    """
+    Large neighbourhood search on top of the k-best (or greedy, see schedule_with_greedy) plan.
+    The incumbent plan is improved by repeatedly freeing a neighbourhood, either a few vessels or a time slice
+    of the received trades, and re-optimizing it exactly with a small Solver model under a short time limit.
+    """
+    def __init__(self, fleet, name, profit_factor=1.65, profit_factor_2=1.2,
+                 avg_w=0.7, cal_efficiency=False, schedule_with_greedy=False,
+                 efficiency_selection_percentage=0.8, trade_frequency_threshold=0.5,
+                 k_best=110, lns_iterations=20, lns_vessels=2, lns_time_slice=120,
+                 lns_time_limit=2, lns_time_budget=10, insertion_detour_hours=None, insertion_nearest_stops=None,
+                 planning_horizon=PLANNING_HORIZON, rolling_horizon=None, speculative_samples=0):
+        super().__init__(fleet, name, profit_factor, profit_factor_2, avg_w, cal_efficiency, schedule_with_greedy,
+                         efficiency_selection_percentage, trade_frequency_threshold, k_best,
+                         insertion_detour_hours=insertion_detour_hours,
+                         insertion_nearest_stops=insertion_nearest_stops,
+                         planning_horizon=planning_horizon, rolling_horizon=rolling_horizon,
+                         speculative_samples=speculative_samples)
+        # --- hyper-parameters ---
+        self.lns_iterations = lns_iterations    # maximum number of neighbourhoods per auction
+        self.lns_vessels = lns_vessels          # number of vessels freed by a vessel neighbourhood
+        self.lns_time_slice = lns_time_slice    # width of a time slice neighbourhood (earliest pick up)
+        self.lns_time_limit = lns_time_limit    # solver time limit per neighbourhood in seconds
+        self.lns_time_budget = lns_time_budget  # total time for the search in seconds
+        # --- end of hyper-parameters ---
+
+    @attrs.define
+    class Data(KBestBidComanyn.Data):
+        lns_iterations: int = 20
+        lns_vessels: int = 2
+        lns_time_slice: float = 120
+        lns_time_limit: float = 2
+        lns_time_budget: float = 10
+
+        class Schema(KBestBidComanyn.Data.Schema):
+            lns_iterations = fields.Integer(default=20)
+            lns_vessels = fields.Integer(default=2)
+            lns_time_slice = fields.Float(default=120)
+            lns_time_limit = fields.Float(default=2)
+            lns_time_budget = fields.Float(default=10)
+
+    def plan_received_trades(self, trades, payment_per_trade):
+        scheduling_proposal = super().plan_received_trades(trades, payment_per_trade)
+        if len(trades) == 0:
+            return scheduling_proposal
+        # the search only gets what the k-best planning left of the receive decision
+        time_budget = min(self.lns_time_budget, self.receive_time_left())
+        if time_budget < self.lns_time_limit:
+            self.telemetry.count('lns_skipped')
+            return scheduling_proposal
+        with self.telemetry.phase('lns'):
+            schedules = self.lns_schedule(trades, dict(scheduling_proposal.schedules), time_budget)
+        return ScheduleProposal(schedules, scheduling_proposal.scheduled_trades, scheduling_proposal.costs)
+
+    def evaluate(self, vessels, schedules, trades, start_time, records=None):
+        """
+        Score of a set of vessel schedules: (number of received trades served, total cost).
+        """
+        served = 0
+        total_cost = 0
+        for vessel in vessels:
+            schedule = schedules.get(vessel, vessel.schedule)
+            served += sum(1 for trade in schedule.get_scheduled_trades() if trade in trades)
+            cost, _, _, _ = simulate_schedule_cost(vessel, schedule, start_time, self._headquarters, records=records,
+                                                   horizon=self.planning_horizon)
+            total_cost += cost
+        return served, total_cost
+
+    def choose_neighbourhood(self, iteration, trades, assigned_vessel):
+        """
+        Alternate between freeing a few random vessels and freeing a time slice of the received trades.
+        Freeing a vessel frees all received trades on it, so a time slice frees the vessels serving it.
+        Unserved received trades in the neighbourhood are freed as well.
+        Output: (vessels, freed trades)
+        """
+        if iteration % 2 == 0:
+            vessels = random.sample(self._fleet, min(self.lns_vessels, len(self._fleet)))
+            freed_trades = [trade for trade in trades
+                            if assigned_vessel.get(trade) in vessels or trade not in assigned_vessel]
+        else:
+            slice_start = random.choice(trades).time_window[0]
+            slice_trades = [trade for trade in trades
+                            if slice_start <= trade.time_window[0] <= slice_start + self.lns_time_slice]
+            vessels = []
+            for trade in slice_trades:
+                if trade in assigned_vessel and assigned_vessel[trade] not in vessels:
+                    vessels.append(assigned_vessel[trade])
+            # at least one vessel outside the slice to move trades to
+            other_vessels = [vessel for vessel in self._fleet if vessel not in vessels]
+            if len(vessels) < self.lns_vessels and other_vessels:
+                vessels.append(random.choice(other_vessels))
+            freed_trades = [trade for trade in trades
+                            if assigned_vessel.get(trade) in vessels
+                            or (trade not in assigned_vessel and trade in slice_trades)]
+        return vessels, freed_trades
+
+    def repair_insert(self, trade, vessels, schedules, start_time, records=None):
+        """
+        Insert the trade at the cheapest feasible position among the vessels, if there is one.
+        """
+        min_cost = float('inf')
+        best_schedule = None
+        best_vessel = None
+        for vessel in vessels:
+            current_vessel_schedule = schedules.get(vessel, vessel.schedule)
+            for i, j in insertion_candidates(current_vessel_schedule, trade, vessel, self._headquarters,
+                                             records=records):
+                new_schedule = current_vessel_schedule.copy()
+                try:
+                    new_schedule.add_transportation(trade, i, j)
+                except ValueError:
+                    continue
+                if not new_schedule.verify_schedule():
+                    continue
+                cost, _, _, _ = simulate_schedule_cost(vessel, new_schedule, start_time, self._headquarters,
+                                                       records=records, horizon=self.planning_horizon)
+                if cost < min_cost:
+                    min_cost = cost
+                    best_schedule = new_schedule
+                    best_vessel = vessel
+        if best_vessel is not None:
+            schedules[best_vessel] = best_schedule
+        return best_vessel
+
+    def lns_schedule(self, trades, schedules, time_budget=None):
+        """Improve the received trades' part of the plan within time_budget seconds (lns_time_budget if None)"""
+        if time_budget is None:
+            time_budget = self.lns_time_budget
+        start_time = trades[0].time
+        time_start = time.time()
+        records = TradeRecords(trades, self._fleet)
+        improvements = 0
+        for iteration in range(self.lns_iterations):
+            if time.time() - time_start + self.lns_time_limit > time_budget:
+                break
+            assigned_vessel = {}
+            for vessel, schedule in schedules.items():
+                for trade in schedule.get_scheduled_trades():
+                    assigned_vessel[trade] = vessel
+            vessels, freed_trades = self.choose_neighbourhood(iteration, trades, assigned_vessel)
+            if len(vessels) == 0 or len(freed_trades) == 0:
+                continue
+
+            # exact re-optimization of the neighbourhood
+            solver = Solver(self._headquarters, time_limit=self.lns_time_limit)
+            try:
+                solution = solver.solve(freed_trades, vessels)
+            except Exception as e:
+                logger.warning(f"company {self.__class__.__name__} LNS solve failed: {e}")
+                continue
+            if solution is None:
+                continue
+
+            # rebuild the vessel schedules from the committed schedules and the solved times
+            pickup_times = {freed_trades[t]: solution['pickup_times'][t] for t in range(len(freed_trades))}
+            dropoff_times = {freed_trades[t]: solution['dropoff_times'][t] for t in range(len(freed_trades))}
+            candidate_schedules = {}
+            inserted_trades = []
+            for v, vessel in enumerate(vessels):
+                vessel_trades = [freed_trades[t] for t, v_assigned in solution['assignments'].items() if v_assigned == v]
+                candidate_schedules[vessel], vessel_inserted_trades, _ = insert_trades_by_event_times(
+                    vessel.schedule, vessel_trades, pickup_times, dropoff_times)
+                inserted_trades.extend(vessel_inserted_trades)
+            # the model does not see the committed schedules, so fill in what it left out by cheapest insertion
+            for trade in freed_trades:
+                if trade not in inserted_trades:
+                    self.repair_insert(trade, vessels, candidate_schedules, start_time, records)
+
+            # accept if more trades are served, or as many at a lower cost
+            incumbent_served, incumbent_cost = self.evaluate(vessels, schedules, trades, start_time, records)
+            candidate_served, candidate_cost = self.evaluate(vessels, candidate_schedules, trades, start_time, records)
+            if (candidate_served > incumbent_served or
+                    (candidate_served == incumbent_served and candidate_cost < incumbent_cost)):
+                schedules.update(candidate_schedules)
+                improvements += 1
+        self.telemetry.count('lns_improvements', improvements)
+        logger.debug(f"LNS: {improvements} improvements in {time.time() - time_start:.2f} seconds")
+        return schedules
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 21:00
+# @Author  : mmai
+# @FileName: profiling
+# @Software: PyCharm
+
+import cProfile
+import gc
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from loguru import logger
+from telemetry import MEMORY_PEAKS
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class CompanyProfiler:
+    """
+    Profiles the pre_inform, inform and receive calls of one company with cProfile, a profile per call.
+    The methods are wrapped on the instance like the LatencyRecorder of results_store; cProfile only follows the
+    thread that enabled it, so the other companies and the simulation itself are not in the profile.
+    """
+    def __init__(self, company):
+        self.company_name = company.name
+        self.profiles = []
+        for method in ('pre_inform', 'inform', 'receive'):
+            setattr(company, method, self.wrap(getattr(company, method)))
+
+    def wrap(self, method):
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.profiles.append(profile)
+        return profiled
+
+    def save(self, directory):
+        if len(self.profiles) == 0:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.company_name}.prof")
+        pstats.Stats(*self.profiles).dump_stats(path)
+        return path
+
+
+def instrument_profilers(sim, company_prefix=None):
+    """Output: list of CompanyProfiler, one per company (whose name starts with company_prefix)"""
+    return [CompanyProfiler(company) for company in sim.shipping_companies
+            if company_prefix is None or company.name.startswith(company_prefix)]
+
+
+def company_group(profile_path):
+    """KBestBid_pf1.65_... -> KBestBid, so the runs of all configurations of a company are merged"""
+    return os.path.basename(profile_path)[:-len('.prof')].split('_')[0]
+
+
+def function_label(function):
+    filename, line, name = function
+    if filename == '~':
+        # built-in functions
+        return name
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+
+def collapsed_stacks(stats, min_seconds=1e-5, max_depth=64):
+    """
+    Flamegraph collapsed stacks ("a;b;c microseconds") reconstructed from the caller/callee graph of a profile.
+    cProfile records edges, not stacks, so the inclusive time of a function is split over its callees in
+    proportion to the time of each call edge, like flameprof does; stacks below min_seconds are dropped.
+    Output: {stack: microseconds}
+    """
+    callees = defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            callees[caller].append((function, edge_cumulative))
+    roots = [function for function, (_, _, _, _, callers) in stats.stats.items() if not callers]
+    stacks = defaultdict(float)
+
+    def visit(function, share, path):
+        _, _, own_time, cumulative, _ = stats.stats[function]
+        path = path + [function_label(function)]
+        if cumulative > 0:
+            stacks[";".join(path)] += own_time * share
+        if len(path) >= max_depth:
+            return
+        for callee, edge_cumulative in callees.get(function, []):
+            callee_cumulative = stats.stats[callee][3]
+            if callee_cumulative <= 0 or function_label(callee) in path:
+                continue
+            callee_share = edge_cumulative * share / callee_cumulative
+            if edge_cumulative * share >= min_seconds:
+                visit(callee, callee_share, path)
+
+    for root in roots:
+        visit(root, 1.0, [])
+    return {stack: int(seconds * 1e6) for stack, seconds in stacks.items() if seconds >= min_seconds}
+
+
+def merge_profiles(directory, output_directory=None, top=40):
+    """
+    Merge the .prof files under directory (all runs, all auctions) per company into a hotspot report sorted by
+    own time and by cumulative time, and a collapsed-stack file for flamegraph.pl / speedscope.
+    Output: {company: (report path, collapsed stacks path)}
+    """
+    output_directory = output_directory or os.path.join(directory, 'report')
+    groups = defaultdict(list)
+    for root, _, files in os.walk(directory):
+        if os.path.abspath(root).startswith(os.path.abspath(output_directory)):
+            continue
+        for name in files:
+            if name.endswith('.prof'):
+                groups[company_group(name)].append(os.path.join(root, name))
+    if len(groups) == 0:
+        return {}
+    os.makedirs(output_directory, exist_ok=True)
+    outputs = {}
+    for company, paths in groups.items():
+        stats = pstats.Stats(*paths)
+        report = io.StringIO()
+        report.write(f"{company}: {len(paths)} profiles, {stats.total_tt:.2f} s in decision calls\n\n")
+        for sort_key in ('tottime', 'cumulative'):
+            report.write(f"--- sorted by {sort_key} ---\n")
+            stats.stream = report
+            stats.sort_stats(sort_key).print_stats(top)
+        report_path = os.path.join(output_directory, f"hotspots_{company}.txt")
+        with open(report_path, 'w') as f:
+            f.write(report.getvalue())
+        stacks_path = os.path.join(output_directory, f"{company}.collapsed")
+        with open(stacks_path, 'w') as f:
+            for stack, microseconds in sorted(collapsed_stacks(stats).items()):
+                f.write(f"{stack} {microseconds}\n")
+        outputs[company] = (report_path, stacks_path)
+        print(f"{company}: hotspots in {report_path}, collapsed stacks in {stacks_path}")
+    return outputs
+
+
+class GcPauseRecorder:
+    """Counts the garbage collections and their pause times per generation through gc.callbacks"""
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.pause_seconds = [0.0, 0.0, 0.0]
+        self.max_pause_seconds = [0.0, 0.0, 0.0]
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            pause = time.perf_counter() - self._start
+            generation = info['generation']
+            self.collections[generation] += 1
+            self.pause_seconds[generation] += pause
+            self.max_pause_seconds[generation] = max(self.max_pause_seconds[generation], pause)
+            self._start = None
+
+    def install(self):
+        if self not in gc.callbacks:
+            gc.callbacks.append(self)
+
+    def uninstall(self):
+        if self in gc.callbacks:
+            gc.callbacks.remove(self)
+
+    def totals(self):
+        return {'collections': list(self.collections), 'pause_seconds': list(self.pause_seconds)}
+
+
+def resident_memory_mb():
+    """Current resident memory of the process, the peak where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MemoryProfiler:
+    """
+    Memory profile of the pre_inform, inform and receive calls of one company, one entry per call with the peak
+    and net traced bytes, the source lines that retained the most memory, the per-phase net/peak bytes from the
+    company telemetry and the gc collections and pauses during the call.
+    The source lines are only taken from allocations whose traceback passes through the module of the company,
+    so the other companies deciding in parallel are left out; the peaks are those of the whole process.
+    When the resident memory passes warn_fraction of cap_mb a warning is logged and the entry is flagged.
+    """
+    def __init__(self, company, gc_recorder, cap_mb=None, warn_fraction=0.8, top=10):
+        self.company_name = company.name
+        self.company = company
+        self.gc_recorder = gc_recorder
+        self.cap_mb = cap_mb
+        self.warn_fraction = warn_fraction
+        self.top = top
+        self.decisions = []
+        self.filters = [tracemalloc.Filter(True, sys.modules[type(company).__module__].__file__, all_frames=True),
+                        tracemalloc.Filter(False, tracemalloc.__file__)]
+        for method in ('pre_inform', 'inform', 'receive'):
+            setattr(company, method, self.wrap(method, getattr(company, method)))
+
+    def wrap(self, call, method):
+        def profiled(*args, **kwargs):
+            if not tracemalloc.is_tracing():
+                return method(*args, **kwargs)
+            gc_before = self.gc_recorder.totals()
+            snapshot_before = tracemalloc.take_snapshot().filter_traces(self.filters)
+            window = MEMORY_PEAKS.begin()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                net_bytes, peak_bytes = MEMORY_PEAKS.end(window)
+                snapshot_after = tracemalloc.take_snapshot().filter_traces(self.filters)
+                self.add_decision(call, net_bytes, peak_bytes, snapshot_before, snapshot_after, gc_before)
+        return profiled
+
+    def add_decision(self, call, net_bytes, peak_bytes, snapshot_before, snapshot_after, gc_before):
+        gc_after = self.gc_recorder.totals()
+        lines = []
+        for stat in snapshot_after.compare_to(snapshot_before, 'lineno')[:self.top]:
+            frame = stat.traceback[0]
+            lines.append({'line': f"{frame.filename}:{frame.lineno}", 'size_diff': stat.size_diff,
+                          'count_diff': stat.count_diff, 'size': stat.size})
+        telemetry = getattr(self.company, 'telemetry', None)
+        phases = {}
+        if telemetry is not None and len(telemetry.records) > 0 and telemetry.records[-1]['call'] == call:
+            phases = telemetry.records[-1].get('memory_phases', {})
+        rss_mb = resident_memory_mb()
+        near_cap = self.cap_mb is not None and rss_mb is not None and rss_mb >= self.warn_fraction * self.cap_mb
+        if near_cap:
+            logger.warning(f"{self.company_name} {call}: resident memory {rss_mb:.0f} MB is close to the "
+                           f"{self.cap_mb:.0f} MB cap.")
+        self.decisions.append({
+            'call': call,
+            'net_bytes': net_bytes,
+            'peak_bytes': peak_bytes,
+            'rss_mb': rss_mb,
+            'near_cap': near_cap,
+            'phases': phases,
+            'gc_collections': [after - before for after, before in
+                               zip(gc_after['collections'], gc_before['collections'])],
+            'gc_pause_seconds': [after - before for after, before in
+                                 zip(gc_after['pause_seconds'], gc_before['pause_seconds'])],
+            'lines': lines,
+        })
+
+    def summary(self):
+        """
+        Output: {'decisions', 'max_peak_bytes', 'max_rss_mb', 'near_cap', 'gc_collections', 'gc_pause_seconds',
+        'lines': the lines that retained the most over all calls}
+        """
+        lines = defaultdict(lambda: {'size_diff': 0, 'count_diff': 0})
+        for decision in self.decisions:
+            for line in decision['lines']:
+                lines[line['line']]['size_diff'] += line['size_diff']
+                lines[line['line']]['count_diff'] += line['count_diff']
+        top_lines = sorted(lines.items(), key=lambda item: abs(item[1]['size_diff']), reverse=True)[:self.top]
+        return {
+            'decisions': len(self.decisions),
+            'max_peak_bytes': max((decision['peak_bytes'] for decision in self.decisions), default=0),
+            'max_rss_mb': max((decision['rss_mb'] or 0 for decision in self.decisions), default=0),
+            'near_cap': sum(decision['near_cap'] for decision in self.decisions),
+            'gc_collections': [sum(decision['gc_collections'][g] for decision in self.decisions) for g in range(3)],
+            'gc_pause_seconds': [sum(decision['gc_pause_seconds'][g] for decision in self.decisions)
+                                 for g in range(3)],
+            'gc_max_pause_seconds': list(self.gc_recorder.max_pause_seconds),
+            'lines': [dict(stats, line=line) for line, stats in top_lines],
+        }
+
+    def save(self, directory):
+        if len(self.decisions) == 0:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.company_name}.memory.json")
+        with open(path, 'w') as f:
+            json.dump({'company': self.company_name, 'cap_mb': self.cap_mb, 'summary': self.summary(),
+                       'decisions': self.decisions}, f, indent=2)
+        return path
+
+
+def instrument_memory_profilers(sim, company_prefix=None, cap_mb=None, nframes=25):
+    """
+    Start tracemalloc with nframes frames per traceback (enough to reach the company module from mable and
+    networkx code) and the gc pause recorder.
+    Output: (GcPauseRecorder, list of MemoryProfiler, one per company whose name starts with company_prefix)
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(nframes)
+    gc_recorder = GcPauseRecorder()
+    gc_recorder.install()
+    profilers = [MemoryProfiler(company, gc_recorder, cap_mb) for company in sim.shipping_companies
+                 if company_prefix is None or company.name.startswith(company_prefix)]
+    return gc_recorder, profilers
+
+
+def finish_memory_profilers(gc_recorder, profilers, directory):
+    """Stop tracing, save the profiles to directory and print the summary of every company"""
+    tracemalloc.stop()
+    gc_recorder.uninstall()
+    for profiler in profilers:
+        if profiler.save(directory) is None:
+            continue
+        summary = profiler.summary()
+        print(f"{profiler.company_name}: peak {summary['max_peak_bytes'] / 1024 ** 2:.1f} MB traced, "
+              f"{summary['max_rss_mb']:.0f} MB resident, {summary['near_cap']} calls near the memory cap, "
+              f"gc pauses {sum(summary['gc_pause_seconds']):.2f} s in {sum(summary['gc_collections'])} collections")
+        for line in summary['lines'][:5]:
+            print(f"  {line['size_diff'] / 1024:+.1f} KiB ({line['count_diff']:+d} blocks) {line['line']}")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Merge per-company decision profiles into hotspot reports')
+    parser.add_argument('directory', type=str, help='Directory with the .prof files written by --profile')
+    parser.add_argument('--output', type=str, default=None, help='Report directory, default <directory>/report')
+    parser.add_argument('--top', type=int, default=40, help='Functions per report section')
+    cli_args = parser.parse_args()
+    merge_profiles(cli_args.directory, cli_args.output, cli_args.top)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 14:05
+# @Author  : mmai
+# @FileName: results_store
+# @Software: PyCharm
+
+import hashlib
+import json
+import sqlite3
+import time
+import pandas as pd
+from mable.examples import environment
+from mable.observers import MetricsObserver
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    months INTEGER,
+    trades INTEGER,
+    vessels INTEGER,
+    seed INTEGER,
+    wall_time REAL,
+    peak_memory_mb REAL,
+    status TEXT NOT NULL,
+    error TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS company_results (
+    run_id TEXT NOT NULL,
+    company TEXT NOT NULL,
+    revenue REAL,
+    cost REAL,
+    penalty REAL,
+    income REAL,
+    trades_won INTEGER,
+    mean_inform_seconds REAL,
+    max_inform_seconds REAL,
+    mean_receive_seconds REAL,
+    max_receive_seconds REAL,
+    PRIMARY KEY (run_id, company)
+);
+CREATE TABLE IF NOT EXISTS auction_latency (
+    run_id TEXT NOT NULL,
+    company TEXT NOT NULL,
+    auction INTEGER NOT NULL,
+    inform_seconds REAL,
+    receive_seconds REAL,
+    PRIMARY KEY (run_id, company, auction)
+);
+CREATE INDEX IF NOT EXISTS company_results_company ON company_results (company);
+"""
+
+
+def settings_run_id(prefix, params, args):
+    """
+    Run ID of a simulation: the prefix and a hash of the parameters and the simulation settings (months, trades,
+    vessels, seed). Runs that differ in any of them, e.g. replications with another seed, get their own rows in the
+    store instead of replacing each other, while a rerun of the same simulation replaces its rows.
+    """
+    key = json.dumps([params, args.months, args.trades, args.vessels, getattr(args, 'seed', None)], sort_keys=True)
+    return f"{prefix}_{hashlib.sha1(key.encode()).hexdigest()[:12]}"
+
+
+class LatencyRecorder:
+    """
+    Times every inform and receive call of a company, one entry per auction.
+    The methods are wrapped on the instance, so the company classes stay untouched.
+    """
+    def __init__(self, company):
+        self.inform_seconds = []
+        self.receive_seconds = []
+        inform = company.inform
+        receive = company.receive
+
+        def timed_inform(*args, **kwargs):
+            time_start = time.perf_counter()
+            try:
+                return inform(*args, **kwargs)
+            finally:
+                self.inform_seconds.append(time.perf_counter() - time_start)
+
+        def timed_receive(*args, **kwargs):
+            time_start = time.perf_counter()
+            try:
+                return receive(*args, **kwargs)
+            finally:
+                self.receive_seconds.append(time.perf_counter() - time_start)
+
+        company.inform = timed_inform
+        company.receive = timed_receive
+
+
+def instrument_companies(sim):
+    """Output: {company name: LatencyRecorder}"""
+    return {company.name: LatencyRecorder(company) for company in sim.shipping_companies}
+
+
+def collect_company_results(sim, recorders):
+    """
+    Per-company outcome of a finished simulation, computed like `mable overview` does from the metrics file.
+    Output: (list of company rows, list of auction latency rows)
+    """
+    metrics_observer = None
+    for one_event_observer in sim.get_event_observers():
+        if isinstance(one_event_observer, MetricsObserver):
+            metrics_observer = one_event_observer
+            break
+    metrics = metrics_observer.metrics.to_json()
+    penalties = environment._calculate_penalty(sim, metrics_observer)
+    all_outcomes = metrics["global_metrics"].get("auction_outcomes", [])
+
+    company_rows = []
+    latency_rows = []
+    for company in sim.shipping_companies:
+        company_id = metrics_observer.metrics.get_company_id(company, create_id_if_not_exists=False)
+        cost = metrics["company_metrics"].get(company_id, {}).get("fuel_cost", 0)
+        penalty = penalties.get(company_id, 0)
+        contracts = [contract for outcome in all_outcomes for contract in outcome.get(company_id, [])]
+        revenue = sum(contract.payment for contract in contracts)
+        recorder = recorders[company.name]
+        inform_seconds = recorder.inform_seconds
+        receive_seconds = recorder.receive_seconds
+        company_rows.append({
+            'company': company.name,
+            'revenue': revenue,
+            'cost': cost,
+            'penalty': penalty,
+            'income': revenue - cost - penalty,
+            'trades_won': len(contracts),
+            'mean_inform_seconds': sum(inform_seconds) / len(inform_seconds) if inform_seconds else None,
+            'max_inform_seconds': max(inform_seconds, default=None),
+            'mean_receive_seconds': sum(receive_seconds) / len(receive_seconds) if receive_seconds else None,
+            'max_receive_seconds': max(receive_seconds, default=None),
+        })
+        for auction in range(max(len(inform_seconds), len(receive_seconds))):
+            latency_rows.append({
+                'company': company.name,
+                'auction': auction,
+                'inform_seconds': inform_seconds[auction] if auction < len(inform_seconds) else None,
+                'receive_seconds': receive_seconds[auction] if auction < len(receive_seconds) else None,
+            })
+    return company_rows, latency_rows
+
+
+class ResultsStore:
+    """
+    SQLite store with one row per run, one row per (run, company) and one row per (run, company, auction).
+    Every worker opens its own connection and writes a run in a single transaction; WAL mode and the busy
+    timeout let parallel workers append without corrupting or blocking each other.
+    """
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        conn = self.connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(runs)")]
+            # stores written by earlier versions lack the later columns
+            for column, column_type in (('seed', 'INTEGER'), ('peak_memory_mb', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE runs ADD COLUMN {column} {column_type}")
+        conn.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    def append_run(self, run_id, params, args, wall_time, company_rows=(), latency_rows=(), error=None,
+                   peak_memory_mb=None):
+        """A rerun of the same run_id replaces the earlier rows, see settings_run_id for IDs that keep replications"""
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM company_results WHERE run_id = ?", (run_id,))
+                conn.execute("DELETE FROM auction_latency WHERE run_id = ?", (run_id,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO runs (run_id, params, months, trades, vessels, seed, wall_time, "
+                    "peak_memory_mb, status, error, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, json.dumps(params, sort_keys=True), args.months, args.trades, args.vessels,
+                     getattr(args, 'seed', None), wall_time, peak_memory_mb, 'error' if error else 'ok', error,
+                     time.strftime('%Y-%m-%d %H:%M:%S')))
+                conn.executemany(
+                    "INSERT INTO company_results VALUES (:run_id, :company, :revenue, :cost, :penalty, :income, "
+                    ":trades_won, :mean_inform_seconds, :max_inform_seconds, :mean_receive_seconds, "
+                    ":max_receive_seconds)",
+                    [dict(row, run_id=run_id) for row in company_rows])
+                conn.executemany(
+                    "INSERT INTO auction_latency VALUES (:run_id, :company, :auction, :inform_seconds, "
+                    ":receive_seconds)",
+                    [dict(row, run_id=run_id) for row in latency_rows])
+        finally:
+            conn.close()
+
+    def copy_run(self, source_id, run_id, params):
+        """Store the results of source_id again under run_id, for a run with equivalent parameters"""
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM company_results WHERE run_id = ?", (run_id,))
+                conn.execute("DELETE FROM auction_latency WHERE run_id = ?", (run_id,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO runs (run_id, params, months, trades, vessels, seed, wall_time, "
+                    "peak_memory_mb, status, error, finished_at) SELECT ?, ?, months, trades, vessels, seed, "
+                    "wall_time, peak_memory_mb, status, error, finished_at FROM runs WHERE run_id = ?",
+                    (run_id, json.dumps(params, sort_keys=True), source_id))
+                conn.execute(
+                    "INSERT INTO company_results SELECT ?, company, revenue, cost, penalty, income, trades_won, "
+                    "mean_inform_seconds, max_inform_seconds, mean_receive_seconds, max_receive_seconds "
+                    "FROM company_results WHERE run_id = ?", (run_id, source_id))
+                conn.execute(
+                    "INSERT INTO auction_latency SELECT ?, company, auction, inform_seconds, receive_seconds "
+                    "FROM auction_latency WHERE run_id = ?", (run_id, source_id))
+        finally:
+            conn.close()
+
+    def load(self, company_prefix=None):
+        """
+        Output: DataFrame with one row per (run, company), the parameters expanded into columns
+        """
+        conn = self.connect()
+        try:
+            df = pd.read_sql_query(
+                "SELECT r.run_id, r.params, r.months, r.trades, r.vessels, r.seed, r.wall_time, r.peak_memory_mb, "
+                "c.* FROM runs r JOIN company_results c ON r.run_id = c.run_id WHERE r.status = 'ok'", conn)
+        finally:
+            conn.close()
+        df = df.loc[:, ~df.columns.duplicated()]
+        if company_prefix is not None:
+            df = df[df['company'].str.startswith(company_prefix)]
+        params = pd.json_normalize(df['params'].map(json.loads).tolist())
+        params.index = df.index
+        return pd.concat([df.drop(columns=['params']), params], axis=1)
+
+    def load_latency(self, run_prefix=''):
+        """
+        Output: DataFrame with one row per (run, company, auction) of the successful runs whose ID starts with
+        run_prefix, with the trades and vessels of the run
+        """
+        conn = self.connect()
+        try:
+            return pd.read_sql_query(
+                "SELECT a.*, r.months, r.trades, r.vessels FROM auction_latency a JOIN runs r ON a.run_id = r.run_id "
+                "WHERE r.status = 'ok' AND a.run_id LIKE ?", conn, params=(run_prefix + '%',))
+        finally:
+            conn.close()
+
+
+def compare_configurations(path, param_keys, company_prefix="KBestBid", metric='income'):
+    """
+    Compare the configurations of the stored runs, best first.
+    Output: DataFrame indexed by param_keys with count/mean/std of the metric, mean trades won and latencies
+    """
+    df = ResultsStore(path).load(company_prefix)
+    if df.empty:
+        return df
+    param_keys = [key for key in param_keys if key in df.columns]
+    summary = df.groupby(param_keys).agg(
+        runs=(metric, 'count'),
+        mean=(metric, 'mean'),
+        std=(metric, 'std'),
+        trades_won=('trades_won', 'mean'),
+        mean_inform_seconds=('mean_inform_seconds', 'mean'),
+        max_inform_seconds=('max_inform_seconds', 'max'),
+        wall_time=('wall_time', 'mean'))
+    return summary.sort_values('mean', ascending=False)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compare the configurations in an experiment results store')
+    parser.add_argument('store', type=str, help='SQLite results store written by run_experiments.py')
+    parser.add_argument('--company', type=str, default='KBestBid', help='Company name prefix')
+    parser.add_argument('--metric', type=str, default='income', help='Column to rank by')
+    parser.add_argument('--top', type=int, default=20, help='Number of configurations to show')
+    cli_args = parser.parse_args()
+    from run_experiments import PARAM_KEYS
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(compare_configurations(cli_args.store, PARAM_KEYS, cli_args.company, cli_args.metric).head(cli_args.top))
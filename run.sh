@@ -26,4 +26,5 @@ echo "Current working directory: $(pwd)"
 
 #python ./baselines/GATRNN.py
 #python run_experiments.py --mode=subset
+#python run_experiments.py --mode=sweep --workers=${SLURM_CPUS_PER_TASK}
 python examples.py
@@ -6,28 +6,57 @@
 # @Software: PyCharm
 
 import argparse
+import itertools
 import json
 import os
 import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 from mable.examples import environment, fleets, companies
 import greedy
 import kbest_bid
+from results_store import ResultsStore, instrument_companies, collect_company_results, settings_run_id
+from auction_replay import AuctionRecorder
+from telemetry import save_company_telemetry, save_chrome_trace
+from profiling import instrument_profilers, merge_profiles, instrument_memory_profilers, finish_memory_profilers
+from trade_streams import load_or_create_trade_stream, fixed_trades_for_months
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+GLOBAL_AGENT_TIMEOUT = 60
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Run shipping experiments with KBestBid')
     
     # Experiment settings
-    parser.add_argument('--mode', type=str, choices=['single', 'sweep', 'subset'], default='subset',
-                      help='Run a single experiment, full parameter sweep, or subset of combinations')
-    parser.add_argument('--output', type=str, default='results.csv',
-                      help='Output file for results')
+    parser.add_argument('--mode', type=str, choices=['single', 'sweep', 'subset', 'halving', 'scaling'],
+                      default='subset',
+                      help='Run a single experiment, full parameter sweep, subset of combinations, '
+                           'successive halving over the number of months, or a scaling study of the decision '
+                           'latency over trades and vessels')
+    parser.add_argument('--output', type=str, default='results.sqlite',
+                      help='SQLite results store, one row per run and per company (see results_store.py)')
     parser.add_argument('--config', type=str, default=None,
                       help='JSON config file for parameter sweep')
     parser.add_argument('--subset-size', type=int, default=10,
                       help='Number of random combinations to run when using subset mode')
     parser.add_argument('--subset-seed', type=int, default=42,
                       help='Random seed for subset selection')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='Number of simulations run in parallel, one per process')
+    parser.add_argument('--halving-min-months', type=int, default=3,
+                      help='Months simulated in the first successive halving rung')
+    parser.add_argument('--halving-eta', type=int, default=3,
+                      help='Keep the top 1/eta configurations per rung and multiply the months by eta')
+    parser.add_argument('--scaling-trades', type=int, nargs='+', default=[10, 20, 50, 100, 200],
+                      help='Trades per auction in the scaling study')
+    parser.add_argument('--scaling-vessels', type=int, nargs='+', default=[1, 2, 5, 10],
+                      help='Vessels per type in the scaling study')
+    parser.add_argument('--scaling-months', type=int, default=3,
+                      help='Months simulated per scaling study run')
     
     # Simulation settings
     parser.add_argument('--months', type=int, default=24,
@@ -36,6 +65,32 @@ def parse_args():
                       help='Trades per auction')
     parser.add_argument('--vessels', type=int, default=2,
                       help='Number of vessels per type')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Seed of the trade stream and the simulation')
+    parser.add_argument('--stream-dir', type=str, default='trade_streams',
+                      help='Directory of the persisted trade streams, one per seed, replayed by every run')
+    parser.add_argument('--fresh-trades', action='store_true',
+                      help='Let every run generate its own trades instead of replaying the seed\'s trade stream')
+    parser.add_argument('--record-auctions', type=str, default=None,
+                      help='Directory to save every inform/receive decision to, for replay with auction_replay.py')
+    parser.add_argument('--record-company', type=str, default='KBestBid',
+                      help='Name prefix of the companies whose decisions are recorded')
+    parser.add_argument('--telemetry-dir', type=str, default=None,
+                      help='Directory to save the per-auction phase timings of the companies to, one JSON per company')
+    parser.add_argument('--trace-dir', type=str, default=None,
+                      help='Directory to save a Chrome trace (chrome://tracing, Perfetto) of every run to')
+    parser.add_argument('--profile', action='store_true',
+                      help='Profile the decision calls of the companies with cProfile and merge a hotspot report')
+    parser.add_argument('--profile-dir', type=str, default='profiles',
+                      help='Directory to save the profiles to, one .prof per run and company')
+    parser.add_argument('--profile-company', type=str, default=None,
+                      help='Name prefix of the companies to profile, default all')
+    parser.add_argument('--memory-profile', action='store_true',
+                      help='Trace the allocations of the decision calls with tracemalloc and record the gc pauses')
+    parser.add_argument('--memory-dir', type=str, default='memory_profiles',
+                      help='Directory to save the memory profiles to, one JSON per run and company')
+    parser.add_argument('--memory-cap-mb', type=float, default=1024,
+                      help='Memory cap of a run (--mem-per-cpu of run.sh), a warning is logged near 80%% of it')
     
     # KBestBid hyperparameters - using exact parameter names from the class
     parser.add_argument('--profit_factor', type=float, default=1.65,
@@ -57,8 +112,9 @@ def parse_args():
     
     return parser.parse_args()
 
-def run_simulation(args, params=None):
-    """Run a single simulation with given parameters"""
+def run_simulation(args, params=None, run_id=None):
+    """Run a single simulation with given parameters and append its outcome to the results store args.output.
+    Output: list of per-company results (revenue, cost, penalty, income, trades won, decision latency)"""
     # Use provided params or fall back to args
     if params is None:
         params = {
@@ -79,9 +135,16 @@ def run_simulation(args, params=None):
                 f"effsel{params['efficiency_selection_percentage']}_" \
                 f"freqth{params['trade_frequency_threshold']}_k{params['k_best']}"
     
-    specifications_builder = environment.get_specification_builder(
-        trades_per_occurrence=args.trades,
-        num_auctions=args.months)
+    if args.fresh_trades:
+        specifications_builder = environment.get_specification_builder(
+            trades_per_occurrence=args.trades,
+            num_auctions=args.months)
+    else:
+        # common random numbers: every configuration replays the same cargo sequence of the seed
+        trade_stream = load_or_create_trade_stream(args.stream_dir, args.seed, args.trades, args.months)
+        specifications_builder = environment.get_specification_builder(
+            fixed_trades=fixed_trades_for_months(trade_stream, args.months))
+    specifications_builder.add_random_specifications(seed=args.seed)
     
     # Add KBestBid company with specified parameters
     kbest_fleet = fleets.mixed_fleet(
@@ -146,12 +209,41 @@ def run_simulation(args, params=None):
     sim = environment.generate_simulation(
         specifications_builder,
         show_detailed_auction_outcome=False,
-        global_agent_timeout=60
+        global_agent_timeout=GLOBAL_AGENT_TIMEOUT
     )
-    
+    # profilers wrap the methods first, so the timing and recording wrappers stay out of the profiles
+    profilers = instrument_profilers(sim, args.profile_company) if args.profile else []
+    recorders = instrument_companies(sim)
+    if run_id is None:
+        run_id = f"single_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    if args.record_auctions:
+        for company in sim.shipping_companies:
+            if company.name.startswith(args.record_company):
+                AuctionRecorder(company, os.path.join(args.record_auctions, run_id, company.name))
+    if args.memory_profile:
+        # outermost, so the snapshots are not in the latencies and the recordings not in the allocations
+        gc_recorder, memory_profilers = instrument_memory_profilers(sim, args.profile_company, args.memory_cap_mb)
+
+    run_start_time = time.time()
     sim.run()
-    
+    wall_time = time.time() - run_start_time
+    # peak resident memory of the process, per run only when every run has its own process
+    peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    if args.telemetry_dir:
+        save_company_telemetry(sim.shipping_companies, os.path.join(args.telemetry_dir, run_id))
+    if args.trace_dir:
+        save_chrome_trace(sim.shipping_companies, os.path.join(args.trace_dir, f"{run_id}.json"))
+    for profiler in profilers:
+        profiler.save(os.path.join(args.profile_dir, run_id))
+    if args.memory_profile:
+        finish_memory_profilers(gc_recorder, memory_profilers, os.path.join(args.memory_dir, run_id))
 
+    company_rows, latency_rows = collect_company_results(sim, recorders)
+    ResultsStore(args.output).append_run(run_id, params, args, wall_time, company_rows, latency_rows,
+                                         peak_memory_mb=peak_memory_mb)
+    for row in company_rows:
+        print(f"{row['company']}: income {row['income']:.2f}, trades won {row['trades_won']}")
+    return company_rows
 
 
 def load_sweep_config(config_path):
@@ -172,136 +264,208 @@ def load_sweep_config(config_path):
     with open(config_path, 'r') as f:
         return json.load(f)
 
+PARAM_KEYS = [
+    'profit_factor',
+    'profit_factor_2',
+    'avg_w',
+    'cal_efficiency',
+    'schedule_with_greedy',
+    'efficiency_selection_percentage',
+    'trade_frequency_threshold',
+    'k_best'
+]
+
+LEDGER_FILENAME = "completed_runs.txt"
+
+
+def load_ledger(results_dir):
+    """Run IDs that already finished in an earlier (crashed or preempted) job"""
+    ledger_path = os.path.join(results_dir, LEDGER_FILENAME)
+    if not os.path.exists(ledger_path):
+        return set()
+    with open(ledger_path, 'r') as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def record_completed(results_dir, run_id):
+    """Append a finished run ID to the ledger, only the parent process writes it"""
+    with open(os.path.join(results_dir, LEDGER_FILENAME), "a") as f:
+        f.write(run_id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def execute_run(args, run_id, params, results_dir):
+    """Run one combination, one simulation per process when called from the pool.
+    Output: (run_id, duration in seconds, error message or None)"""
+    run_start_time = time.time()
+    try:
+        run_simulation(args, params, run_id)
+        error = None
+    except Exception as e:
+        print(f"Error running simulation {run_id}: {str(e)}")
+        error = str(e)
+        ResultsStore(args.output).append_run(run_id, params, args, time.time() - run_start_time, error=error)
+        with open(f"{results_dir}/error_{run_id}.txt", "w") as f:
+            f.write(f"Error: {str(e)}\n")
+            import traceback
+            traceback.print_exc(file=f)
+    return run_id, time.time() - run_start_time, error
+
+
+def effective_params(params):
+    """Canonical form of a KBestBid parameter combination: parameters the company never reads
+    under the other settings are blanked, so equivalent combinations share one signature"""
+    canonical = dict(params)
+    if not canonical.get('cal_efficiency'):
+        # the efficiency ranking and selection only run with cal_efficiency
+        canonical['efficiency_selection_percentage'] = None
+    return canonical
+
+
+def param_signature(params):
+    return json.dumps(effective_params(params), sort_keys=True)
+
+
+def fan_out(args, results_dir, source_id, aliases):
+    """Copy the results of a finished run to the runs with the same effective parameters"""
+    store = ResultsStore(args.output)
+    for alias_id, alias_params in aliases:
+        store.copy_run(source_id, alias_id, alias_params)
+        record_completed(results_dir, alias_id)
+
+
+def run_combinations(args, runs, results_dir, run_args=None, fresh_process=False):
+    """Run the (run_id, params) pairs sequentially or in a process pool of args.workers processes,
+    skipping the run IDs in the completion ledger of results_dir (see settings_run_id for IDs that change with the
+    parameters and the simulation settings). Runs with the same effective parameters
+    and simulation settings are simulated once and the result is fanned out to the others.
+    run_args optionally maps a run ID to its own args (e.g. other trades or vessels); fresh_process runs every
+    simulation in its own process also with one worker."""
+    run_args = run_args or {}
+    # a combination listed twice has one run ID, it is simulated once
+    runs = list(dict(runs).items())
+    completed = load_ledger(results_dir)
+    for run_id, params in runs:
+        if run_id not in completed:
+            # Save hyperparameter settings to file
+            with open(f"{results_dir}/params_{run_id}.json", "w") as f:
+                json.dump(params, f, indent=2)
+
+    groups = {}
+    for run_id, params in runs:
+        one_args = run_args.get(run_id, args)
+        key = (param_signature(params), one_args.months, one_args.trades, one_args.vessels, one_args.seed)
+        groups.setdefault(key, []).append((run_id, params))
+    pending = []
+    aliases = {}
+    for members in groups.values():
+        finished = [member for member in members if member[0] in completed]
+        source = finished[0] if finished else members[0]
+        missing = [member for member in members if member[0] not in completed and member is not source]
+        if finished:
+            fan_out(args, results_dir, source[0], missing)
+        else:
+            pending.append(source)
+            aliases[source[0]] = missing
+    print(f"{len(runs)} runs, {len(groups)} unique effective parameter combinations")
+    if len(runs) - len(completed.intersection(run_id for run_id, _ in runs)) > len(pending):
+        print(f"Resuming or deduplicating: {len(pending)} simulations to run")
+
+    start_time = time.time()
+    total = len(pending)
+
+    def report(i, run_id, duration, error):
+        if error is None:
+            record_completed(results_dir, run_id)
+            fan_out(args, results_dir, run_id, aliases[run_id])
+        print(f"Finished {run_id} at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Duration: {duration:.2f} seconds ({duration/60:.2f} minutes)")
+        # Show progress
+        elapsed_total = time.time() - start_time
+        remaining = (elapsed_total / (i+1)) * (total - i - 1)
+        print(f"Progress: {i+1}/{total} ({(i+1)/total*100:.1f}%)")
+        print(f"Elapsed time: {elapsed_total/60:.1f} minutes")
+        print(f"Estimated time remaining: {remaining/60:.1f} minutes")
+        print(f"Estimated completion: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + remaining))}")
+
+    if args.workers <= 1 and not fresh_process:
+        for i, (run_id, params) in enumerate(pending):
+            print(f"\n{'-'*80}")
+            print(f"Running {run_id}:")
+            for k, v in params.items():
+                print(f"  {k}: {v}")
+            print(f"Started at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+            report(i, *execute_run(run_args.get(run_id, args), run_id, params, results_dir))
+    else:
+        # a fresh process per simulation, so no state leaks between runs
+        print(f"Running {total} simulations on {max(1, args.workers)} workers")
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), max_tasks_per_child=1) as executor:
+            futures = [executor.submit(execute_run, run_args.get(run_id, args), run_id, params, results_dir)
+                       for run_id, params in pending]
+            for i, future in enumerate(as_completed(futures)):
+                report(i, *future.result())
+    return time.time() - start_time
+
+
 def run_parameter_sweep(args):
     """Run experiments with all possible parameter combinations"""
     config = load_sweep_config(args.config)
-    
-    # Generate all parameter combinations using itertools.product
-    import itertools
-    
-    # Define all parameters to sweep
-    param_keys = [
-        'profit_factor', 
-        'profit_factor_2', 
-        'avg_w', 
-        'cal_efficiency', 
-        'schedule_with_greedy', 
-        'efficiency_selection_percentage', 
-        'trade_frequency_threshold', 
-        'k_best'
-    ]
-    
+
     # Get all parameter values from config
     param_values = []
-    for key in param_keys:
+    for key in PARAM_KEYS:
         param_values.append(config.get(key, [getattr(args, key)]))
-    
+
     # Generate all combinations
     all_combinations = list(itertools.product(*param_values))
     total_combinations = len(all_combinations)
-    
+
     print(f"Starting parameter sweep with {total_combinations} combinations")
-    print(f"Expected runtime: {total_combinations * 5} minutes (approx. 5 min per run)")
-    
+    print(f"Expected runtime: {total_combinations * 5 / args.workers:.0f} minutes "
+          f"(approx. 5 min per run on {args.workers} workers)")
+
     # Create results directory if it doesn't exist
-    import os
     results_dir = "experiment_results"
     os.makedirs(results_dir, exist_ok=True)
-    
-    # Run simulations
-    start_time = time.time()
-    
-    for i, combo in enumerate(all_combinations):
-        # Create parameter dictionary for this run
-        params = {param_keys[j]: combo[j] for j in range(len(param_keys))}
-        
-        # Create a unique identifier for this run
-        run_id = f"run_{i+1}_of_{total_combinations}"
-        
-        print(f"\n{'-'*80}")
-        print(f"Running combination {i+1}/{total_combinations}:")
-        for k, v in params.items():
-            print(f"  {k}: {v}")
-        
-        # Save hyperparameter settings to file
-        params_filename = f"{results_dir}/params_{run_id}.json"
-        with open(params_filename, "w") as f:
-            json.dump(params, f, indent=2)
-        print(f"Parameters saved to {params_filename}")
-        
-        # Record start time for this run
-        run_start_time = time.time()
-        print(f"Started at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Run simulation with these parameters
-        try:
-            run_simulation(args, params)
-
-        except Exception as e:
-            print(f"Error running simulation: {str(e)}")
-            with open(f"{results_dir}/error_{run_id}.txt", "w") as f:
-                f.write(f"Error: {str(e)}\n")
-                import traceback
-                traceback.print_exc(file=f)
-            
-        # Record end time and duration for this run
-        run_end_time = time.time()
-        run_duration = run_end_time - run_start_time
-        print(f"Finished at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"Duration: {run_duration:.2f} seconds ({run_duration/60:.2f} minutes)")
-        
-        # Show progress
-        elapsed_total = run_end_time - start_time
-        remaining = (elapsed_total / (i+1)) * (total_combinations - i - 1)
-        print(f"Progress: {i+1}/{total_combinations} ({(i+1)/total_combinations*100:.1f}%)")
-        print(f"Elapsed time: {elapsed_total/60:.1f} minutes")
-        print(f"Estimated time remaining: {remaining/60:.1f} minutes")
-        print(f"Estimated completion: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run_end_time + remaining))}")
 
-    
-    elapsed_time = time.time() - start_time
+    # a run ID only depends on the parameters and the simulation settings, so a rerun resumes the combinations
+    # it shares with earlier runs, also after the grid is edited, and runs with other settings are not skipped
+    runs = []
+    for combo in all_combinations:
+        params = {PARAM_KEYS[j]: combo[j] for j in range(len(PARAM_KEYS))}
+        runs.append((settings_run_id("run", params, args), params))
+
+    elapsed_time = run_combinations(args, runs, results_dir)
     print(f"\nParameter sweep completed in {elapsed_time/60:.1f} minutes")
-    return 
+    return
 
 def run_parameter_subset(args):
     """Run a random subset of parameter combinations"""
     import random
-    import itertools
-    
+
     # Set random seed for reproducibility
     random.seed(args.subset_seed)
-    
+
     # Load the full parameter space
     config = load_sweep_config(args.config)
-    
-    # Define all parameters
-    param_keys = [
-        'profit_factor', 
-        'profit_factor_2', 
-        'avg_w', 
-        'cal_efficiency', 
-        'schedule_with_greedy', 
-        'efficiency_selection_percentage', 
-        'trade_frequency_threshold', 
-        'k_best'
-    ]
-    
+
     # Get parameter values
     param_values = []
-    for key in param_keys:
+    for key in PARAM_KEYS:
         param_values.append(config.get(key, [getattr(args, key)]))
-    
+
     # Calculate the total number of combinations
     total_combinations = 1
     for values in param_values:
         total_combinations *= len(values)
-    
+
     print(f"Total possible combinations: {total_combinations}")
     print(f"Selecting {args.subset_size} random combinations")
-    
+
     # Generate all combinations
     all_combinations = list(itertools.product(*param_values))
-    
+
     # Select a random subset
     if args.subset_size < total_combinations:
         selected_combinations = random.sample(all_combinations, args.subset_size)
@@ -309,52 +473,185 @@ def run_parameter_subset(args):
         print(f"Subset size {args.subset_size} exceeds total combinations {total_combinations}")
         print("Using all combinations instead")
         selected_combinations = all_combinations
-    
+
     # Create directory for parameter configs
     params_dir = "parameter_configs"
     os.makedirs(params_dir, exist_ok=True)
-    
-    # Run the selected combinations
+
+    runs = []
+    for combo in selected_combinations:
+        params = {PARAM_KEYS[j]: combo[j] for j in range(len(PARAM_KEYS))}
+        runs.append((settings_run_id("subset", params, args), params))
+
+    elapsed_time = run_combinations(args, runs, params_dir)
+    print(f"\nSubset experiment completed in {elapsed_time/60:.1f} minutes")
+
+def run_successive_halving(args):
+    """Successive halving over the sweep space: every combination is simulated for a few months,
+    the top 1/eta by KBestBid income are promoted to eta times as many months, until args.months"""
+    import math
+    from argparse import Namespace
+    from results_store import ResultsStore
+
+    config = load_sweep_config(args.config)
+    param_values = [config.get(key, [getattr(args, key)]) for key in PARAM_KEYS]
+    candidates = [{PARAM_KEYS[j]: combo[j] for j in range(len(PARAM_KEYS))}
+                  for combo in itertools.product(*param_values)]
+    # the candidate index identifies a combination across rungs, its run IDs also depend on the settings
+    candidates = list(enumerate(candidates))
+
+    rung_months = []
+    months = min(args.halving_min_months, args.months)
+    while months < args.months:
+        rung_months.append(months)
+        months *= args.halving_eta
+    rung_months.append(args.months)
+    print(f"Successive halving over {len(candidates)} combinations, months per rung: {rung_months}")
+
+    results_dir = "halving_results"
+    os.makedirs(results_dir, exist_ok=True)
     start_time = time.time()
-    
-    for i, combo in enumerate(selected_combinations):
-        # Create parameter dictionary
-        params = {param_keys[j]: combo[j] for j in range(len(param_keys))}
-        
-        # Create run ID
-        run_id = f"subset_{i+1}_of_{args.subset_size}"
-        
-        print(f"\n{'-'*80}")
-        print(f"Running combination {i+1}/{args.subset_size}:")
+
+    for rung, months in enumerate(rung_months):
+        rung_args = Namespace(**vars(args))
+        rung_args.months = months
+        run_ids = {index: settings_run_id(f"halving_r{rung}", params, rung_args) for index, params in candidates}
+        runs = [(run_ids[index], params) for index, params in candidates]
+        print(f"\n{'='*80}")
+        print(f"Rung {rung}: {len(runs)} combinations for {months} months")
+        run_combinations(rung_args, runs, results_dir)
+
+        # rank by the income of the KBestBid company in this rung, failed runs rank last
+        df = ResultsStore(args.output).load(company_prefix="KBestBid")
+        income = dict(zip(df['run_id'], df['income']))
+        ranked = sorted(candidates, key=lambda c: income.get(run_ids[c[0]], -math.inf), reverse=True)
+        if rung == len(rung_months) - 1:
+            candidates = ranked
+            break
+        candidates = ranked[:max(1, math.ceil(len(ranked) / args.halving_eta))]
+        print(f"Promoting {len(candidates)} combinations to the next rung")
+
+    print(f"\nSuccessive halving completed in {(time.time() - start_time)/60:.1f} minutes")
+    for index, params in candidates[:5]:
+        print(f"{run_ids[index]}: income {income.get(run_ids[index], float('nan')):.2f}")
         for k, v in params.items():
             print(f"  {k}: {v}")
-        
-        # Save settings
-        with open(f"{params_dir}/params_{run_id}.json", "w") as f:
-            json.dump(params, f, indent=2)
-        
-        # Run and time it
-        run_start = time.time()
-        try:
-            # run_simulation handles results
-            run_simulation(args, params)
-        except Exception as e:
-            print(f"Error running simulation: {str(e)}")
-            with open(f"{params_dir}/error_{run_id}.txt", "w") as f:
-                f.write(f"Error: {str(e)}\n")
-                import traceback
-                traceback.print_exc(file=f)
-        
-        run_duration = time.time() - run_start
-        print(f"Completed in {run_duration:.2f} seconds")
-    
-    print(f"\nSubset experiment completed in {(time.time() - start_time)/60:.1f} minutes")
+    return candidates
+
+SCALING_METRICS = ['median_inform_seconds', 'max_inform_seconds', 'median_receive_seconds', 'max_receive_seconds',
+                   'peak_memory_mb', 'cost']
+
+
+def scaling_table(store_path, run_ids):
+    """
+    One row per (company, trades, vessels) of the scaling study: median and maximum per-auction inform and receive
+    latency, peak memory of the run, fuel cost of the executed schedules, income and trades won.
+    """
+    store = ResultsStore(store_path)
+    latency = store.load_latency("scaling_")
+    latency = latency[latency['run_id'].isin(run_ids)]
+    results = store.load()
+    results = results[results['run_id'].isin(run_ids)]
+    if results.empty:
+        return results
+    timings = latency.groupby(['run_id', 'company']).agg(
+        median_inform_seconds=('inform_seconds', 'median'),
+        max_inform_seconds=('inform_seconds', 'max'),
+        median_receive_seconds=('receive_seconds', 'median'),
+        max_receive_seconds=('receive_seconds', 'max')).reset_index()
+    table = results[['run_id', 'company', 'trades', 'vessels', 'peak_memory_mb', 'cost', 'income', 'trades_won']]
+    table = table.merge(timings, on=['run_id', 'company'], how='left')
+    # the KBestBid company name carries its parameters, the same in every cell
+    table['company'] = table['company'].str.split('_').str[0]
+    return table.drop(columns=['run_id']).sort_values(['company', 'vessels', 'trades']).reset_index(drop=True)
+
+
+def fit_growth_exponents(table, metrics=SCALING_METRICS):
+    """
+    Least squares fit of log(metric) = a + b_trades * log(trades) + b_vessels * log(vessels) per company, so
+    metric ~ trades^b_trades * vessels^b_vessels. A dimension with a single value in the study is left out.
+    For the maximum inform latency also the trades at which the fit reaches the agent timeout, per vessel count.
+    """
+    rows = []
+    for company, one_company in table.groupby('company'):
+        for metric in metrics:
+            data = one_company[one_company[metric] > 0]
+            dimensions = [d for d in ('trades', 'vessels') if data[d].nunique() > 1]
+            if len(data) < len(dimensions) + 1 or not dimensions:
+                continue
+            design = np.column_stack([np.ones(len(data))] + [np.log(data[d].to_numpy(float)) for d in dimensions])
+            coefficients, _, _, _ = np.linalg.lstsq(design, np.log(data[metric].to_numpy(float)), rcond=None)
+            row = {'company': company, 'metric': metric, 'points': len(data)}
+            for d, b in zip(dimensions, coefficients[1:]):
+                row[f"exponent_{d}"] = b
+            if metric == 'max_inform_seconds' and 'trades' in dimensions:
+                b_trades = row['exponent_trades']
+                for vessels in sorted(table['vessels'].unique()):
+                    log_rest = coefficients[0]
+                    if 'vessels' in dimensions:
+                        log_rest += row['exponent_vessels'] * np.log(vessels)
+                    if b_trades > 0:
+                        row[f"timeout_trades_v{vessels}"] = np.exp((np.log(GLOBAL_AGENT_TIMEOUT) - log_rest) / b_trades)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_scaling_study(args):
+    """Simulate every (trades, vessels) cell of the scaling grid with the KBestBid parameters of args and
+    tabulate the decision latency, peak memory and cost of every company against the load"""
+    from argparse import Namespace
+
+    params = {key: getattr(args, key) for key in PARAM_KEYS}
+    runs = []
+    run_args = {}
+    for vessels in args.scaling_vessels:
+        for trades in args.scaling_trades:
+            one_args = Namespace(**vars(args))
+            one_args.trades = trades
+            one_args.vessels = vessels
+            one_args.months = args.scaling_months
+            run_id = settings_run_id(f"scaling_t{trades}_v{vessels}", params, one_args)
+            runs.append((run_id, params))
+            run_args[run_id] = one_args
+    if not args.fresh_trades:
+        for trades in args.scaling_trades:
+            load_or_create_trade_stream(args.stream_dir, args.seed, trades, args.scaling_months)
+    print(f"Scaling study over trades {args.scaling_trades} and vessels per type {args.scaling_vessels}, "
+          f"{args.scaling_months} months per run")
+
+    results_dir = "scaling_results"
+    os.makedirs(results_dir, exist_ok=True)
+    # a process per run, so the peak memory belongs to one cell
+    elapsed_time = run_combinations(args, runs, results_dir, run_args, fresh_process=True)
+    print(f"\nScaling study completed in {elapsed_time/60:.1f} minutes")
+
+    table = scaling_table(args.output, [run_id for run_id, _ in runs])
+    if table.empty:
+        print("No successful scaling runs")
+        return table
+    exponents = fit_growth_exponents(table)
+    table.to_csv(os.path.join(results_dir, "scaling_table.csv"), index=False)
+    exponents.to_csv(os.path.join(results_dir, "growth_exponents.csv"), index=False)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(table)
+        print(exponents)
+    over = table[(table['max_inform_seconds'] > GLOBAL_AGENT_TIMEOUT) |
+                 (table['max_receive_seconds'] > GLOBAL_AGENT_TIMEOUT)]
+    for company, one_company in over.groupby('company'):
+        cells = ", ".join(f"{row.trades} trades/{row.vessels} vessels" for row in one_company.itertuples())
+        print(f"{company} exceeds the {GLOBAL_AGENT_TIMEOUT} s agent timeout at: {cells}")
+    return table
+
 
 def main():
     args = parse_args()
     
     print("KBestBid Experiment Runner")
     print("-" * 40)
+
+    if not args.fresh_trades and args.mode != 'scaling':
+        # generate the stream once here, the workers only read it
+        load_or_create_trade_stream(args.stream_dir, args.seed, args.trades, args.months)
     
     if args.mode == 'single':
         print(f"Running single experiment with parameters:")
@@ -376,7 +673,18 @@ def main():
     elif args.mode == 'subset':
         print(f"Running parameter subset with config: {args.config or 'default'}")
         run_parameter_subset(args)
-        
+
+    elif args.mode == 'halving':
+        print(f"Running successive halving with config: {args.config or 'default'}")
+        run_successive_halving(args)
+
+    elif args.mode == 'scaling':
+        run_scaling_study(args)
+
+    if args.profile:
+        # merged over all auctions and runs of the invocation, and of earlier ones in the same directory
+        merge_profiles(args.profile_dir)
+
     print("\nExperiment completed!")
 
 if __name__ == '__main__':
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 08:20
+# @Author  : mmai
+# @FileName: snapshots
+# @Software: PyCharm
+
+"""
+The self-contained snapshot format of a decision's inputs (trades, vessels, distances) and its rebuild from real
+mable objects, shared by the auction recording/replay tool and the decomposed solver workers.
+"""
+
+import math
+import attrs
+from mable.competition.information import CompanyHeadquarters
+from mable.extensions.cargo_distributions import TimeWindowTrade
+from mable.extensions.fuel_emissions import VesselWithEngine, VesselEngine, ConsumptionRate, Fuel
+from mable.simulation_space.universe import Location, Port, OnJourney
+from mable.transport_operation import CargoCapacity
+from mable.transportation_scheduling import Schedule
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Snapshot
+# ---------------------------------------------------------------------------------------------------------------------
+
+def location_key(location):
+    if location.name is not None:
+        return location.name
+    return f"@{location.x:.6f},{location.y:.6f}"
+
+
+def resolve_location(headquarters, vessel):
+    """The vessel's current location as a Location, also when it is on a journey"""
+    location = vessel.location
+    if isinstance(location, OnJourney):
+        location = headquarters.get_journey_location(location, vessel)
+    elif isinstance(location, str):
+        location = headquarters.get_network_port_or_default(location, None)
+    return location
+
+
+def vessel_to_record(vessel, location):
+    engine = vessel.propelling_engine
+    return {
+        'name': vessel.name,
+        'location': location_key(location),
+        'speed': vessel.speed,
+        'capacities': [{'cargo_type': c.cargo_type, 'loading_rate': c.loading_rate, 'capacity': c.capacity}
+                       for c in vessel.capacities_and_loading_rates],
+        'engine': {
+            'fuel': attrs.asdict(engine.fuel),
+            'idle_consumption': engine._idle_consumption,
+            'laden_consumption_rate': attrs.asdict(engine._laden_consumption_rate),
+            'ballast_consumption_rate': attrs.asdict(engine._ballast_consumption_rate),
+            'loading_consumption': engine._loading_consumption,
+            'unloading_consumption': engine._unloading_consumption,
+        },
+    }
+
+
+def snapshot_inputs(headquarters, fleet, trades, payments=None, committed=True):
+    """
+    The decision inputs of a snapshot (see auction_replay.snapshot_auction) for any fleet, e.g. a vessel group of a
+    decomposed solve.
+    Without committed, the schedules are left out and only the auction trades' locations are recorded.
+    """
+    trade_ids = {}
+    trade_records = {}
+    locations = {}
+
+    def add_trade(trade):
+        if trade not in trade_ids:
+            trade_id = str(len(trade_ids))
+            trade_ids[trade] = trade_id
+            for port in (trade.origin_port, trade.destination_port):
+                locations[location_key(port)] = port
+            trade_records[trade_id] = {
+                'origin_port': location_key(trade.origin_port),
+                'destination_port': location_key(trade.destination_port),
+                'amount': trade.amount,
+                'cargo_type': trade.cargo_type,
+                'time': trade.time,
+                'time_window': list(trade.time_window),
+            }
+        return trade_ids[trade]
+
+    auction_trades = [add_trade(trade) for trade in trades]
+    vessels = []
+    for vessel in fleet:
+        location = resolve_location(headquarters, vessel)
+        locations[location_key(location)] = location
+        record = vessel_to_record(vessel, location)
+        schedule = vessel.schedule
+        record['schedule_head'] = schedule._time_schedule_head
+        record['committed'] = ([[event, add_trade(trade)] for event, trade in schedule.get_simple_schedule()]
+                               if committed else [])
+        vessels.append(record)
+
+    keys = list(locations.keys())
+    distances = []
+    for key_one in keys:
+        row = []
+        for key_two in keys:
+            distance = headquarters.get_network_distance(locations[key_one], locations[key_two])
+            row.append(None if distance is None or distance == math.inf else distance)
+        distances.append(row)
+
+    return {
+        'time': headquarters.current_time,
+        'trades': trade_records,
+        'auction_trades': auction_trades,
+        'payments': {trade_ids[trade]: payment for trade, payment in (payments or {}).items()},
+        'vessels': vessels,
+        'locations': [{'key': key, 'name': locations[key].name, 'x': locations[key].x, 'y': locations[key].y}
+                      for key in keys],
+        'distances': distances,
+    }
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Rebuild
+# ---------------------------------------------------------------------------------------------------------------------
+
+class ReplayNetwork:
+    """Distance lookups from the recorded distance table, in place of the routing network"""
+    def __init__(self, locations, distances):
+        self.index = {location_key(location): i for i, location in enumerate(locations)}
+        self.ports = {location.name: location for location in locations if location.name is not None}
+        self.distances = distances
+
+    def get_distance(self, location_one, location_two):
+        if isinstance(location_one, str):
+            location_one = self.ports[location_one]
+        if isinstance(location_two, str):
+            location_two = self.ports[location_two]
+        distance = self.distances[self.index[location_key(location_one)]][self.index[location_key(location_two)]]
+        return math.inf if distance is None else distance
+
+    def get_vessel_location(self, vessel, current_time):
+        return vessel.location
+
+    def get_port_or_default(self, port_name, default=None):
+        return self.ports.get(port_name, default)
+
+
+class ReplayWorld:
+    def __init__(self, network, current_time):
+        self.network = network
+        self.current_time = current_time
+
+
+class ReplayEngine:
+    """
+    The parts of the simulation engine the schedules, the headquarters and apply_schedules use.
+    Applied schedules are kept for evaluation instead of being executed.
+    """
+    def __init__(self, world):
+        self.world = world
+        self.applied_schedules = {}
+
+    def add_new_schedules(self, company, schedules, current_time):
+        self.applied_schedules.update(schedules)
+
+
+def build_replay(snapshot):
+    """
+    Rebuild the decision inputs of a snapshot from real mable objects on top of the recorded network.
+    Output: (engine, headquarters, fleet, auction trades, payments per trade)
+    Trades already picked up when the snapshot was taken cannot be re-inserted with add_transportation
+    and are left out of the committed schedules.
+    """
+    locations = []
+    for record in snapshot['locations']:
+        if record['name'] is not None:
+            locations.append(Port(record['name'], record['x'], record['y']))
+        else:
+            locations.append(Location(record['x'], record['y']))
+    network = ReplayNetwork(locations, snapshot['distances'])
+    by_key = {record['key']: location for record, location in zip(snapshot['locations'], locations)}
+    world = ReplayWorld(network, snapshot['time'])
+    engine = ReplayEngine(world)
+    headquarters = CompanyHeadquarters(engine)
+
+    trades = {}
+    for trade_id, record in snapshot['trades'].items():
+        trades[trade_id] = TimeWindowTrade(
+            origin_port=by_key[record['origin_port']],
+            destination_port=by_key[record['destination_port']],
+            amount=record['amount'],
+            cargo_type=record['cargo_type'],
+            time=record['time'],
+            time_window=list(record['time_window']))
+
+    fleet = []
+    for record in snapshot['vessels']:
+        engine_record = record['engine']
+        propelling_engine = VesselEngine(
+            Fuel(**engine_record['fuel']),
+            engine_record['idle_consumption'],
+            ConsumptionRate(**engine_record['laden_consumption_rate']),
+            ConsumptionRate(**engine_record['ballast_consumption_rate']),
+            engine_record['loading_consumption'],
+            engine_record['unloading_consumption'])
+        capacities = [CargoCapacity(**capacity) for capacity in record['capacities']]
+        vessel = VesselWithEngine(capacities, by_key[record['location']], record['speed'], propelling_engine,
+                                  name=record['name'])
+        vessel.set_engine(engine)
+        vessel._schedule = rebuild_schedule(vessel, engine, record, trades)
+        fleet.append(vessel)
+
+    auction_trades = [trades[trade_id] for trade_id in snapshot['auction_trades']]
+    payments = {trades[trade_id]: payment for trade_id, payment in snapshot['payments'].items()}
+    return engine, headquarters, fleet, auction_trades, payments
+
+
+def rebuild_schedule(vessel, engine, record, trades):
+    """
+    Re-insert the committed trades in order of pick up; after inserting a trade, the tasks of the inserted trades
+    are in their recorded order, so the insertion positions follow from the recorded sequence.
+    """
+    # add_transportation on an empty schedule takes the head from the world time
+    snapshot_time = engine.world.current_time
+    engine.world.current_time = record['schedule_head']
+    schedule = Schedule(vessel, record['schedule_head'])
+    schedule.set_engine(engine)
+    committed = [(event, trades[trade_id]) for event, trade_id in record['committed']]
+    # a trade whose pick up already happened is in progress and cannot be re-inserted; leave it out
+    not_started = set(trade for event, trade in committed if event == 'PICK_UP')
+    committed = [(event, trade) for event, trade in committed if trade in not_started]
+    inserted = set()
+    for event, trade in committed:
+        if event != 'PICK_UP':
+            continue
+        inserted.add(trade)
+        sequence = [(e, t) for e, t in committed if t in inserted]
+        pick_up_position = sequence.index(('PICK_UP', trade)) + 1
+        drop_off_position = sequence.index(('DROP_OFF', trade)) + 1
+        schedule.add_transportation(trade, pick_up_position, drop_off_position - 1)
+    engine.world.current_time = snapshot_time
+    return schedule
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 20:10
+# @Author  : mmai
+# @FileName: telemetry
+# @Software: PyCharm
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+class MemoryPeaks:
+    """
+    Peak traced memory of overlapping windows, e.g. the phases of companies deciding in parallel threads.
+    tracemalloc keeps a single peak for the process, so before every reset the peak so far is folded into all
+    windows that are still open.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}
+
+    def _fold(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for window in self._open.values():
+            window[1] = max(window[1], peak)
+        tracemalloc.reset_peak()
+
+    def begin(self):
+        with self._lock:
+            self._fold()
+            current = tracemalloc.get_traced_memory()[0]
+            window = [current, current]
+            self._open[id(window)] = window
+        return window
+
+    def end(self, window):
+        """Output: (net bytes, peak bytes above the traced memory at the start of the window)"""
+        with self._lock:
+            current = tracemalloc.get_traced_memory()[0]
+            self._fold()
+            del self._open[id(window)]
+        return current - window[0], window[1] - window[0]
+
+
+MEMORY_PEAKS = MemoryPeaks()
+
+
+class DecisionTelemetry:
+    """
+    Per-auction timings of a company: one record per pre_inform, inform and receive call with the seconds spent in
+    each phase (sampling, aggregation, pricing, schedule_trades, apply_schedules, ...) and counters (candidates,
+    simulations, schedule_copies, ...). The records are kept in a ring buffer of the last `capacity` decisions.
+
+    mable runs every call in a thread and abandons it on timeout, so the open decision is kept per thread and a
+    timed-out call still running in the background cannot mix its timings into the next one.
+
+    Every phase and span block is also kept as a span (name, start relative to the decision, seconds, thread,
+    attributes), which chrome_trace_events turns into a timeline.
+
+    While tracemalloc is tracing (see profiling.MemoryProfiler), every phase also records the net and peak traced
+    bytes in record['memory_phases']. The traced memory is that of the whole process, so phases that overlap with
+    other companies include their allocations too.
+    """
+    def __init__(self, company_name, capacity=256):
+        self.company_name = company_name
+        self.records = deque(maxlen=capacity)
+        self._local = threading.local()
+
+    @property
+    def current(self):
+        return getattr(self._local, 'record', None)
+
+    @contextmanager
+    def decision(self, call, trades=None):
+        """Time one decision call, nested decisions (e.g. a temporary company) are folded into the outer one"""
+        if self.current is not None:
+            yield self.current
+            return
+        time_start = time.perf_counter()
+        record = {
+            'call': call,
+            'started': time.time(),
+            'trades': trades,
+            'seconds': None,
+            'thread': threading.get_ident(),
+            'phases': defaultdict(float),
+            'counters': defaultdict(int),
+            'spans': [],
+            '_clock': time_start,
+        }
+        self._local.record = record
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - time_start
+            record['phases'] = dict(record['phases'])
+            record['counters'] = dict(record['counters'])
+            del record['_clock']
+            self._local.record = None
+            self.records.append(record)
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the block to a phase of the open decision, repeated phases accumulate"""
+        record = self.current
+        if record is None:
+            yield
+            return
+        window = MEMORY_PEAKS.begin() if tracemalloc.is_tracing() else None
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            time_end = time.perf_counter()
+            record['phases'][name] += time_end - time_start
+            if window is None:
+                self.add_span(name, time_start, time_end)
+            else:
+                net_bytes, peak_bytes = MEMORY_PEAKS.end(window)
+                memory = record.setdefault('memory_phases', {}).setdefault(name, {'net_bytes': 0, 'peak_bytes': 0})
+                memory['net_bytes'] += net_bytes
+                memory['peak_bytes'] = max(memory['peak_bytes'], peak_bytes)
+                self.add_span(name, time_start, time_end, net_bytes=net_bytes, peak_bytes=peak_bytes)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Keep the block as a span of the open decision without adding it to the phases, e.g. one k-best sample.
+        The attributes dict is yielded, so the block can add attributes it only knows at the end.
+        """
+        if self.current is None:
+            yield attributes
+            return
+        time_start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.add_span(name, time_start, time.perf_counter(), **attributes)
+
+    def add_span(self, name, start, end, thread=None, **attributes):
+        """
+        Add a span measured elsewhere (e.g. in a solver thread or a forked worker) to the open decision.
+        Input: start and end from time.perf_counter, which is one clock for every thread and process of the machine
+        """
+        record = self.current
+        if record is None:
+            return
+        record['spans'].append({
+            'name': name,
+            'start': start - record['_clock'],
+            'seconds': end - start,
+            'thread': threading.get_ident() if thread is None else thread,
+            'attributes': attributes,
+        })
+
+    def count(self, name, n=1):
+        record = self.current
+        if record is not None:
+            record['counters'][name] += n
+
+    def export(self):
+        """Output: list of decision records, oldest first"""
+        return [dict(record, company=self.company_name) for record in self.records]
+
+    def summary(self):
+        """
+        Output: {call: {'decisions', 'mean_seconds', 'max_seconds', 'phases': {phase: mean seconds},
+        'counters': {counter: mean per decision}}}
+        """
+        by_call = defaultdict(list)
+        for record in self.records:
+            by_call[record['call']].append(record)
+        summary = {}
+        for call, records in by_call.items():
+            phases = defaultdict(float)
+            counters = defaultdict(float)
+            for record in records:
+                for name, seconds in record['phases'].items():
+                    phases[name] += seconds / len(records)
+                for name, n in record['counters'].items():
+                    counters[name] += n / len(records)
+            seconds = [record['seconds'] for record in records]
+            summary[call] = {
+                'decisions': len(records),
+                'mean_seconds': sum(seconds) / len(seconds),
+                'max_seconds': max(seconds),
+                'phases': dict(phases),
+                'counters': dict(counters),
+            }
+        return summary
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'company': self.company_name, 'summary': self.summary(), 'decisions': self.export()},
+                      f, indent=2)
+
+
+def chrome_trace_events(company_name, records, pid):
+    """
+    Chrome Trace Event format (chrome://tracing, Perfetto, speedscope) of the decision records of one company:
+    the company is a process, every decision and span a complete event on the thread that ran it.
+    Input: records as returned by DecisionTelemetry.export
+    Output: list of trace events, timestamps in microseconds
+    """
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': company_name}}]
+    for record in records:
+        started = record['started'] * 1e6
+        events.append({
+            'name': record['call'],
+            'cat': 'decision',
+            'ph': 'X',
+            'ts': started,
+            'dur': record['seconds'] * 1e6,
+            'pid': pid,
+            'tid': record['thread'],
+            'args': dict(record['counters'], trades=record['trades']),
+        })
+        for span in record['spans']:
+            events.append({
+                'name': span['name'],
+                'cat': record['call'],
+                'ph': 'X',
+                'ts': started + span['start'] * 1e6,
+                'dur': span['seconds'] * 1e6,
+                'pid': pid,
+                'tid': span['thread'],
+                'args': span['attributes'],
+            })
+    return events
+
+
+def save_chrome_trace(companies, path):
+    """Save the decisions of every company that has a telemetry to one Chrome trace JSON file"""
+    events = []
+    for pid, company in enumerate(companies, start=1):
+        telemetry = getattr(company, 'telemetry', None)
+        if isinstance(telemetry, DecisionTelemetry):
+            events.extend(chrome_trace_events(company.name, telemetry.export(), pid))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def save_company_telemetry(companies, directory):
+    """Save the telemetry of every company that has one to directory/<company name>.json"""
+    os.makedirs(directory, exist_ok=True)
+    for company in companies:
+        telemetry = getattr(company, 'telemetry', None)
+        if isinstance(telemetry, DecisionTelemetry):
+            telemetry.save(os.path.join(directory, f"{company.name}.json"))
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    parser = argparse.ArgumentParser(description='Convert saved company telemetry to one Chrome trace JSON file')
+    parser.add_argument('directory', type=str, help='Directory with the <company>.json files of a run')
+    parser.add_argument('--output', type=str, default=None, help='Trace file, default <directory>/trace.json')
+    cli_args = parser.parse_args()
+    trace_events = []
+    for pid, telemetry_path in enumerate(sorted(glob.glob(os.path.join(cli_args.directory, '*.json'))), start=1):
+        with open(telemetry_path) as f:
+            saved = json.load(f)
+        if 'decisions' in saved:
+            trace_events.extend(chrome_trace_events(saved['company'], saved['decisions'], pid))
+    output_path = cli_args.output or os.path.join(cli_args.directory, 'trace.json')
+    with open(output_path, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+    print(f"Saved {len(trace_events)} trace events to {output_path}")
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 07:10
+# @Author  : mmai
+# @FileName: test_utils
+# @Software: PyCharm
+
+from types import SimpleNamespace
+from mable.simulation_space.universe import OnJourney
+from snapshots import build_replay
+from instances import generate_instance
+from utils import (TradeRecords, simulate_schedule_cost, simulate_schedule_cost_allocated_shared_arrival,
+                   schedule_events, port_visits, insert_port_visit, insert_trade_events, reachability_index,
+                   insertion_candidates, insert_trades_by_event_times)
+
+
+class JourneyHeadquarters:
+    """The replay headquarters, with a vessel on a journey placed at the origin of its journey"""
+    def __init__(self, headquarters):
+        self.headquarters = headquarters
+
+    def get_network_distance(self, location_one, location_two):
+        if isinstance(location_one, OnJourney):
+            location_one = location_one.origin
+        if isinstance(location_two, OnJourney):
+            location_two = location_two.origin
+        return self.headquarters.get_network_distance(location_one, location_two)
+
+
+def replay_with_vessel_at_sea():
+    snapshot = generate_instance(seed=0, trades=4, vessels=2, ports=6, committed=0)
+    engine, headquarters, fleet, trades, payments = build_replay(snapshot)
+    vessel = fleet[0]
+    schedule = vessel.schedule.copy()
+    schedule.add_transportation(trades[0])
+    port = vessel.location
+    journey = OnJourney(port, trades[0].origin_port, snapshot['time'])
+    return JourneyHeadquarters(headquarters), fleet, trades, vessel, schedule, port, journey, snapshot['time']
+
+
+def test_trade_records_vessel_on_journey():
+    headquarters, fleet, trades, vessel, schedule, port, journey, start_time = replay_with_vessel_at_sea()
+    vessel.location = journey
+    records = TradeRecords(trades, fleet)
+    index = records.port_index(journey)
+    assert records.port_index(journey) == index
+    assert records.ports[index] is journey
+    assert records.port_index(port) != index
+
+
+def test_simulators_vessel_on_journey():
+    headquarters, fleet, trades, vessel, schedule, port, journey, start_time = replay_with_vessel_at_sea()
+    at_port_cost, _, _, _ = simulate_schedule_cost(vessel, schedule, start_time, headquarters,
+                                                   records=TradeRecords(trades, fleet))
+    at_port_shared_cost = simulate_schedule_cost_allocated_shared_arrival(vessel, schedule, start_time, headquarters,
+                                                                          records=TradeRecords(trades, fleet))[0]
+    vessel.location = journey
+    at_sea_cost, _, _, _ = simulate_schedule_cost(vessel, schedule, start_time, headquarters,
+                                                  records=TradeRecords(trades, fleet))
+    at_sea_shared_cost = simulate_schedule_cost_allocated_shared_arrival(vessel, schedule, start_time, headquarters,
+                                                                         records=TradeRecords(trades, fleet))[0]
+    assert at_sea_cost == at_port_cost
+    assert at_sea_shared_cost == at_port_shared_cost
+
+
+def replay_with_committed_trades(seed=1, tightness=0.0, cargo_types=('Oil',)):
+    snapshot = generate_instance(seed=seed, trades=8, vessels=3, ports=8, committed=2, tightness=tightness,
+                                 cargo_types=cargo_types)
+    engine, headquarters, fleet, trades, payments = build_replay(snapshot)
+    return headquarters, fleet, trades, snapshot['time']
+
+
+def inserted(schedule, trade, location_pick_up, location_drop_off):
+    """The schedule with the trade added at the given positions if verify_schedule accepts it, otherwise None"""
+    schedule = schedule.copy()
+    try:
+        schedule.add_transportation(trade, location_pick_up, location_drop_off)
+        is_valid = schedule.verify_schedule()
+    except (ValueError, KeyError):
+        is_valid = False
+    return schedule if is_valid else None
+
+
+def all_insertions(schedule):
+    insertion_points = list(schedule.get_insertion_points())
+    return [(i, j) for i in insertion_points for j in range(i, insertion_points[-1] + 1)]
+
+
+def test_insertion_candidates_keep_every_feasible_insertion():
+    for tightness in (0.0, 1.0):
+        headquarters, fleet, trades, start_time = replay_with_committed_trades(tightness=tightness)
+        records = TradeRecords(trades, fleet)
+        feasible = 0
+        for vessel in fleet:
+            for trade in trades:
+                candidates = insertion_candidates(vessel.schedule, trade, vessel, headquarters, records=records)
+                enumeration = all_insertions(vessel.schedule)
+                valid = [position for position in enumeration if inserted(vessel.schedule, trade, *position)]
+                assert set(valid) <= set(candidates)
+                assert candidates == [position for position in enumeration if position in candidates]
+                feasible += len(valid)
+                spatial = insertion_candidates(vessel.schedule, trade, vessel, headquarters, detour_hours=24,
+                                               nearest_stops=1, records=records)
+                assert set(spatial) <= set(candidates)
+                if enumeration[-1] in candidates:
+                    assert enumeration[-1] in spatial
+        assert feasible > 0
+
+
+class DisconnectedHeadquarters:
+    """The replay headquarters, with a port the network does not connect to any other port"""
+    def __init__(self, headquarters, port):
+        self.headquarters = headquarters
+        self.port = port
+
+    def get_network_distance(self, location_one, location_two):
+        if location_one != location_two and self.port in (location_one, location_two):
+            return None
+        return self.headquarters.get_network_distance(location_one, location_two)
+
+
+def test_insertion_candidates_disconnected_port():
+    headquarters, fleet, trades, start_time = replay_with_committed_trades()
+    for trade in trades:
+        disconnected = DisconnectedHeadquarters(headquarters, trade.origin_port)
+        for vessel in fleet:
+            records = TradeRecords(trades, fleet)
+            candidates = insertion_candidates(vessel.schedule, trade, vessel, disconnected, records=records)
+            end = all_insertions(vessel.schedule)[-1]
+            spatial = insertion_candidates(vessel.schedule, trade, vessel, disconnected, detour_hours=24,
+                                           records=records)
+            assert (end in spatial) == (end in candidates)
+            # a pick-up before the end is only kept between stops at the disconnected port itself
+            ports = [vessel.location] + [scheduled.origin_port if event == 'PICK_UP' else scheduled.destination_port
+                                         for event, scheduled in vessel.schedule.get_simple_schedule()]
+            for i, j in spatial:
+                assert i == end[0] or trade.origin_port in ports[i - 1:i + 1]
+            assert set(insertion_candidates(vessel.schedule, trade, vessel, disconnected, detour_hours=24,
+                                            nearest_stops=2, records=records)) <= set(candidates)
+
+
+def test_insert_port_visit_matches_port_visits():
+    ports = [0, 0, 1, 2, 2, 0, 1]
+    for length in range(len(ports) + 1):
+        events = [('PICK_UP', SimpleNamespace(origin=port)) for port in ports[:length]]
+        for position in range(length + 1):
+            for port in range(4):
+                spliced = events[:position] + [('DROP_OFF', SimpleNamespace(destination=port))] + events[position:]
+                assert insert_port_visit(port_visits(events), position, port) == port_visits(spliced)
+
+
+def test_insert_trade_events_matches_new_schedule():
+    headquarters, fleet, trades, start_time = replay_with_committed_trades()
+    records = TradeRecords(trades, fleet)
+    vessel = fleet[0]
+    events = schedule_events(vessel.schedule, records)
+    for trade in trades:
+        for position in all_insertions(vessel.schedule):
+            schedule = vessel.schedule.copy()
+            schedule.add_transportation(trade, *position)
+            new_events, new_visits = insert_trade_events(events, port_visits(events), records[trade], *position)
+            assert new_events == schedule_events(schedule, records)
+            assert new_visits == port_visits(new_events)
+
+
+def test_reachability_index_prunes_only_infeasible_vessels():
+    headquarters, fleet, trades, start_time = replay_with_committed_trades(tightness=1.0, cargo_types=('Oil', 'Gas'))
+    records = TradeRecords(trades, fleet)
+    index = reachability_index(trades, fleet, headquarters, start_time, records)
+    pruned = [(trade, vessel) for trade in trades for vessel in fleet if vessel not in index[trade]]
+    assert pruned
+    for trade, vessel in pruned:
+        assert not any(inserted(vessel.schedule, trade, *position) for position in all_insertions(vessel.schedule))
+    for trade in trades:
+        assert index[trade] == [vessel for vessel in fleet if vessel in index[trade]]
+
+
+def test_insert_trades_by_event_times_follows_planned_order():
+    snapshot = generate_instance(seed=0, trades=8, vessels=2, ports=8, committed=1)
+    _, headquarters, fleet, trades, _ = build_replay(snapshot)
+    vessel = fleet[0]
+    committed = vessel.schedule.get_simple_schedule()
+    n = len(committed)
+    # two trades that fit both interleaved and one after the other behind the committed tasks
+    pair = None
+    for first in trades:
+        for second in trades:
+            if first is second or pair is not None:
+                continue
+            schedule = inserted(vessel.schedule, first, n + 1, n + 1)
+            if schedule and inserted(schedule, second, n + 2, n + 3) and inserted(schedule, second, n + 3, n + 3):
+                pair = first, second
+    assert pair is not None
+    first, second = pair
+    # events are placed by bisect_right over the planned times: a tie goes after the event already placed
+    for second_pickup, expected in (
+            (2, [('PICK_UP', first), ('PICK_UP', second), ('DROP_OFF', first), ('DROP_OFF', second)]),
+            (3, [('PICK_UP', first), ('DROP_OFF', first), ('PICK_UP', second), ('DROP_OFF', second)])):
+        pickup_times = {first: 1, second: second_pickup}
+        dropoff_times = {first: 3, second: 4}
+        schedule, inserted_trades, rejected_trades = insert_trades_by_event_times(
+            vessel.schedule, [second, first], pickup_times, dropoff_times)
+        assert inserted_trades == [first, second] and rejected_trades == []
+        simple_schedule = schedule.get_simple_schedule()
+        assert simple_schedule[:n] == committed
+        assert [(event, trade) for event, trade in simple_schedule[n:]] == expected
+    assert vessel.schedule.get_simple_schedule() == committed
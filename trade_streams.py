@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# @Time    : 19/10/2026 16:40
+# @Author  : mmai
+# @FileName: trade_streams
+# @Software: PyCharm
+
+import gzip
+import json
+import os
+from mable.examples import environment
+
+TRADE_OCCURRENCE_FREQUENCY = 30  # days between auctions, mable's default
+
+
+def stream_path(stream_dir, seed, trades):
+    return os.path.join(stream_dir, f"trades_t{trades}_s{seed}.json.gz")
+
+
+def trade_to_record(trade):
+    return {
+        'origin_port': trade.origin_port.name,
+        'destination_port': trade.destination_port.name,
+        'amount': trade.amount,
+        'cargo_type': trade.cargo_type,
+        'time': trade.time,
+        'time_window': list(trade.time_window),
+    }
+
+
+def generate_trade_stream(seed, trades, months):
+    """
+    Generate the realised trades of a simulation with the given seed, as plain records.
+    The realisation draw (trade probability) is done here, so every replay sees exactly the same cargoes.
+    """
+    specifications_builder = environment.get_specification_builder(
+        trades_per_occurrence=trades,
+        num_auctions=months)
+    specifications_builder.add_random_specifications(seed=seed)
+    sim = environment.generate_simulation(specifications_builder)
+    records = []
+    for one_time in sorted(sim.shipping.get_trading_times()):
+        for trade in sim.shipping.get_trades(one_time):
+            records.append(trade_to_record(trade))
+    return records
+
+
+def load_or_create_trade_stream(stream_dir, seed, trades, months):
+    """
+    Load the persisted trade stream of a seed, generating and saving it first if it does not exist or is
+    shorter than months. A stream covers every shorter horizon, so one file per (seed, trades) is enough.
+    Output: list of trade records
+    """
+    path = stream_path(stream_dir, seed, trades)
+    if os.path.exists(path):
+        with gzip.open(path, 'rt') as f:
+            stream = json.load(f)
+        if stream['months'] >= months:
+            return stream['trades']
+    os.makedirs(stream_dir, exist_ok=True)
+    records = generate_trade_stream(seed, trades, months)
+    # write then rename, so a worker never reads a half-written stream
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wt') as f:
+        json.dump({'seed': seed, 'trades_per_occurrence': trades, 'months': months, 'trades': records},
+                  f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    print(f"Trade stream for seed {seed} saved to {path} ({len(records)} trades)")
+    return records
+
+
+def fixed_trades_for_months(records, months):
+    """
+    Fresh trade specifications for get_specification_builder(fixed_trades=...), truncated to the horizon.
+    mable replaces the port names by ports in place, so every simulation needs its own copy.
+    """
+    horizon = months * TRADE_OCCURRENCE_FREQUENCY * 24
+    return [dict(record, time_window=list(record['time_window']))
+            for record in records if record['time'] <= horizon]
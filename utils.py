@@ -4,9 +4,208 @@
 # @FileName: utils
 # @Software: PyCharm
 from collections import defaultdict
+from bisect import bisect_right, insort
 
+# hours after the start time the simulators account a vessel's idle time for, the default planning horizon
+PLANNING_HORIZON = 720
+# seconds pre_inform may spend on speculative plans; mable abandons it after 60
+SPECULATION_DEADLINE = 50
+# seconds a receive decision may spend on its plan; mable abandons it after 60
+RECEIVE_DEADLINE = 55
 
-def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy, start_time, headquarters=None, payments=None):
+
+class TradeRecord:
+    """
+    The fields of a trade the simulators read, taken from the mable trade once: ports as indices of the TradeRecords
+    they belong to and the time windows with None (or a missing window) replaced by -inf/inf.
+    """
+    __slots__ = ('trade', 'origin', 'destination', 'cargo_type', 'amount',
+                 'earliest_pickup', 'latest_pickup', 'earliest_dropoff', 'latest_dropoff')
+
+    def __init__(self, trade, origin, destination):
+        self.trade = trade
+        self.origin = origin
+        self.destination = destination
+        self.cargo_type = trade.cargo_type
+        self.amount = trade.amount
+        window = list(trade.time_window or ())
+        window += [None] * (4 - len(window))
+        self.earliest_pickup = float('-inf') if window[0] is None else window[0]
+        self.latest_pickup = float('inf') if window[1] is None else window[1]
+        self.earliest_dropoff = float('-inf') if window[2] is None else window[2]
+        self.latest_dropoff = float('inf') if window[3] is None else window[3]
+
+
+class TradeRecords:
+    """
+    The TradeRecord of every trade of an auction, built once for the auction trades and the trades already on the
+    vessel schedules and shared by every simulation of the auction. A trade that was not precomputed gets its record
+    on first use, so the simulators also work without one.
+    Records are looked up by id: mable trades hash by formatting their time window, which costs more than the
+    lookup itself. Ports are numbered in order of appearance; network distances are cached per pair of port indices.
+    """
+    def __init__(self, trades=(), fleets=()):
+        self.ports = []
+        self._records = {}
+        self._port_indices = {}
+        self._distances = {}
+        for trade in trades:
+            self[trade]
+        for vessel in fleets:
+            self.port_index(vessel.location)
+            for trade in vessel.schedule.get_scheduled_trades():
+                self[trade]
+
+    def __getitem__(self, trade):
+        # the record keeps the trade alive, so its id is not reused while the record exists
+        record = self._records.get(id(trade))
+        if record is None:
+            record = TradeRecord(trade, self.port_index(trade.origin_port), self.port_index(trade.destination_port))
+            self._records[id(trade)] = record
+        return record
+
+    def __len__(self):
+        return len(self._records)
+
+    def port_index(self, port):
+        # a vessel on a journey is at an OnJourney location, which does not hash; it is kept by id like the trades
+        key = port if type(port).__hash__ is not None else id(port)
+        index = self._port_indices.get(key)
+        if index is None:
+            index = self._port_indices[key] = len(self.ports)
+            self.ports.append(port)
+        return index
+
+    def distance(self, headquarters, origin, destination):
+        """Network distance between two port indices"""
+        key = (origin, destination)
+        distance = self._distances.get(key)
+        if distance is None:
+            distance = self._distances[key] = headquarters.get_network_distance(self.ports[origin],
+                                                                                self.ports[destination])
+        return distance
+
+
+def fleet_state(fleet):
+    """
+    What a plan of the fleet assumes: the location and the scheduled events of every vessel.
+    Output: a tuple that stays equal as long as no vessel moved or changed its schedule
+    """
+    return tuple((vessel.name, repr(vessel.location),
+                  tuple((event_type, id(trade)) for event_type, trade in vessel.schedule.get_simple_schedule()))
+                 for vessel in fleet)
+
+
+class AnnouncedAuction:
+    """
+    What pre_inform prepares for an announced auction, for inform to reuse. The trade records, with the laden
+    distance of every trade cached, only depend on the trades. The reachability index and the plans (k-best samples,
+    a whole proposal) depend on the fleet too, which may change before the auction is held: mable announces an
+    auction before deciding the one ahead of it. They are only valid while the fleet_state is unchanged, and the
+    plans only while the auctioned trades are the announced ones (some announced trades may not be realised).
+    """
+    def __init__(self, trades, start_time, fleet, headquarters):
+        self.trades = list(trades)
+        self.start_time = start_time
+        self.records = TradeRecords(trades, fleet)
+        for trade in trades:
+            record = self.records[trade]
+            self.records.distance(headquarters, record.origin, record.destination)
+        self.fleet_state = fleet_state(fleet)
+        self.candidate_vessels = None
+        self.samples = []
+        self.proposal = None
+
+    def fleet_unchanged(self, fleet):
+        return fleet_state(fleet) == self.fleet_state
+
+    def same_trades(self, trades):
+        announced = set(id(trade) for trade in self.trades)
+        return len(trades) == len(announced) and all(id(trade) in announced for trade in trades)
+
+
+def take_announced_auction(announced_auctions, trades, start_time):
+    """
+    Pop the AnnouncedAuction of the auction at start_time and drop those of earlier auctions.
+    Input: announced_auctions: {start time: AnnouncedAuction}
+    Output: AnnouncedAuction, or None if the auction was not announced or other trades are auctioned
+    """
+    for announced_time in [announced_time for announced_time in announced_auctions if announced_time < start_time]:
+        del announced_auctions[announced_time]
+    announced = announced_auctions.pop(start_time, None)
+    if announced is None:
+        return None
+    announced_ids = set(id(trade) for trade in announced.trades)
+    if not all(id(trade) in announced_ids for trade in trades):
+        return None
+    return announced
+
+
+def schedule_events(schedule, records):
+    """Output: the simple schedule with the trades replaced by their records, [(event type, TradeRecord)]"""
+    return [(event_type, records[trade]) for event_type, trade in schedule.get_simple_schedule()]
+
+
+def port_visits(events):
+    """
+    Run-length encoding of the ports of a list of events: one (port index, first event, end event) per block of
+    consecutive events at the same port, so events[first:end] are handled in one port call.
+    """
+    visits = []
+    first = 0
+    port = None
+    for index, (event_type, record) in enumerate(events):
+        event_port = record.origin if event_type == 'PICK_UP' else record.destination
+        if index > 0 and event_port != port:
+            visits.append((port, first, index))
+            first = index
+        port = event_port
+    if events:
+        visits.append((port, first, len(events)))
+    return visits
+
+
+def insert_port_visit(visits, position, port):
+    """
+    The port visits after inserting an event at the port before events[position]: the event joins a visit at the
+    same port it touches, otherwise it starts a visit of its own, splitting the visit it lands in. The visits after
+    it move up by one event.
+    """
+    k = 0
+    # at the end of a visit at the same port the event joins that visit
+    while k < len(visits) and (visits[k][2] < position or (visits[k][2] == position and visits[k][0] != port)):
+        k += 1
+    if k == len(visits):
+        return visits + [(port, position, position + 1)]
+    shifted = [(visit_port, first + 1, end + 1) for visit_port, first, end in visits[k + 1:]]
+    visit_port, first, end = visits[k]
+    if visit_port == port:
+        return visits[:k] + [(port, first, end + 1)] + shifted
+    if first == position:
+        return visits[:k] + [(port, position, position + 1), (visit_port, first + 1, end + 1)] + shifted
+    return visits[:k] + [(visit_port, first, position), (port, position, position + 1),
+                         (visit_port, position + 1, end + 1)] + shifted
+
+
+def insert_trade_events(events, visits, record, location_pick_up, location_drop_off):
+    """
+    The events and port visits of a schedule after add_transportation(trade, location_pick_up, location_drop_off),
+    updated from those of the schedule before the insertion instead of re-reading the new schedule.
+    Input: location_pick_up, location_drop_off as given to add_transportation (1-based task positions)
+    Output: (events, visits)
+    """
+    # the pick-up becomes events[location_pick_up - 1], the drop-off follows the shifted events[location_drop_off]
+    new_events = (events[:location_pick_up - 1] + [('PICK_UP', record)]
+                  + events[location_pick_up - 1:location_drop_off - 1] + [('DROP_OFF', record)]
+                  + events[location_drop_off - 1:])
+    new_visits = insert_port_visit(visits, location_pick_up - 1, record.origin)
+    new_visits = insert_port_visit(new_visits, location_drop_off, record.destination)
+    return new_events, new_visits
+
+
+def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy, start_time, headquarters=None,
+                                                    payments=None, records=None, events=None, visits=None,
+                                                    horizon=PLANNING_HORIZON):
     """
     Simulates a vessel's schedule, allocating travel costs to a port among
     trades on board AND trades involved in immediate events at that port.
@@ -19,6 +218,11 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
     is_feasible: bool
     pick_up_times: dict {trade_object: time}
     drop_off_times: dict {trade_object: time}
+
+    records: TradeRecords of the auction, shared by its simulations
+    events, visits: schedule_events and port_visits of the schedule if the caller keeps them up to date (see
+    insert_trade_events), otherwise they are derived from the schedule
+    horizon: hours after start_time until which the idle time of the vessel is charged
     """
     trade_specific_costs = defaultdict(float)
     total_idle_time = 0
@@ -29,18 +233,22 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
     is_feasible = True
 
     if not vessel_schedule_copy:
-        horizon_duration = 720
-        total_idle_time = horizon_duration
+        total_idle_time = horizon
         total_idle_cost = vessel.get_idle_consumption(total_idle_time)
         total_cost = total_idle_cost # Only idle cost if schedule is empty
         return total_cost, trade_specific_costs, total_idle_time, pick_up_times, drop_off_times
 
-    vessel_schedule = vessel_schedule_copy.get_simple_schedule()
-    vessel_trades = vessel_schedule_copy.get_scheduled_trades()
+    if records is None:
+        records = TradeRecords()
+    vessel_schedule = schedule_events(vessel_schedule_copy, records) if events is None else events
+    if visits is None:
+        visits = port_visits(vessel_schedule)
 
     current_time = float(start_time)
-    current_port = vessel.location
+    current_port = records.port_index(vessel.location)
+    # the sets and the cost allocation hold records, which hash much faster than mable trades
     trades_on_board = set()
+    record_costs = defaultdict(float)
 
     # Optional sorting (same as before) - important for grouping logic
     # try:
@@ -63,46 +271,10 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
     #     print("Warning: Could not sort vessel schedule based on time windows (IndexError - possibly incomplete time_window).")
     #     pass
 
-    processed_indices = set()
-    current_schedule_index = 0
-
-    while current_schedule_index < len(vessel_schedule):
-        if current_schedule_index in processed_indices:
-            current_schedule_index += 1
-            continue
-
-        # --- Identify the next block of events at the same target port ---
-        first_event_index = current_schedule_index
-        # Check if index is valid before accessing
-        if first_event_index >= len(vessel_schedule):
-             break # Should not happen if loop condition is correct, but safety check
-        first_event_type = vessel_schedule[first_event_index][0]
-        first_trade = vessel_schedule[first_event_index][1]
-
-        if first_event_type == 'PICK_UP':
-            target_port = first_trade.origin_port
-        elif first_event_type == 'DROP_OFF':
-            target_port = first_trade.destination_port
-        else:
-            current_schedule_index += 1
-            continue
-
-        # Find all consecutive events at this target_port
-        events_at_target_port_indices = []
-        trades_involved_at_target = set()
-        temp_idx = first_event_index
-        while temp_idx < len(vessel_schedule):
-            # Check if index is valid before accessing
-            if temp_idx >= len(vessel_schedule):
-                break
-            evt_type, trd = vessel_schedule[temp_idx]
-            port_for_this_event = trd.origin_port if evt_type == 'PICK_UP' else trd.destination_port
-            if port_for_this_event == target_port:
-                events_at_target_port_indices.append(temp_idx)
-                trades_involved_at_target.add(trd)
-                temp_idx += 1
-            else:
-                break # Stop when the port changes
+    for target_port, first_event_index, end_event_index in visits:
+        # --- The block of consecutive events at the same target port ---
+        events_at_target_port = vessel_schedule[first_event_index:end_event_index]
+        trades_involved_at_target = {rec for _, rec in events_at_target_port}
 
         # --- 1. Travel to the target port ---
         segment_travel_cost = 0
@@ -110,9 +282,9 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
         responsible_trades = set() # Initialize responsible_trades here as an empty set
 
         if current_port != target_port:
-            travel_distance = headquarters.get_network_distance(current_port, target_port)
+            travel_distance = records.distance(headquarters, current_port, target_port)
             if travel_distance is None or travel_distance == float('inf'):
-                 print(f"Error: Unreachable route from {current_port} to {target_port}")
+                 print(f"Error: Unreachable route from {records.ports[current_port]} to {records.ports[target_port]}")
                  is_feasible = False
                  break
 
@@ -135,56 +307,30 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
             if responsible_trades: # Avoid division by zero if set is empty
                 cost_share = segment_travel_cost / len(responsible_trades)
                 for t_resp in responsible_trades:
-                    trade_specific_costs[t_resp] += cost_share
+                    record_costs[t_resp] += cost_share
             elif segment_travel_cost > 0:
                  # Travel cost occurred but no trades identified as responsible? Log warning.
-                 print(f"Warning: Travel cost {segment_travel_cost} to {target_port} not allocated to any trade.")
+                 print(f"Warning: Travel cost {segment_travel_cost} to {records.ports[target_port]} not allocated to any trade.")
 
             # Update current time after travel
             current_time += travel_time
 
         # --- 2. Process Events at the Target Port ---
-        for event_idx in events_at_target_port_indices:
-            if event_idx in processed_indices: # Should not happen with current logic, but safe check
-                 continue
-
-            event_type = vessel_schedule[event_idx][0]
-            trade = vessel_schedule[event_idx][1]
-
-            # --- Determine event time window, handling None and potential errors ---
-            earliest_event_time = float('-inf') # Default: No earliest restriction
-            latest_event_time = float('inf')   # Default: No latest restriction
-
-            if trade.time_window is not None:
-                try:
-                    if event_type == 'PICK_UP':
-                        # Get potential earliest and latest times
-                        e_time = trade.time_window[0]
-                        l_time = trade.time_window[1]
-                        # Assign actual values, defaulting to infinity if None
-                        earliest_event_time = float('-inf') if e_time is None else e_time
-                        latest_event_time = float('inf') if l_time is None else l_time
-                    elif event_type == 'DROP_OFF':
-                        # Get potential earliest and latest times
-                        e_time = trade.time_window[2]
-                        l_time = trade.time_window[3]
-                        # Assign actual values, defaulting to infinity if None
-                        earliest_event_time = float('-inf') if e_time is None else e_time
-                        latest_event_time = float('inf') if l_time is None else l_time
-                    # else: # Optional: Handle unexpected event types if necessary
-                    #    print(f"Warning: Unknown event type '{event_type}' encountered.")
-
-                except IndexError:
-                    # Handles cases where time_window is too short (e.g., only has 2 elements)
-                    print(f"Warning: Incomplete time_window for trade {trade.origin_port} (Event: {event_type}). Treating as unbounded.")
-                    # Keep the default infinite bounds assigned earlier
-            # else: # trade.time_window is None
-                 # Keep the default infinite bounds assigned earlier
+        for event_type, record in events_at_target_port:
+            trade = record.trade
+
+            # the record has the infinite bounds of a missing window already substituted
+            if event_type == 'PICK_UP':
+                earliest_event_time = record.earliest_pickup
+                latest_event_time = record.latest_pickup
+            else:
+                earliest_event_time = record.earliest_dropoff
+                latest_event_time = record.latest_dropoff
 
             # Check Time Window and Calculate Idle Time for this specific event
             # Note: If latest_event_time is inf, this check will always pass.
             if current_time > latest_event_time:
-                print(f"Infeasible: Arrived/Ready at {target_port} for {event_type} of trade at {current_time}, latest allowed is {latest_event_time}")
+                print(f"Infeasible: Arrived/Ready at {records.ports[target_port]} for {event_type} of trade at {current_time}, latest allowed is {latest_event_time}")
                 is_feasible = False
                 break # Break inner loop
                 # current_time = latest_event_time # Set to latest event time to avoid infeasibility
@@ -208,27 +354,26 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
             operation_time = 0
             operation_cost = 0
             if event_type == 'PICK_UP':
-                if trade in trades_on_board:
-                     print(f"Warning: Attempting to pick up trade {trade.id} which is already on board at {target_port}.")
+                if record in trades_on_board:
+                     print(f"Warning: Attempting to pick up trade {trade.id} which is already on board at {records.ports[target_port]}.")
                 else:
-                     operation_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
+                     operation_time = vessel.get_loading_time(record.cargo_type, record.amount)
                      operation_cost = vessel.get_loading_consumption(operation_time)
-                     trade_specific_costs[trade] += operation_cost
+                     record_costs[record] += operation_cost
                      current_time += operation_time
-                     trades_on_board.add(trade)
+                     trades_on_board.add(record)
 
             elif event_type == 'DROP_OFF':
-                 if trade not in trades_on_board:
-                      print(f"Warning: Attempting to drop off trade {trade.origin_port} which is not on board at {target_port}.")
+                 if record not in trades_on_board:
+                      print(f"Warning: Attempting to drop off trade {trade.origin_port} which is not on board at {records.ports[target_port]}.")
                  else:
-                      operation_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
+                      operation_time = vessel.get_loading_time(record.cargo_type, record.amount)
                       operation_cost = vessel.get_unloading_consumption(operation_time)
-                      trade_specific_costs[trade] += operation_cost
+                      record_costs[record] += operation_cost
                       current_time += operation_time
-                      trades_on_board.remove(trade)
+                      trades_on_board.remove(record)
 
             total_operation_cost += operation_cost # Add to total operation cost
-            processed_indices.add(event_idx) # Mark this specific event as done
 
         if not is_feasible: # If infeasibility occurred while processing events at port
              break # Break outer loop
@@ -237,32 +382,32 @@ def simulate_schedule_cost_allocated_shared_arrival(vessel, vessel_schedule_copy
         if responsible_trades:
             idle_cost_share = vessel.get_idle_consumption(total_idle_time) / len(responsible_trades)
             for t_resp in responsible_trades:
-                trade_specific_costs[t_resp] += idle_cost_share
+                record_costs[t_resp] += idle_cost_share
 
         # Update the current port for the next iteration
         current_port = target_port
-        # Move the main index past the block we just processed
-        current_schedule_index = temp_idx # temp_idx is the index of the first event at the *next* port
 
     # --- 3. Calculate Final Idle Time & Total Cost ---
-    horizon_duration = 720
-    end_time = float(start_time) + horizon_duration
+    end_time = float(start_time) + horizon
     if is_feasible and current_time < end_time: # Only add final idle if feasible
         total_idle_time += end_time - current_time
 
     total_idle_cost = vessel.get_idle_consumption(total_idle_time)
+    for record, cost in record_costs.items():
+        trade_specific_costs[record.trade] = cost
 
     # Calculate total cost = travel + operation + idle
     total_cost = total_travel_cost + total_operation_cost + total_idle_cost
     if payments is not None:
-        for trade in vessel_trades:
+        for trade in vessel_schedule_copy.get_scheduled_trades():
             total_cost -= payments[trade]
 
     # Return results
     return total_cost, trade_specific_costs, total_idle_time, pick_up_times, drop_off_times
 
 
-def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarters=None, payments=None):
+def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarters=None, payments=None, records=None,
+                           horizon=PLANNING_HORIZON):
     """
     Input:
     vessel: vessel object
@@ -271,6 +416,8 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
     drop_off_time: a dictionary of the drop off time of the trades
     headquarters: the headquarters object
     payments: a dictionary of the payments of the trades
+    records: TradeRecords of the auction, shared by its simulations
+    horizon: hours after start_time until which the idle time of the vessel is charged
 
     Output:
     cost: the cost of the schedule
@@ -287,27 +434,21 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
     drop_off_time = {}
 
     if len(vessel_schedule_copy) == 0:
-        idle_time += 720
+        idle_time += horizon
 
-    vessel_schedule = vessel_schedule_copy.get_simple_schedule()
+    if records is None:
+        records = TradeRecords()
+    vessel_schedule = schedule_events(vessel_schedule_copy, records)
     vessel_trades = vessel_schedule_copy.get_scheduled_trades()
     for i in range(len(vessel_schedule)):
-        # handle None time_window
-        if vessel_schedule[i][1].time_window[0] is None:
-            earliest_pick_up_time = float('-inf')
-        if vessel_schedule[i][1].time_window[1] is None:
-            latest_pick_up_time = float('inf')
-        if vessel_schedule[i][1].time_window[2] is None:
-            earliest_drop_off_time = float('-inf')
-        if vessel_schedule[i][1].time_window[3] is None:
-            latest_drop_off_time = float('inf')
-        else:
-            earliest_pick_up_time = vessel_schedule[i][1].time_window[0]
-            latest_pick_up_time = vessel_schedule[i][1].time_window[1]
-            earliest_drop_off_time = vessel_schedule[i][1].time_window[2]
-            latest_drop_off_time = vessel_schedule[i][1].time_window[3]
+        # the record has the infinite bounds of a missing window already substituted
+        record = vessel_schedule[i][1]
+        earliest_pick_up_time = record.earliest_pickup
+        latest_pick_up_time = record.latest_pickup
+        earliest_drop_off_time = record.earliest_dropoff
+        latest_drop_off_time = record.latest_dropoff
         if i == 0:
-            first_travel_distance = headquarters.get_network_distance(vessel.location, vessel_schedule[i][1].origin_port)
+            first_travel_distance = records.distance(headquarters, records.port_index(vessel.location), record.origin)
             travel_time = vessel.get_travel_time(first_travel_distance)
             current_time += travel_time
             # check whether the vessel can reach on time
@@ -322,15 +463,16 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
             cost += ballast_cost
             # record the pick up time
             # pick_up_time = pick_up_time.get(vessel_schedule[i][1], current_time)
-            pick_up_time[vessel_schedule[i][1]] = current_time
+            pick_up_time[record.trade] = current_time
 
         else:
             if vessel_schedule[i-1][0] == 'PICK_UP':
                 loading_time = vessel.get_loading_time(vessel_schedule[i-1][1].cargo_type, vessel_schedule[i-1][1].amount)
                 if vessel_schedule[i][0] == 'DROP_OFF':
-                    travel_distance = headquarters.get_network_distance(
-                        vessel_schedule[i-1][1].origin_port,
-                        vessel_schedule[i][1].destination_port)
+                    travel_distance = records.distance(
+                        headquarters,
+                        vessel_schedule[i-1][1].origin,
+                        record.destination)
                     travel_time = vessel.get_travel_time(travel_distance)
                     current_time += travel_time + loading_time
 
@@ -339,19 +481,20 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
                     if current_time < earliest_drop_off_time:  # earlier than the earliest drop off time of next trade
                         idle_time += earliest_drop_off_time - current_time
                         current_time = earliest_drop_off_time # update the current time
-                    drop_off_time[vessel_schedule[i][1]] = current_time
+                    drop_off_time[record.trade] = current_time
                     #check if the last movement
                     if i == len(vessel_schedule) - 1:
                         current_time += loading_time # unloading time
                         loading_cost = vessel.get_unloading_consumption(loading_time) # unloading cost
                         cost += loading_cost
-                        end_time = start_time + 720
+                        end_time = start_time + horizon
                         idle_time += end_time - current_time
 
                 elif vessel_schedule[i][0] == 'PICK_UP':
-                    travel_distance = headquarters.get_network_distance(
-                        vessel_schedule[i-1][1].origin_port,
-                        vessel_schedule[i][1].origin_port)
+                    travel_distance = records.distance(
+                        headquarters,
+                        vessel_schedule[i-1][1].origin,
+                        record.origin)
                     travel_time = vessel.get_travel_time(travel_distance)
                     current_time += travel_time + loading_time
                     if current_time > latest_pick_up_time:  # later than the latest pick up time of next trade
@@ -359,7 +502,7 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
                     if current_time < earliest_pick_up_time:  # earlier than the earliest pick up time of next trade
                         idle_time += earliest_pick_up_time - current_time
                         current_time = earliest_pick_up_time # update the current time
-                    pick_up_time[vessel_schedule[i][1]] = current_time
+                    pick_up_time[record.trade] = current_time
 
                 travel_laden_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
                 loading_cost = vessel.get_loading_consumption(loading_time)
@@ -372,9 +515,10 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
                     vessel_schedule[i-1][1].amount)
                 current_hold_cargo -= vessel_schedule[i-1][1].amount # remove the cargo from the vessel
                 if vessel_schedule[i][0] == 'PICK_UP':
-                    travel_distance = headquarters.get_network_distance(
-                        vessel_schedule[i-1][1].destination_port,
-                        vessel_schedule[i][1].origin_port)
+                    travel_distance = records.distance(
+                        headquarters,
+                        vessel_schedule[i-1][1].destination,
+                        record.origin)
                     travel_time = vessel.get_travel_time(travel_distance)
                     current_time += travel_time + unloading_time
 
@@ -385,12 +529,13 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
                         idle_time += earliest_pick_up_time - current_time
                         current_time = earliest_pick_up_time # update the current time
 
-                    pick_up_time[vessel_schedule[i][1]] = current_time
+                    pick_up_time[record.trade] = current_time
 
                 elif vessel_schedule[i][0] == 'DROP_OFF':
-                    travel_distance = headquarters.get_network_distance(
-                        vessel_schedule[i-1][1].destination_port,
-                        vessel_schedule[i][1].destination_port)
+                    travel_distance = records.distance(
+                        headquarters,
+                        vessel_schedule[i-1][1].destination,
+                        record.destination)
 
                     travel_time = vessel.get_travel_time(travel_distance)
                     current_time += travel_time + unloading_time
@@ -402,13 +547,13 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
                         idle_time += earliest_drop_off_time - current_time
                         current_time = earliest_drop_off_time # update the current time
 
-                    drop_off_time[vessel_schedule[i][1]] = current_time
+                    drop_off_time[record.trade] = current_time
                     #check if the last movement
                     if i == len(vessel_schedule) - 1:
                         current_time += unloading_time
                         unloading_cost = vessel.get_unloading_consumption(unloading_time) # unloading cost
                         cost += unloading_cost
-                        end_time = start_time + 720
+                        end_time = start_time + horizon
                         idle_time += end_time - current_time
 
                 # check if the vessel is holding cargo
@@ -428,8 +573,10 @@ def simulate_schedule_cost(vessel, vessel_schedule_copy, start_time, headquarter
 
     return cost, idle_time, pick_up_time, drop_off_time
 
-def cal_efficiency(schedules, headquarters, start_time):
+def cal_efficiency(schedules, headquarters, start_time, records=None, horizon=PLANNING_HORIZON):
     # calculate the total efficiency of the schedules
+    if records is None:
+        records = TradeRecords()
     actual_costs = 0
     absolute_costs = 1e-6  # prevent division by zero
     efficiency = 0
@@ -439,12 +586,15 @@ def cal_efficiency(schedules, headquarters, start_time):
             vessel,
             schedule,
             start_time,
-            headquarters)
+            headquarters,
+            records=records,
+            horizon=horizon)
         for trade in schedule.get_scheduled_trades():
-            travel_distance = headquarters.get_network_distance(trade.origin_port, trade.destination_port)
+            record = records[trade]
+            travel_distance = records.distance(headquarters, record.origin, record.destination)
             travel_time = vessel.get_travel_time(travel_distance)
             travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
-            loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
+            loading_time = vessel.get_loading_time(record.cargo_type, record.amount)
             loading_cost = vessel.get_loading_consumption(loading_time)
             unloading_cost = vessel.get_unloading_consumption(loading_time)
             absolute_cost = travel_cost + loading_cost + unloading_cost
@@ -456,3 +606,220 @@ def cal_efficiency(schedules, headquarters, start_time):
 
     efficiency = actual_costs/absolute_costs
     return efficiency
+
+
+def insert_trades_by_event_times(vessel_schedule, trades, pickup_times, dropoff_times):
+    """
+    Insert trades into a copy of a vessel schedule following planned (e.g. solved) pick-up and drop-off times.
+    The new pick-up and drop-off events are merged into one time-ordered sequence after the committed tasks,
+    positions are looked up with bisect, and each trade is inserted in a single pass.
+    A trade whose planned position is rejected by verify_schedule is tried once more at the end of the schedule
+    and otherwise rejected, so the construction is bounded.
+
+    Input:
+    vessel_schedule: the current schedule of the vessel (not modified)
+    trades: the trades to insert
+    pickup_times: a dictionary of the planned pick up time of the trades
+    dropoff_times: a dictionary of the planned drop off time of the trades
+
+    Output:
+    new_schedule: the schedule with the inserted trades
+    inserted_trades: the trades that were inserted
+    rejected_trades: the trades that could not be inserted
+    """
+    new_schedule = vessel_schedule.copy()
+    number_committed_tasks = len(new_schedule.get_simple_schedule())
+    event_times = []  # sorted times of the inserted events, mirrors their order after the committed tasks
+    inserted_trades = []
+    rejected_trades = []
+    for trade in sorted(trades, key=lambda x: (pickup_times[x], dropoff_times[x])):
+        pickup_time = pickup_times[trade]
+        dropoff_time = dropoff_times[trade]
+        pickup_index = bisect_right(event_times, pickup_time)
+        dropoff_index = bisect_right(event_times, dropoff_time)
+        candidate_schedule = new_schedule.copy()
+        try:
+            candidate_schedule.add_transportation(
+                trade,
+                number_committed_tasks + pickup_index + 1,
+                number_committed_tasks + dropoff_index + 1)
+            is_valid = candidate_schedule.verify_schedule()
+        except ValueError:
+            is_valid = False
+        if not is_valid:
+            # fallback: append the trade after all other tasks, the events then stay at the end
+            candidate_schedule = new_schedule.copy()
+            last_insertion_point = candidate_schedule.get_insertion_points()[-1]
+            try:
+                candidate_schedule.add_transportation(trade, last_insertion_point, last_insertion_point)
+                is_valid = candidate_schedule.verify_schedule()
+            except ValueError:
+                is_valid = False
+            if not is_valid:
+                rejected_trades.append(trade)
+                continue
+            pickup_time = dropoff_time = float('inf')
+        insort(event_times, pickup_time)
+        insort(event_times, dropoff_time)
+        new_schedule = candidate_schedule
+        inserted_trades.append(trade)
+    return new_schedule, inserted_trades, rejected_trades
+
+
+def split_rolling_horizon(trades, start_time, window):
+    """
+    Rolling-horizon split of an auction: the near trades can be picked up within `window` hours of start_time
+    (a trade without an earliest pick-up counts as near), the far trades only later.
+    Output: (near trades, far trades), both in the order of trades
+    """
+    near_trades = []
+    far_trades = []
+    for trade in trades:
+        earliest_pickup = trade.time_window[0] if trade.time_window else None
+        if earliest_pickup is None or earliest_pickup <= start_time + window:
+            near_trades.append(trade)
+        else:
+            far_trades.append(trade)
+    return near_trades, far_trades
+
+
+def reachability_index(trades, fleets, headquarters, start_time, records=None):
+    """
+    Candidate vessels of every trade, computed once per auction so the insertion searches skip vessels that cannot
+    serve a trade in any schedule: vessels without a hold for the cargo type and amount, and vessels that cannot reach
+    the origin by the latest pick-up or the destination by the latest drop-off even sailing straight from their
+    current location at start_time. Shortest network distances obey the triangle inequality, so no detour through
+    the scheduled stops arrives earlier and no feasible insertion is pruned.
+
+    Input:
+    trades: list of trades
+    fleets: list of vessels
+    start_time: the current time of the auction
+    records: TradeRecords whose cached distances are used for the laden distances
+    Output: {trade: list of candidate vessels in fleet order}
+    """
+    index = {}
+    distances = {}
+    for trade in trades:
+        earliest_pickup, latest_pickup, _, latest_dropoff = trade.time_window
+        if records is None:
+            laden_distance = headquarters.get_network_distance(trade.origin_port, trade.destination_port)
+        else:
+            record = records[trade]
+            laden_distance = records.distance(headquarters, record.origin, record.destination)
+        candidates = []
+        for vessel in fleets:
+            if not any(hold.cargo_type == trade.cargo_type and hold.capacity >= trade.amount
+                       for hold in vessel.capacities_and_loading_rates):
+                continue
+            key = (vessel, trade.origin_port)
+            if key not in distances:
+                distances[key] = headquarters.get_network_distance(vessel.location, trade.origin_port)
+            arrival = start_time + vessel.get_travel_time(distances[key])
+            if latest_pickup is not None and arrival > latest_pickup:
+                continue
+            if earliest_pickup is not None:
+                arrival = max(arrival, earliest_pickup)
+            delivery = (arrival + vessel.get_loading_time(trade.cargo_type, trade.amount)
+                        + vessel.get_travel_time(laden_distance))
+            if latest_dropoff is not None and delivery > latest_dropoff:
+                continue
+            candidates.append(vessel)
+        index[trade] = candidates
+    return index
+
+
+def insertion_candidates(schedule, trade, vessel, headquarters, detour_hours=None, nearest_stops=None, records=None):
+    """
+    The (pick-up, drop-off) insertion indices of add_transportation worth trying for a trade in a vessel schedule.
+    A position is skipped when the time windows rule it out: a stop before the new event that cannot start before
+    the event's latest time, or a stop after it that must be done before the event's earliest time.
+    Optionally a position is also skipped when it is far from the trade: the new event adds more than detour_hours
+    of sailing between its neighbouring stops and neither neighbour is one of the nearest_stops stops (or the
+    vessel's location) closest to the trade's port. Ports the network does not connect are infinitely far.
+    Appending at the end of the schedule is always kept.
+
+    Input:
+    schedule: the vessel schedule the trade is inserted into
+    detour_hours, nearest_stops: None disables the spatial filter
+    records: TradeRecords of the auction, ports are compared as its indices
+    Output: list of (pick-up index, drop-off index), in the order of the full enumeration of the insertion points
+    """
+    if records is None:
+        records = TradeRecords()
+    stops = []
+    for event, trade_in_schedule in schedule.get_simple_schedule():
+        record = records[trade_in_schedule]
+        stops.append((record.origin, (record.earliest_pickup, record.latest_pickup)) if event == 'PICK_UP'
+                     else (record.destination, (record.earliest_dropoff, record.latest_dropoff)))
+    insertion_points = list(schedule.get_insertion_points())
+    # latest earliest-time of the stops up to each position, earliest latest-time of the stops from each position
+    earliest_before = [float('-inf')]
+    for _, (earliest, _) in stops:
+        earliest_before.append(max(earliest_before[-1], earliest))
+    latest_after = [float('inf')]
+    for _, (_, latest) in reversed(stops):
+        latest_after.append(min(latest_after[-1], latest))
+    latest_after.reverse()
+
+    def fits_time(index, window, previous_earliest):
+        earliest, latest = window
+        if max(earliest_before[index], previous_earliest) > latest:
+            return False
+        return not (index < len(stops) and latest_after[index] < earliest)
+
+    spatial = detour_hours is not None or nearest_stops is not None
+    location = records.port_index(vessel.location)
+
+    def distance(port_one, port_two):
+        # None for ports the network does not connect
+        distance = records.distance(headquarters, port_one, port_two)
+        return float('inf') if distance is None else distance
+
+    def close(port):
+        if nearest_stops is None:
+            return set()
+        ports = [location] + [stop_port for stop_port, _ in stops]
+        return set(sorted(ports, key=lambda stop_port: distance(stop_port, port))[:nearest_stops])
+
+    record = records[trade]
+    close_to_origin = close(record.origin)
+    close_to_destination = close(record.destination)
+
+    def fits_space(previous_port, next_port, port, close_ports):
+        if not spatial or next_port is None:
+            return True
+        if previous_port in close_ports or next_port in close_ports:
+            return True
+        if detour_hours is None:
+            return False
+        via_port = distance(previous_port, port) + distance(port, next_port)
+        if via_port == float('inf'):
+            return False
+        detour = via_port - distance(previous_port, next_port)
+        return vessel.get_travel_time(detour) <= detour_hours
+
+    def stop_port(index):
+        if index < 0:
+            return location
+        return stops[index][0] if index < len(stops) else None
+
+    pickup_window = (record.earliest_pickup, record.latest_pickup)
+    dropoff_window = (record.earliest_dropoff, record.latest_dropoff)
+    pickup_earliest = record.earliest_pickup
+    candidates = []
+    for i in insertion_points:
+        # the pick-up becomes task i, between the stops i - 1 and i of the current schedule (1-based)
+        if not fits_time(i - 1, pickup_window, float('-inf')):
+            continue
+        if not fits_space(stop_port(i - 2), stop_port(i - 1), record.origin, close_to_origin):
+            continue
+        for j in range(i, insertion_points[-1] + 1):
+            # the drop-off follows the stop j - 1 (the pick-up itself when j == i) and precedes the stop j
+            if not fits_time(j - 1, dropoff_window, pickup_earliest):
+                continue
+            previous_port = record.origin if j == i else stop_port(j - 2)
+            if not fits_space(previous_port, stop_port(j - 1), record.destination, close_to_destination):
+                continue
+            candidates.append((i, j))
+    return candidates